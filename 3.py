@@ -1,164 +1,27 @@
+import asyncio
+
 from openai import OpenAI
+from prompts import registry
+from receptionist import FEW_SHOT, MODEL, OPTIONS, Receptionist, user_turn
+
 client = OpenAI()
 
-response = client.responses.create(
-  model="gpt-5",
-  input=[
-    {
-      "role": "developer",
-      "content": [
-        {
-          "type": "input_text",
-          "text": "Seja a recepcionista de um grupo do telegram.\nSeja educada, prestativa, ofereca ajuda, fale pouco e seja concisa. voce tera acesso a algumas ferramentas pra auxiliar a repsonder perguntas, fazer pesquisas e os usuarios vao te pedir pra usar se quiserem."
-        }
-      ]
-    },
-    {
-      "role": "user",
-      "content": [
-        {
-          "type": "input_text",
-          "text": "oi, assistente! acabei de chegar no grupo, como funciona?"
-        }
-      ]
-    },
-    {
-      "role": "assistant",
-      "content": [
-        {
-          "type": "output_text",
-          "text": "E ai {{nome}}, tudo bem? Boa, fico feliz que tenha entrado no grupo! esse grupo tem a funcao de ser um ambiente de socializacao com os membros, e parceiros, e tem o objetivo de um ajudar o outro. sem vender nada com promessa milagrosa, nem vender curso meia boca. Fique e veja, cada um que descobre alguma coisa, ajuda os outros daqui, e assim vai indo... Bem vindo!"
-        }
-      ]
-    },
-    {
-      "role": "user",
-      "content": [
-        {
-          "type": "input_text",
-          "text": "oi rose entrei no grupo agora.. ta meio vazio, ne?"
-        }
-      ]
-    },
-    {
-      "role": "assistant",
-      "content": [
-        {
-          "type": "output_text",
-          "text": "Tudo certo e você? Bem-vindo(a)!  \nComo funciona, rapidinho:\n- Apresente-se: nome, cidade e o que busca.\n- Leia a mensagem fixada (regras e links úteis).\n- Para pedir ajuda: diga objetivo, o que já tentou e, se puder, mande print.\n- Sem spam, promessas milagrosas ou vendas sem autorização.\n\nQuer que eu te envie as regras rápidas e os tópicos mais úteis?"
-        }
-      ]
-    },
-    {
-      "role": "user",
-      "content": [
-        {
-          "type": "input_text",
-          "text": "e ai, td bem"
-        }
-      ]
-    },
-    {
-      "role": "assistant",
-      "content": [
-        {
-          "type": "output_text",
-          "text": "Tudo certo e você? Bem-vindo(a)!  \nComo funciona, rapidinho:\n- Apresente-se: nome, cidade e o que busca.\n- Leia a mensagem fixada (regras e links úteis).\n- Para pedir ajuda: diga objetivo, o que já tentou e, se puder, mande print.\n- Sem spam, promessas milagrosas ou vendas sem autorização.\n\nQuer que eu te envie as regras rápidas e os tópicos mais úteis?"
-        }
-      ]
-    },
-    {
-      "role": "user",
-      "content": [
-        {
-          "type": "input_text",
-          "text": "oi rose entrei no grupo agora.. ta meio vazio, ne?"
-        }
-      ]
-    },
-    {
-      "type": "reasoning",
-      "id": "rs_689afbbada4c819491007be3ee3ef84e07819f377b1369b1",
-      "summary": [],
-      "encrypted_content": "gAAAAABomvvColLVmQI1WRIbIZT9DG7dCW3yi1C3KandYIT-ThAgqXCX7l6hsOWSTZPiWGtw-NdgQykBlOIbufS-E8_nxfCzl69GQpY06iBmlrhHoE8_5vfcOYKpZPM8DaqBkBVG6G18fZWvzJYDX7y1Kad9c3ELbxDZA7NQxEz8w8HlCZBePe2W6svk6KHO5_r0V5OhazJQQOqVcrLMuFOtdRJx_ILSmvUH7mmo3lZhQ-7FT8esZ20GCt6F3AxGMPphGBuaCUIgIX0JUAng-emrO9ywL0YwxQms5W3nGVzS1wNsO6-yQZ8M4CuWBBtRgjNBO-mrcmSxCup_GvHypPxxlXPoxP901snU0STPqIiJ-BNt_DbKZSXpQKA_2Caf08aYJkOY2VXSGS0jGpf9ryN9g9kKy897krk-DAao_KWxX9GJOOUvzrmgjP9rI8LCP0PUe7DrnQwKObUMB6BEjlOWzwd4hW5CFJEwWhOlFdsRZONfRBRwOwIHOKHqsqMXrRuxakrUAGaHDKIBuDl4DCKZLPm7sv5lFkR2Uxlr5sPlXyjbqfde6_1S6VAQf579QUKq1HfFy9siNGvtlsdsBP2TfdRTMimquRHzgVMvSL3tIEQsVndfVVGgxR_DlJNIZyHJhNhkJy4-JgALYCW_Z88t1mG0cGMDQdso21cmBRbH5eKfpepz38aKwlOAzejIGTzTFHiPieOAMjJl7Tq9G7fZ3Ag4nA_NxHrPz9-V4upCVKSwGcbpBFwWKS1Y6p-9e-WYK4KrZOEBdUKGV2a_GxGfugCuaS8CxmjB0yUgBbaOHoeofxQO_I6ipuwaCkIBvuE02HkTZVQCa3cou8IkID_JAo1Bpe8Ami84YdZXYlBC4VDgr4x8kcZ0pBvAOEdUxQhU9qhBM4OcwYM3ioFuTMRvtJrVLil0GVu25WgGW2w-vHwaVkJePXtO5of68PewL5yItvmjyk_HSlM4kOBeQaP7ar-FgBxlcT_4ohmytcJUGxM2tNBEfwZ7jvclcqE8R-dxFqewLt5PPTfXK1QA4MO6oU1KsCSyp36_I3BZOA9pk4XBLPA3ojtvfR2PQdt8l65gLVK_KDGd0AWax8Ju0KUPL2fyFkrQVkqE4XMVSxFBYJuVbnyKt2XbLiB_YLZWIjPSqvnMKwkIb_LqjWfluHy9MGWADf-LT8mKuOpicG1rRcLOzoHrhLE_qiQianGE5M7tejJAYolX8CgNBxSCucmi0RGGF7Ex6Nsr_t5UhR1SFEI50CQxQKhc_sw7dSxkuWr0m3y1yhsBVOkNmNmp7vKZBMUESevUNVerDg7PUICe2WddpkjH-FrAapC5WatAuV3qKnHbciZXSCsPeAPNYIWaMwp0ck4DESRG9_oFScuNdPYB0_7zdmC9iExLF3t4Bog1XzyPh-wE6KaVJdYbChQp-XgnZ3F4bn9Y78GN-t5J0nfhM_uOJtPCGNws8GoNhNMf3LsNvoO0Yk_HoIQuEvDig7225L__tKMSKeOfnn2XQW9-RKDQHLPSRPQZu1pqQHbK9bNI8_Q-2fYoiFMhL2mSBQwuuzFYLm-AiSKteqbpBF9Fdo2QHpb7U2wdPS5vDrDtf6LKYqYLtYbx2YozuyFALcEgBzyUNGCJVHw6mnrQijU_jF7tD4la90t6lBS1dpoveRpOw43ja1Evs03-EBtsN_N_aEgZVq-bgLDa1HHUUQEzVnWL6jLvo3IeUqf56MQKkbntI3xyVJ8AZNRaik7w3exvXyhG4HQY5y3_HgwveOSPytKvzQhLXanQul7gDiZGIKoLEaDq-TCLVLNn3mZq73yACJQryu6WZWHW8fKGaehVUC_via4LhJ40mz2vvN4tl-_B-mzk98vad8VVtB-ag8GYYgpQtyt9rnbwnLnTa702N8XZigg_NHxs4FIBwqu9uJwQjvEMwHzMJbK_LFim1dMnJ_LE-8zI8Z4PLdrkl1z07AHsM_4op_NmTX8vfn_lRIEfAedRoCtv98svSd1Xzx_6Vx3yIdm-kBK12zCfJfoXd_T_-xp9wNqgV5Ph0Cnj57JVkeNfsmiuEl5aEvXEqVe0mfagcwjp4miiEvNlPVpmptvVsfI_dWCKIFf-cpjx07NvCdJLnf7ElCEUpfdleH2ORrTXzI84toh4g-b4Et6lNra-PiHry5lV_tOhKduqiJz9cxHPJB69eF_iZ0vA4d75x6vv8e2sdVax45etCLeUPnbYYJzAuNclx5_Kq17VKW2P0_hPxSVBOldOIaSOAp4rW8Hp0uAEQW6PlffD1MNCdtKVRYk_qJyXBRLEw4RQat0W6lJh7UzsmD9q0vg2mgPs6gu4L-MAWLgjgMNLWSav2iXXVHNZXU0H3uXp_AoFiPbqVoDrotzbYc-c9JBnhCUTYD7WwVKKJ7BSfoVoSbElgVjzkdW-8Ysg9Nd95vaanZUyEzff_qgrhxX0AdOeD5VRIOmP9K5Q1eqvlH_EmQxxkTXYL5SD5nuxUeBZQMv7H7xoPT-haCOuJFicgWuhQK6IS0muScr-Cv0EDzok2VMIE6tCYf8lDI1YGy4UaJLwV5U4BP6oV9264dMz4rNMp-sjnuL9B9wBzn_MlGpdORYkqQQ2oFQNt6Gg-pA4HFoyUhqbCNikAB-SwJscJcKoitD4lC6dJPSTvYyE09VYMeeDiC3O9q4jd03f6CuLRBGEug7J81N2u3Wgr-xl1Tpqacc9cWNG2kjK_P9bepRUZ_8Op3-KErQ8c7LUooKXo6Ui07vWFrNp2aO-fEygaUCJAsZBSTgtY_QVEP9cp0WGWAzH1qyIK_nbO3eAR4TVX8vfh4MDekTx64qz2D43GwuOFjpD1OYVLgZzUrDpNF0CO2sBo1-QsTsOAdD2yPCzmsiRWhz3CdfHPjmf8MXDjMYA-qMbPNf1QypDFnIQ87nh3B2CxFvdE4mT16vInMWTKW6_mIhqMn_BVEkLUhKe-DW1wYX5R1Q51Mt4GbaqvqiYz-fancsI0tBTxnkquZEoRjaoUqlHhU_Lu06vezfl51QefcUghtujudEuow-pU4ZulvQ-wq1iilYiEam1vPpdnDgeR5-Bpej7LXAdXmfcfpczIFCSWpjdJ_ESo1VS1pN_SuUhvlpCHaQ1KVt9KNRmQV-2vf-_JblXSV6vencGWvR2KzhH5AUtF_y2MlhzKvhBnbBSy6ZiDetfZvZaSBrGqXGH_hhQVq4aAfj-Vey-3FACzHdkguky9VTLV-jVpLzbdZ96cLrFtPA="
-    },
-    {
-      "id": "msg_689afbc149088194acca0b8bf5d1689507819f377b1369b1",
-      "role": "assistant",
-      "content": [
-        {
-          "type": "output_text",
-          "text": "Oi! É normal parecer vazio às vezes — a turma costuma aparecer mais à noite (19h–22h BRT).  \nSe apresenta rapidinho (nome, cidade, objetivo) e já manda sua dúvida com contexto/print que o pessoal vem ajudar.\n\nQuer que eu te envie as regras rápidas e os tópicos fixados? Qual tema você precisa agora?"
-        }
-      ]
-    }
-  ],
-  text={
-    "format": {
-      "type": "text"
-    },
-    "verbosity": "medium"
-  },
-  reasoning={
-    "effort": "medium"
-  },
-  tools=[
-    {
-      "type": "function",
-      "name": "get_stock_price",
-      "description": "Get the current stock price",
-      "parameters": {
-        "type": "object",
-        "properties": {
-          "symbol": {
-            "type": "string",
-            "description": "The stock symbol"
-          }
-        },
-        "additionalProperties": False,
-        "required": [
-          "symbol"
-        ]
-      },
-      "strict": True
-    },
-    {
-      "type": "function",
-      "name": "get_weather",
-      "description": "Determine weather in my location",
-      "parameters": {
-        "type": "object",
-        "properties": {
-          "location": {
-            "type": "string",
-            "description": "The city and state e.g. San Francisco, CA"
-          },
-          "unit": {
-            "type": "string",
-            "enum": [
-              "c",
-              "f"
-            ]
-          }
-        },
-        "additionalProperties": False,
-        "required": [
-          "location",
-          "unit"
-        ]
-      },
-      "strict": True
-    },
-    {
-      "type": "web_search_preview",
-      "user_location": {
-        "type": "approximate",
-        "country": "BR",
-        "region": "DF",
-        "city": "Brasilia"
-      },
-      "search_context_size": "medium"
-    }
-  ],
-  store=True
-)
\ No newline at end of file
+def respond(user_text):
+  # One-shot request that replays the whole few-shot conversation; see Receptionist.reply for multi-turn chats.
+  return client.responses.create(
+    model=MODEL,
+    input=registry.messages(FEW_SHOT, user_turn(user_text)),
+    **OPTIONS
+  )
+
+async def main():
+  receptionist = Receptionist()
+  while True:
+    user_input = await asyncio.to_thread(input, "> ")
+    if user_input.lower() == 'exit':
+      break
+    response = await receptionist.reply("console", user_input)
+    print(response.output_text)
+
+if __name__ == "__main__":
+  asyncio.run(main())
@@ -2,21 +2,23 @@
 
 > pip install azure-ai-inference
 """
+import argparse
 import os
+import time
 from azure.ai.inference import ChatCompletionsClient
 from azure.ai.inference.models import AssistantMessage, SystemMessage, UserMessage
 from azure.ai.inference.models import ImageContentItem, ImageUrl, TextContentItem
-from azure.core.credentials import AzureKeyCredential
+from clients import get_client
+from streaming import print_complete, print_stream
 
-def chat(user_query):
+def chat(user_query, client = None, stream = True):
     # To authenticate with the model you will need to generate a personal access token (PAT) in your GitHub settings.
-  # Create your PAT token by following instructions here: https://docs.github.com/en/authentication/keeping-your-account-and-data-secure/managing-your-personal-access-tokens
-    client = ChatCompletionsClient(
-        endpoint = "https://models.inference.ai.azure.com",
-        credential = AzureKeyCredential(os.environ["GITHUB_TOKEN"]),
-        api_version = "2024-08-01-preview",
-    )
+    # Create your PAT token by following instructions here: https://docs.github.com/en/authentication/keeping-your-account-and-data-secure/managing-your-personal-access-tokens
+    # The client is created once per process and reused across questions, see clients.py.
+    if client is None:
+        client = get_client()
 
+    started = time.perf_counter()
     response = client.complete(
         messages = [
             SystemMessage(content = "Generate one educational question for students"),
@@ -26,14 +28,21 @@ def chat(user_query):
         ],
         model = "gpt-4o",
         response_format = "text",
+        stream = stream,
         max_tokens = 4096,
         temperature = 1,
         top_p = 1,
     )
 
-    print(response.choices[0].message.content)
+    if stream:
+        return print_stream(response, started)
+    return print_complete(response, started)
 
 def main():
+    parser = argparse.ArgumentParser(description = "Generate educational questions from the console.")
+    parser.add_argument("--no-stream", action = "store_true", help = "wait for the whole answer instead of streaming it")
+    args = parser.parse_args()
+
     print("Enter your query (type 'exit' to quit):")
     
     while True:
@@ -43,7 +52,7 @@ def main():
             break
             
         try:
-            chat(user_input)
+            chat(user_input, stream = not args.no_stream)
         except Exception as e:
             print(f"\nError: {str(e)}")
 
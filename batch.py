@@ -0,0 +1,151 @@
+"""Generate a question bank from a list of topics
+
+> pip install azure-ai-inference aiohttp
+> python batch.py topics.txt -o questions.jsonl
+
+Reads one topic per line from a file (or stdin with `-`) and sends each one to the
+model with the `final_app.py` system prompt (`final_prompt.aitk.txt`). Requests run
+concurrently on the async client, limited by `--concurrency` and by a token bucket
+sized to the GitHub Models quota. 429 and 5xx responses, connection errors and
+requests slower than `--timeout` are retried with jittered exponential backoff;
+a topic that still fails is written with its error. Results are written as JSONL in input order as soon as each one is ready.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+from azure.ai.inference.aio import ChatCompletionsClient
+from azure.ai.inference.models import TextContentItem, UserMessage
+from azure.core.credentials import AzureKeyCredential
+from azure.core.exceptions import AzureError, HttpResponseError
+
+from clients import API_VERSION, ENDPOINT
+from final_app import MODEL, PROMPT_FILE
+from prompts import registry
+
+# GitHub Models rate limits for high tier models such as gpt-4o (free plan):
+# 10 requests per minute and 2 concurrent requests.
+# https://docs.github.com/en/github-models/prototyping-with-ai-models#rate-limits
+REQUESTS_PER_MINUTE = 10
+CONCURRENCY = 2
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, with bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def retry_delay(error, attempt, base = 1.0, cap = 60.0):
+    """Seconds to wait before retrying: the server's Retry-After if any, else full-jitter backoff."""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+async def generate(client, topic, bucket, semaphore, retries, timeout = None):
+    async with semaphore:
+        attempt = 0
+        while True:
+            await bucket.acquire()
+            started = time.perf_counter()
+            try:
+                response = await asyncio.wait_for(client.complete(
+                    messages = registry.messages(PROMPT_FILE, UserMessage(content = [TextContentItem(text = topic)])),
+                    model = MODEL,
+                    response_format = "text",
+                ), timeout)
+            except (AzureError, asyncio.TimeoutError) as e:
+                # Connection resets and timeouts are retried like 429/5xx; anything left fails this topic only.
+                http_error = isinstance(e, HttpResponseError)
+                if (http_error and e.status_code not in RETRY_STATUS) or attempt >= retries:
+                    return {"topic": topic, "error": str(e) or type(e).__name__, "attempts": attempt + 1}, None
+                delay = retry_delay(e, attempt)
+                reason = f"HTTP {e.status_code}" if http_error else type(e).__name__
+                print(f"{topic!r}: {reason}, retrying in {delay:.1f} s", file = sys.stderr)
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            latency = time.perf_counter() - started
+            return {"topic": topic, "output": response.choices[0].message.content, "attempts": attempt + 1}, latency
+
+async def run(topics, out, endpoint, token, rpm, concurrency, retries, timeout = None):
+    bucket = TokenBucket(rpm / 60, capacity = concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    # The SDK's own retry policy is disabled so backoff is only handled here.
+    async with ChatCompletionsClient(
+        endpoint = endpoint,
+        credential = AzureKeyCredential(token),
+        api_version = API_VERSION,
+        retry_total = 0,
+    ) as client:
+        tasks = [asyncio.create_task(generate(client, topic, bucket, semaphore, retries, timeout)) for topic in topics]
+        # Awaiting in input order keeps the output ordered while later topics keep running.
+        for task in tasks:
+            record, latency = await task
+            if latency is not None:
+                latencies.append(latency)
+            out.write(json.dumps(record, ensure_ascii = False) + "\n")
+            out.flush()
+    return latencies
+
+def report(latencies, total, elapsed):
+    # Only answered topics count as throughput; failed ones are in the output with their error.
+    print(f"\n{len(latencies)}/{total} topics in {elapsed:.1f} s ({len(latencies) / elapsed * 60:.1f} topics/min)", file = sys.stderr)
+    if latencies:
+        latencies = sorted(latencies)
+        p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+        print(f"latency p50 {statistics.median(latencies):.2f} s, p95 {p95:.2f} s", file = sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description = "Generate one question per topic with bounded concurrency.")
+    parser.add_argument("topics", help = "file with one topic per line, or - for stdin")
+    parser.add_argument("-o", "--output", default = "-", help = "JSONL output file (default: stdout)")
+    parser.add_argument("--endpoint", default = ENDPOINT)
+    parser.add_argument("--rpm", type = float, default = REQUESTS_PER_MINUTE, help = "requests per minute")
+    parser.add_argument("--concurrency", type = int, default = CONCURRENCY)
+    parser.add_argument("--retries", type = int, default = 5)
+    parser.add_argument("--timeout", type = float, default = 120.0, help = "seconds before a request is abandoned and retried")
+    args = parser.parse_args()
+
+    source = sys.stdin if args.topics == "-" else open(args.topics, encoding = "utf-8")
+    with source:
+        topics = [line.strip() for line in source if line.strip()]
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding = "utf-8")
+    started = time.perf_counter()
+    try:
+        latencies = asyncio.run(run(topics, out, args.endpoint, os.environ["GITHUB_TOKEN"], args.rpm, args.concurrency, args.retries, args.timeout))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    report(latencies, len(topics), time.perf_counter() - started)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Benchmark chat() with and without the pooled client
+
+> python bench_client_pool.py -n 50 --delay 0.02
+
+Runs N sequential and N concurrent `final_app.chat()` calls against a local stub
+endpoint, once building a fresh ChatCompletionsClient per call (the old
+behaviour) and once through `clients.get_client()`, and prints per-call latency.
+"""
+import argparse
+import contextlib
+import io
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from azure.ai.inference import ChatCompletionsClient
+from azure.core.credentials import AzureKeyCredential
+
+import final_app
+from clients import API_VERSION, close_clients, get_client
+from stub_server import serve
+
+TOKEN = "stub-token"
+
+def fresh_client(endpoint):
+    return ChatCompletionsClient(
+        endpoint = endpoint,
+        credential = AzureKeyCredential(TOKEN),
+        api_version = API_VERSION,
+    )
+
+def pooled_client(endpoint):
+    return get_client(endpoint, TOKEN, pool_maxsize = 16)
+
+def timed_chat(make_client, endpoint):
+    start = time.perf_counter()
+    final_app.chat("Newton's laws", client = make_client(endpoint), stream = False)
+    return (time.perf_counter() - start) * 1000
+
+def quiet():
+    # Swap stdout/stderr once per scenario, not per call: redirecting inside worker threads races.
+    stack = contextlib.ExitStack()
+    stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+    stack.enter_context(contextlib.redirect_stderr(io.StringIO()))
+    return stack
+
+def report(label, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    print(f"{label:<24} mean {statistics.mean(latencies):7.2f} ms   p50 {statistics.median(latencies):7.2f} ms   p95 {p95:7.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark pooled vs per-call chat clients.")
+    parser.add_argument("-n", type = int, default = 50, help = "calls per scenario")
+    parser.add_argument("--concurrency", type = int, default = 8)
+    parser.add_argument("--delay", type = float, default = 0.0, help = "simulated server latency in seconds")
+    args = parser.parse_args()
+
+    server, endpoint = serve(delay = args.delay)
+    try:
+        for name, make_client in (("fresh", fresh_client), ("pooled", pooled_client)):
+            with quiet():
+                timed_chat(make_client, endpoint)  # warm-up
+                sequential = [timed_chat(make_client, endpoint) for _ in range(args.n)]
+                with ThreadPoolExecutor(args.concurrency) as pool:
+                    concurrent = list(pool.map(lambda _: timed_chat(make_client, endpoint), range(args.n)))
+            report(f"{name} sequential", sequential)
+            report(f"{name} concurrent x{args.concurrency}", concurrent)
+    finally:
+        close_clients()
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
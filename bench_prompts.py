@@ -0,0 +1,43 @@
+"""Benchmark per-request message construction
+
+> python bench_prompts.py -n 100000
+
+Compares building the request messages inline on every call, as `final_app.py`
+and `3.py` used to, against appending the user turn to the messages compiled once
+by `prompts.registry`.
+"""
+import argparse
+import timeit
+
+from azure.ai.inference.models import SystemMessage, TextContentItem, UserMessage
+
+from final_app import PROMPT_FILE
+from prompts import registry
+
+FEW_SHOT = "receptionist.fewshot.json"
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark message construction per request.")
+    parser.add_argument("-n", type = int, default = 100000, help = "requests to build per case")
+    args = parser.parse_args()
+
+    system_prompt = registry.text(PROMPT_FILE)
+    # Evaluating the literal each time is what the inline `input=[...]` in 3.py did.
+    few_shot_literal = compile(repr(list(registry.get(FEW_SHOT))), "<3.py input>", "eval")
+    user_turn = {"role": "user", "content": [{"type": "input_text", "text": "oi"}]}
+
+    cases = {
+        "final_app inline": lambda: [
+            SystemMessage(content = system_prompt),
+            UserMessage(content = [TextContentItem(text = "Newton's laws")]),
+        ],
+        "final_app registry": lambda: registry.messages(PROMPT_FILE, UserMessage(content = [TextContentItem(text = "Newton's laws")])),
+        "3.py inline": lambda: eval(few_shot_literal) + [user_turn],
+        "3.py registry": lambda: registry.messages(FEW_SHOT, user_turn),
+    }
+    for name, build in cases.items():
+        seconds = timeit.timeit(build, number = args.n)
+        print(f"{name:<20} {seconds / args.n * 1e6:8.2f} us/request")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Compare full replay with response chaining for the receptionist
+
+> python bench_receptionist.py --users 20 --turns 5
+> python bench_receptionist.py --live   # against the OpenAI API, needs OPENAI_API_KEY
+
+Runs the same scripted conversations for many concurrent users through
+`Receptionist` twice: replaying the few-shot and history on every turn, and
+chaining turns with `previous_response_id`. Prints, per turn, the input items and
+bytes sent and the input tokens reported by the server.
+
+The local stub has no stored context, so its token count only reflects what was
+sent. The API also bills the chained context as input tokens, partly as cached
+tokens, so use `--live` to see billed savings.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import openai
+
+from receptionist import Receptionist
+from stub_server import serve
+
+SCRIPT = ["oi, acabei de entrar no grupo", "como funciona?", "tem regras?", "qual o horario mais movimentado?", "valeu!"]
+
+async def run(client, chain, users, turns):
+    receptionist = Receptionist(client, chain = chain)
+
+    async def converse(user):
+        for i in range(turns):
+            await receptionist.reply(user, SCRIPT[i % len(SCRIPT)])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(converse(f"user{u}") for u in range(users)))
+    return receptionist.turns, time.perf_counter() - started
+
+def mean(turns, field):
+    values = [t[field] for t in turns if t[field] is not None]
+    return statistics.mean(values) if values else float("nan")
+
+async def main():
+    parser = argparse.ArgumentParser(description = "Measure input sent per turn with and without response chaining.")
+    parser.add_argument("--users", type = int, default = 20)
+    parser.add_argument("--turns", type = int, default = 5)
+    parser.add_argument("--live", action = "store_true", help = "use the OpenAI API instead of the local stub")
+    args = parser.parse_args()
+
+    server = None
+    if args.live:
+        client = openai.AsyncOpenAI()
+    else:
+        server, endpoint = serve(delay = 0.05)
+        client = openai.AsyncOpenAI(base_url = endpoint, api_key = "stub")
+    try:
+        for label, chain in (("full replay", False), ("chained", True)):
+            turns, elapsed = await run(client, chain, args.users, args.turns)
+            later = [t for t in turns if t["mode"] == "chained"] or turns
+            print(f"{label:<12} {len(turns)} requests in {elapsed:.2f} s   "
+                  f"items/turn {mean(turns, 'items'):5.1f}   KB/turn {mean(turns, 'bytes') / 1024:6.2f}   "
+                  f"input tokens/turn {mean(turns, 'input_tokens'):7.1f} (after first turn {mean(later, 'input_tokens'):7.1f}, "
+                  f"cached {mean(turns, 'cached_tokens'):.1f})")
+    finally:
+        await client.close()
+        if server is not None:
+            server.shutdown()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,53 @@
+"""Route chat requests across local stub backends
+
+> python bench_router.py -n 200 --hedge-after 0.15
+
+Starts three stub `/v1/chat/completions` servers, a fast but flaky one, a steady
+one and a slow one, and sends N requests through `providers.Router`. Prints how
+many requests each backend served, the latency percentiles and the final
+latency/error EWMA per backend.
+"""
+import argparse
+import collections
+import statistics
+import time
+
+from providers import LocalChatProvider, Router
+from stub_server import serve
+
+MESSAGES = [{"role": "system", "content": "Generate one educational question."}, {"role": "user", "content": "Newton's laws"}]
+
+def main():
+    parser = argparse.ArgumentParser(description = "Exercise latency-based routing against stub backends.")
+    parser.add_argument("-n", type = int, default = 200)
+    parser.add_argument("--hedge-after", type = float, help = "seconds before a hedged request goes to the runner-up")
+    args = parser.parse_args()
+
+    backends = {"flaky": dict(delay = 0.02, error_rate = 0.3), "steady": dict(delay = 0.05), "slow": dict(delay = 0.2)}
+    servers, providers = [], []
+    for name, options in backends.items():
+        server, endpoint = serve(**options)
+        servers.append(server)
+        providers.append(LocalChatProvider(endpoint, name = name))
+    router = Router(providers, hedge_after = args.hedge_after)
+
+    served = collections.Counter()
+    latencies = []
+    try:
+        for _ in range(args.n):
+            start = time.perf_counter()
+            _, name = router.complete(MESSAGES)
+            latencies.append((time.perf_counter() - start) * 1000)
+            served[name] += 1
+    finally:
+        for server in servers:
+            server.shutdown()
+
+    latencies.sort()
+    print(f"served: {dict(served)}")
+    print(f"latency p50 {statistics.median(latencies):.1f} ms, p95 {latencies[int(len(latencies) * 0.95) - 1]:.1f} ms")
+    for name, stats in router.stats().items():
+        print(f"  {name:<7} ewma latency {stats['latency'] * 1000 if stats['latency'] else float('nan'):6.1f} ms   error rate {stats['error_rate']:.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Benchmark the near-duplicate cache at 10k and 100k entries
+
+> python bench_semantic_cache.py --sizes 10000 100000
+
+Fills a `SemanticCache` with synthetic topics and reports index build time,
+mean lookup latency and the memory held by the vector matrix. Then, for a few
+thresholds, the share of reworded topics that are served their own cached answer
+and the false hit rate: the share of new topics, from the same subjects and words
+as the cached ones, that are served some other topic's answer.
+"""
+import argparse
+import random
+import time
+
+from semantic_cache import SemanticCache
+
+SUBJECTS = ["physics", "chemistry", "biology", "history", "algebra", "geometry", "literature", "geography", "astronomy", "economics"]
+WORDS = ["laws", "motion", "cells", "energy", "war", "revolution", "equations", "triangles", "poetry", "rivers",
+         "planets", "markets", "atoms", "genes", "empires", "fractions", "novels", "climate", "stars", "trade"]
+
+def topics(n, seed = 0):
+    rng = random.Random(seed)
+    return [f"{rng.choice(SUBJECTS)} {' '.join(rng.sample(WORDS, 3))} {i}" for i in range(n)]
+
+# Ways a user could reword "physics of laws and motion"
+REWORDINGS = [
+    lambda subject, a, b: f"The {subject.title()} of {a} and {b}?",
+    lambda subject, a, b: f"{subject} of {b} and {a}",
+    lambda subject, a, b: f"intro to {subject} of {a} and {b}",
+    lambda subject, a, b: f"{a} and {b} in {subject}",
+]
+
+def hit_rates(threshold, cached = 300, queries = 200, seed = 0):
+    """(share of reworded topics served their own answer, share of new topics served any answer)"""
+    rng = random.Random(seed)
+    combos = list(dict.fromkeys((rng.choice(SUBJECTS), *rng.sample(WORDS, 2)) for _ in range(20 * (cached + queries))))
+    stored, new = combos[:cached], combos[cached:cached + queries]
+    cache = SemanticCache(threshold = threshold, capacity = cached)
+    cache.add_many([f"{s} of {a} and {b}" for s, a, b in stored], stored)
+    reworded = [(rng.choice(REWORDINGS)(*combo), combo) for combo in rng.choices(stored, k = queries)]
+    hits = sum(cache.lookup(text)[0] == combo for text, combo in reworded)
+    false_hits = sum(cache.lookup(f"{s} of {a} and {b}")[0] is not None for s, a, b in new)
+    return hits / len(reworded), false_hits / len(new)
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark SemanticCache build and lookup.")
+    parser.add_argument("--sizes", type = int, nargs = "+", default = [10000, 100000])
+    parser.add_argument("--lookups", type = int, default = 200)
+    parser.add_argument("--thresholds", type = float, nargs = "+", default = [0.7, 0.8, 0.85, 0.9])
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        texts = topics(size)
+        cache = SemanticCache(capacity = size)
+        start = time.perf_counter()
+        cache.add_many(texts, ["answer"] * size)
+        build = time.perf_counter() - start
+
+        queries = topics(args.lookups, seed = 1)
+        start = time.perf_counter()
+        for query in queries:
+            cache.lookup(query)
+        lookup = (time.perf_counter() - start) / len(queries)
+        print(f"{size:>7} entries   build {build:6.2f} s   lookup {lookup * 1000:6.2f} ms   matrix {cache.nbytes() / 2**20:7.1f} MiB")
+
+    for threshold in args.thresholds:
+        reworded, false_hits = hit_rates(threshold)
+        print(f"threshold {threshold:.2f}   reworded topics hit {reworded:4.0%}   false hits {false_hits:4.0%}")
+
+if __name__ == "__main__":
+    main()
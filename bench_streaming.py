@@ -0,0 +1,47 @@
+"""Benchmark streaming vs non-streaming chat()
+
+> python bench_streaming.py -n 10 --delay 0.3 --token-delay 0.02
+
+Runs `final_app.chat()` N times in each mode against a local stub endpoint and
+prints the mean time to first token, which is what the user waits on, and the
+mean end-to-end time per turn.
+"""
+import argparse
+import contextlib
+import io
+import statistics
+import time
+
+import final_app
+from clients import close_clients, get_client
+from stub_server import serve
+
+def run(client, stream, n):
+    ttfts, totals = [], []
+    for _ in range(n):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            stats = final_app.chat("Newton's laws", client = client, stream = stream)
+        totals.append(time.perf_counter() - start)
+        ttfts.append(stats["ttft"])
+    return statistics.mean(ttfts) * 1000, statistics.mean(totals) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark streaming vs non-streaming chat().")
+    parser.add_argument("-n", type = int, default = 10, help = "turns per mode")
+    parser.add_argument("--delay", type = float, default = 0.3, help = "simulated prefill latency in seconds")
+    parser.add_argument("--token-delay", type = float, default = 0.02, help = "simulated seconds per generated word")
+    args = parser.parse_args()
+
+    server, endpoint = serve(delay = args.delay, token_delay = args.token_delay)
+    client = get_client(endpoint, "stub-token")
+    try:
+        for label, stream in (("stream", True), ("no-stream", False)):
+            ttft, total = run(client, stream, args.n)
+            print(f"{label:<10} time to first token {ttft:8.1f} ms   turn {total:8.1f} ms")
+    finally:
+        close_clients()
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
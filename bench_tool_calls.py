@@ -0,0 +1,41 @@
+"""Benchmark serial vs parallel tool execution for multi-tool turns
+
+> python bench_tool_calls.py --turns 5
+
+Each turn asks for three function calls (two weather lookups and one stock
+quote) with the simulated latency of the stand-in tools. Every turn uses new
+arguments so the TTL cache does not hide the difference; a final repeated turn
+shows the cached case.
+"""
+import argparse
+import asyncio
+import time
+from types import SimpleNamespace
+
+from tool_calls import ToolExecutor
+
+def turn_calls(i):
+    return [
+        SimpleNamespace(call_id = f"call_{i}_1", name = "get_weather", arguments = f'{{"location": "Brasilia {i}", "unit": "c"}}'),
+        SimpleNamespace(call_id = f"call_{i}_2", name = "get_weather", arguments = f'{{"location": "Recife {i}", "unit": "c"}}'),
+        SimpleNamespace(call_id = f"call_{i}_3", name = "get_stock_price", arguments = f'{{"symbol": "PETR{i}"}}'),
+    ]
+
+async def timed(executor, calls, parallel):
+    start = time.perf_counter()
+    await executor.run(calls, parallel = parallel)
+    return (time.perf_counter() - start) * 1000
+
+async def main():
+    parser = argparse.ArgumentParser(description = "Compare serial and parallel tool execution.")
+    parser.add_argument("--turns", type = int, default = 5)
+    args = parser.parse_args()
+
+    for label, parallel in (("serial", False), ("parallel", True)):
+        executor = ToolExecutor()
+        latencies = [await timed(executor, turn_calls(i), parallel) for i in range(args.turns)]
+        cached = await timed(executor, turn_calls(0), parallel)
+        print(f"{label:<9} {sum(latencies) / len(latencies):7.1f} ms/turn   cached turn {cached:5.2f} ms")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,101 @@
+"""Response cache for chat()
+
+Answers are keyed by a SHA-256 hash of everything that shapes them: system
+prompt, user text, model, temperature, top_p and max_tokens. Lookups go to an
+in-memory LRU first and then, if a path is given, to a SQLite file that survives
+restarts. Both tiers expire entries after `ttl` seconds and evict the least
+recently used ones beyond their size cap.
+
+With temperature > 0 (or unset, which means the service default of 1) the model
+samples, so the same question can get different answers. Those requests are not
+cached unless `cache_sampled` is set.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+class ResponseCache:
+    def __init__(self, max_entries = 1024, ttl = 24 * 3600, path = None, max_disk_entries = 100_000, cache_sampled = False):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self.cache_sampled = cache_sampled
+        self.counters = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "disk_evictions": 0, "skipped": 0}
+        self._memory = OrderedDict()  # key -> (created, value)
+        self._lock = threading.Lock()
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread = False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT, created REAL, used REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_used ON responses (used)")
+            self._db.commit()
+
+    def key(self, system_prompt, user_text, model, temperature = None, top_p = None, max_tokens = None):
+        """Return the cache key for a request, or None if it should not be cached."""
+        sampled = temperature is None or temperature > 0
+        if sampled and not self.cache_sampled:
+            with self._lock:
+                self.counters["skipped"] += 1
+            return None
+        payload = json.dumps([system_prompt, user_text, model, temperature, top_p, max_tokens], ensure_ascii = False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        if key is None:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[0] < self.ttl:
+                    self._memory.move_to_end(key)
+                    self.counters["hits"] += 1
+                    return entry[1]
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None and now - row[1] < self.ttl:
+                    self._db.execute("UPDATE responses SET used = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    self._remember(key, row[1], row[0])
+                    self.counters["disk_hits"] += 1
+                    return row[0]
+
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, key, value):
+        if key is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, value, now, now))
+                self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+                evicted = self._db.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_disk_entries,),
+                ).rowcount
+                self._db.commit()
+                self.counters["disk_evictions"] += max(evicted, 0)
+
+    def _remember(self, key, created, value):
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last = False)
+            self.counters["evictions"] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, entries = len(self._memory))
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
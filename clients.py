@@ -0,0 +1,69 @@
+"""Shared ChatCompletionsClient registry
+
+> pip install azure-ai-inference requests
+
+`app.py` and `final_app.py` used to build a new client on every question, paying
+for connection setup and credential wiring each time. `get_client()` creates one
+client per (endpoint, credential, api_version) and keeps it for the life of the
+process, backed by a bounded keep-alive connection pool.
+"""
+import atexit
+import hashlib
+import os
+import threading
+
+import requests
+from azure.ai.inference import ChatCompletionsClient
+from azure.core.credentials import AzureKeyCredential
+from azure.core.pipeline.transport import RequestsTransport
+
+ENDPOINT = "https://models.inference.ai.azure.com"
+API_VERSION = "2024-08-01-preview"
+
+# Upper bound on open keep-alive connections per client. Extra concurrent
+# callers wait for a free connection instead of opening new sockets.
+POOL_MAXSIZE = 10
+
+_clients = {}
+_lock = threading.Lock()
+
+def _session(pool_maxsize):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections = 1, pool_maxsize = pool_maxsize, pool_block = True)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def get_client(endpoint = ENDPOINT, token = None, api_version = API_VERSION, pool_maxsize = POOL_MAXSIZE):
+    """Return the process-wide client for this endpoint, credential and api_version.
+
+    The token defaults to the `GITHUB_TOKEN` environment variable. Only a hash of
+    it is used in the registry key.
+    """
+    if token is None:
+        token = os.environ["GITHUB_TOKEN"]
+    key = (endpoint, hashlib.sha256(token.encode()).hexdigest(), api_version)
+
+    with _lock:
+        entry = _clients.get(key)
+        if entry is None:
+            session = _session(pool_maxsize)
+            client = ChatCompletionsClient(
+                endpoint = endpoint,
+                credential = AzureKeyCredential(token),
+                api_version = api_version,
+                transport = RequestsTransport(session = session, session_owner = False),
+            )
+            entry = _clients[key] = (client, session)
+    return entry[0]
+
+def close_clients():
+    """Close every pooled client and its sockets. Registered with `atexit`."""
+    with _lock:
+        entries = list(_clients.values())
+        _clients.clear()
+    for client, session in entries:
+        client.close()
+        session.close()
+
+atexit.register(close_clients)
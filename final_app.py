@@ -2,33 +2,101 @@
 
 > pip install azure-ai-inference
 """
+import argparse
 import os
+import sys
+import time
 from azure.ai.inference import ChatCompletionsClient
 from azure.ai.inference.models import AssistantMessage, SystemMessage, UserMessage
 from azure.ai.inference.models import ImageContentItem, ImageUrl, TextContentItem
-from azure.core.credentials import AzureKeyCredential
+from cache import ResponseCache
+from clients import get_client
+from prompts import registry
+from streaming import print_complete, print_stream
+from usage import tracker
 
-def chat(user_query):
+MODEL = "gpt-4o"
+PROMPT_FILE = "final_prompt.aitk.txt"
+
+def chat(user_query, client = None, stream = True, cache = None, temperature = None, semantic = None, router = None):
     # To authenticate with the model you will need to generate a personal access token (PAT) in your GitHub settings.
     # Create your PAT token by following instructions here: https://docs.github.com/en/authentication/keeping-your-account-and-data-secure/managing-your-personal-access-tokens
-    client = ChatCompletionsClient(
-        endpoint = "https://models.inference.ai.azure.com",
-        credential = AzureKeyCredential(os.environ["GITHUB_TOKEN"]),
-        api_version = "2024-08-01-preview",
-    )
+    # The client is created once per process and reused across questions, see clients.py.
+    if client is None and router is None:
+        client = get_client()
+
+    # Answers are cached per backend, so one model's answer is never served as another's. With a
+    # router any backend's cached answer will do, fastest first.
+    backends = [b.provider.name for b in router.ranked()] if router is not None else [MODEL]
+    keys = {name: cache.key(registry.text(PROMPT_FILE), user_query, name, temperature) for name in backends} if cache is not None else {}
+    for backend, key in keys.items():
+        cached = cache.get(key) if key is not None else None
+        if cached is not None:
+            print(cached)
+            if router is not None:
+                print(f"[{backend}, cached]", file = sys.stderr)
+            return {"content": cached, "cached": True, "backend": backend}
+    if semantic is not None:
+        cached, similarity = semantic.lookup(user_query)
+        if cached is not None:
+            print(cached)
+            return {"content": cached, "cached": True, "similarity": similarity}
+
+    if router is not None:
+        # Provider-neutral messages; the router picks the backend, see providers.py.
+        messages = [{"role": "system", "content": registry.text(PROMPT_FILE)}, {"role": "user", "content": user_query}]
+        params = {"temperature": temperature} if temperature is not None else {}
+        content, backend = router.complete(messages, **params)
+        print(content)
+        print(f"[{backend}]", file = sys.stderr)
+        stats = {"content": content, "backend": backend}
+    else:
+        stats = _complete(client, user_query, stream, temperature)
 
+    key = keys.get(stats.get("backend", MODEL))
+    if key is not None:
+        cache.put(key, stats["content"])
+    if semantic is not None:
+        semantic.add(user_query, stats["content"])
+    return stats
+
+def _complete(client, user_query, stream, temperature):
+    started = time.perf_counter()
     response = client.complete(
-        messages = [
-            SystemMessage(content = "Generate a question on a specified topic and provide a question, answer, and a series of increasingly specific hints to guide students toward arriving at the correct answer.\n\n# Guidelines\n\n- Ensure the question is clear and suitable for the intended level of the students.\n- Provide hints gradually, starting with broad clues and narrowing down to specific ones.\n- Confirm that the answer aligns perfectly with the question and hints.\n- Only one question should be generated per request.\n\n# Steps\n\n1. **Formulate the Question**: Develop a unique, engaging question for the specified topic. Format the question clearly.\n2. **Provide the Answer**: Identify the correct answer to the question.\n3. **Create Hints**: \n   - Hint 1: A broad or general clue related to the topic.\n   - Hint 2: A more specific clue designed to guide the student closer to the answer.\n   - Hint 3: A precise clue that makes the answer more apparent without directly stating it.\n\n# Output Format\n\nThe output should use the following format:\n- **Topic**: [specify if provided or inferred from the question] \n- **Question**: [Write the question here]\n- **Answer**: [Provide the correct answer]\n- **Hints**:\n  - Hint 1: [Provide the broadest, most general hint related to the topic]\n  - Hint 2: [Offer a more specific clue to help narrow down the answer]\n  - Hint 3: [Provide a highly specific and guiding clue to lead to the correct answer]\n\n# Examples\n\n### Example 1:\n- **Topic**: Astronomy\n- **Question**: What is the largest planet in the Solar System?  \n- **Answer**: Jupiter  \n- **Hints**:  \n  1. This planet is known for its massive size and its many moons.  \n  2. It is a gas giant located between Mars and Saturn.  \n  3. It has a famous Great Red Spot, a giant storm visible from Earth.\n\n### Example 2:\n- **Topic**: Mathematics\n- **Question:** What is the smallest prime number?\n- **Answer:** 2\n- **Hints:**\n  1. It is the first even number in the list of prime numbers.\n  2. A prime number can only be divided by 1 and itself, and this number is less than 3.\n  3. It is the only even number that is also a prime.\n\n### Example 3:\n- **Topic**: Chemical Thermodynamics  \n- **Question**: A reaction has a \\( \\Delta G^\\circ = -45.0 \\, \\text{kJ/mol} \\) at \\( 298 \\, \\text{K} \\). What is the equilibrium constant (\\( K \\)) for this reaction? \\( R = 8.314 \\, \\text{J/(mol·K)} \\).  \n- **Answer**: Approximately \\( 3.9 \\times 10^7 \\).  \n- **Hints**:\n  1. Recall the relationship between the standard Gibbs free energy change (\\( \\Delta G^\\circ \\)) and the equilibrium constant (\\( K \\)): \\( \\Delta G^\\circ = -RT \\ln K \\).\n  2. Substitute the values: \\( R = 8.314 \\, \\text{J/(mol·K)} \\), \\( T = 298 \\, \\text{K} \\), \\( \\Delta G^\\circ = -45.0 \\times 10^3 \\, \\text{J/mol} \\). Rearrange the formula to solve for \\( K \\).\n  3. Solve: First, calculate \\( \\ln K = -\\frac{\\Delta G^\\circ}{RT} \\). Then take the exponential of the result using \\( K = e^{\\ln K} \\). After calculations, you should find \\( K \\approx 3.9 \\times 10^7 \\).\n\n# Notes\n- Ensure that the hints do not directly reveal the answer but rather guide the student logically toward it.\n- Questions should vary across disciplines like biology, physics, chemistry, science, literature, history, and mathematics unless otherwise specified."),
-            UserMessage(content = [TextContentItem(text = user_query)]),
-        ],
-        model = "gpt-4o",
+        messages = registry.messages(PROMPT_FILE, UserMessage(content = [TextContentItem(text = user_query)])),
+        model = MODEL,
         response_format = "text",
+        stream = stream,
+        temperature = temperature,
+        # Ask for the usage block in the last streamed chunk too, see usage.py.
+        model_extras = {"stream_options": {"include_usage": True}} if stream else None,
     )
 
-    print(response.choices[0].message.content)
+    return print_stream(response, started) if stream else print_complete(response, started)
 
 def main():
+    parser = argparse.ArgumentParser(description = "Generate educational questions from the console.")
+    parser.add_argument("--no-stream", action = "store_true", help = "wait for the whole answer instead of streaming it")
+    parser.add_argument("--temperature", type = float, help = "sampling temperature; answers are only cached at 0 unless --cache-sampled is set")
+    parser.add_argument("--cache-db", help = "SQLite file that keeps cached answers across runs")
+    parser.add_argument("--cache-sampled", action = "store_true", help = "also cache answers generated with temperature > 0")
+    parser.add_argument("--semantic-threshold", type = float, help = "serve a cached answer for topics at least this similar (0-1, e.g. 0.85) to a past one")
+    parser.add_argument("--route", action = "store_true", help = "route between every backend configured in the environment, see providers.py")
+    parser.add_argument("--hedge-after", type = float, help = "with --route, also ask the next backend after this many seconds")
+    parser.add_argument("--usage-summary", action = "store_true", help = "print token and latency histograms on exit, see usage.py")
+    args = parser.parse_args()
+    if args.usage_summary:
+        tracker.report = True
+    cache = ResponseCache(path = args.cache_db, cache_sampled = args.cache_sampled)
+    semantic = None
+    if args.semantic_threshold is not None:
+        from semantic_cache import SemanticCache
+        semantic = SemanticCache(threshold = args.semantic_threshold)
+    router = None
+    if args.route:
+        from providers import default_router
+        router = default_router(hedge_after = args.hedge_after)
+
     print("Enter your query (type 'exit' to quit):")
     
     while True:
@@ -38,9 +106,14 @@ def main():
             break
             
         try:
-            chat(user_input)
+            chat(user_input, stream = not args.no_stream, cache = cache, temperature = args.temperature, semantic = semantic, router = router)
         except Exception as e:
             print(f"\nError: {str(e)}")
 
+    print(f"Cache: {cache.stats()}", file = sys.stderr)
+    if semantic is not None:
+        print(f"Semantic cache: {semantic.stats()}", file = sys.stderr)
+    cache.close()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,135 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import collections
+import os
+import threading
+import time
+
+from peft import PeftModel
+from peft.tuners.tuners_utils import BaseTunerLayer
+
+BASE = "base"
+
+def discover_adapters(directory):
+    """
+    Finds every LoRA adapter (a folder containing adapter_config.json) below a directory,
+    such as the checkpoints written during fine-tuning.
+    Args:
+    directory (str): The folder to search, e.g. "../models".
+    Returns:
+    dict: Adapter name (the folder path relative to directory, with "/" separators) to folder path.
+    """
+    adapters = {}
+    if not os.path.isdir(directory):
+        return adapters
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        if "adapter_config.json" in files:
+            adapters[os.path.relpath(root, directory).replace(os.sep, "/")] = root
+    return adapters
+
+def _module_name(name):
+    # PEFT keeps adapters in torch ModuleDicts, whose keys cannot contain "."
+    return name.replace(".", "_")
+
+class AdapterRegistry:
+    """
+    Serves several LoRA adapters on top of one resident base model.
+
+    Adapters are loaded the first time they are requested and at most max_loaded stay in memory;
+    the least recently used one is deleted to make room. Switching between loaded adapters only
+    changes which LoRA weights the layers use, so it costs microseconds instead of a model reload.
+    "base" runs the base model with all adapter layers disabled. activate() is not thread-safe with
+    respect to forward passes, so it must be called from the thread that runs the model.
+    """
+    def __init__(self, model, adapters, max_loaded=4, default=None):
+        self.model = model
+        self.paths = dict(adapters)
+        self.max_loaded = max_loaded
+        self.default = default if default is not None else (next(iter(self.paths), BASE))
+        self.active = None
+        self.peft_model = None
+        self._layers = []
+        self.swaps = 0
+        self.swap_seconds = 0.
+        self.load_seconds = {}
+        self.adapter_bytes = {}
+        self._loaded = collections.OrderedDict()  # name -> None, in LRU order
+        self._lock = threading.Lock()
+
+    def names(self):
+        return [BASE] + list(self.paths)
+
+    def resolve(self, name):
+        """
+        Maps the model field of a request to an adapter name.
+        Raises:
+        KeyError: If no adapter has that name.
+        """
+        if not name:
+            return self.default
+        if name == BASE or name in self.paths:
+            return name
+        raise KeyError(name)
+
+    def activate(self, name):
+        """Makes the given adapter (or "base") the one used by the model's forward passes."""
+        name = name or self.default
+        if name == self.active:
+            return
+        started = time.perf_counter()
+        if name == BASE:
+            self._switch(None)
+        else:
+            if name not in self._loaded:
+                self._load(name)
+            self._loaded.move_to_end(name)
+            self._switch(_module_name(name))
+        self.active = name
+        self.swaps += 1
+        self.swap_seconds += time.perf_counter() - started
+
+    def _switch(self, module_name):
+        # Sets the flags PEFT's set_adapter() and disable_adapter_layers() set on every LoRA layer,
+        # without walking the whole module tree and updating requires_grad, which inference never needs.
+        for layer in self._layers:
+            layer._disable_adapters = module_name is None
+            if module_name is not None:
+                layer._active_adapter = module_name
+        if module_name is not None:
+            self.peft_model.base_model.active_adapter = module_name
+
+    def _load(self, name):
+        started = time.perf_counter()
+        if self.peft_model is None:
+            # Wrapping injects the LoRA layers into the base model's modules in place
+            self.peft_model = PeftModel.from_pretrained(self.model, self.paths[name],
+                                                        adapter_name=_module_name(name))
+        else:
+            self.peft_model.load_adapter(self.paths[name], adapter_name=_module_name(name))
+        self.peft_model.eval()
+        with self._lock:
+            self.load_seconds[name] = time.perf_counter() - started
+            module = f".{_module_name(name)}."
+            self.adapter_bytes[name] = sum(p.numel() * p.element_size()
+                                           for n, p in self.peft_model.named_parameters() if module in n)
+            self._loaded[name] = None
+        while len(self._loaded) > self.max_loaded:
+            evicted, _ = self._loaded.popitem(last=False)
+            self.peft_model.base_model.delete_adapter(_module_name(evicted))
+            with self._lock:
+                self.adapter_bytes.pop(evicted, None)
+        self._layers = [m for m in self.peft_model.modules() if isinstance(m, BaseTunerLayer)]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": self.active,
+                "loaded": list(self._loaded),
+                "available": self.names(),
+                "swaps": self.swaps,
+                "activate_ms_mean": 1000 * self.swap_seconds / self.swaps if self.swaps else 0.,
+                "load_ms": {name: 1000 * s for name, s in self.load_seconds.items()},
+                "adapter_mib": {name: b / 2 ** 20 for name, b in self.adapter_bytes.items()},
+            }
@@ -0,0 +1,160 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import asyncio
+import collections
+import contextlib
+import math
+import threading
+import time
+
+class Overloaded(Exception):
+    """Raised when a request cannot be admitted. retry_after is a hint in whole seconds."""
+    def __init__(self, retry_after, reason="queue full"):
+        super().__init__(f"Server overloaded ({reason}), retry after {retry_after} s")
+        self.retry_after = retry_after
+        self.reason = reason
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+class AdmissionController:
+    """
+    Bounds the number of generations running at once and the number of requests waiting for one.
+    A request that finds the queue full, or waits longer than queue_timeout, is rejected at once
+    with an Overloaded error instead of piling up behind the model.
+    """
+    def __init__(self, max_in_flight=8, max_queued=32, queue_timeout=30., alpha=0.2):
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.alpha = alpha
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._service_time = None  # EWMA seconds per generation
+        self._waits = collections.deque(maxlen=1000)
+        self._cond = threading.Condition()
+        self._async_waiters = collections.deque()  # (loop, future) of acquire_async() calls waiting for a slot
+
+    def retry_after(self):
+        """Seconds until a slot is likely to be free, from the queue length and mean generation time."""
+        service_time = self._service_time or 1.
+        return max(1, math.ceil(service_time * (self.queued + 1) / self.max_in_flight))
+
+    def acquire(self):
+        """
+        Waits for a generation slot.
+        Returns:
+        float: The time the slot was granted, to pass back to release().
+        Raises:
+        Overloaded: If the queue is full or the wait exceeds queue_timeout.
+        """
+        started = time.perf_counter()
+        with self._cond:
+            if self.in_flight >= self.max_in_flight:
+                if self.queued >= self.max_queued:
+                    self.rejected += 1
+                    raise Overloaded(self.retry_after())
+                self.queued += 1
+                try:
+                    ready = self._cond.wait_for(lambda: self.in_flight < self.max_in_flight, self.queue_timeout)
+                finally:
+                    self.queued -= 1
+                if not ready:
+                    self.timed_out += 1
+                    raise Overloaded(self.retry_after(), "queue timeout")
+            return self._grant(started)
+
+    async def acquire_async(self):
+        """
+        acquire() for the event loop: waiting for a slot awaits a future that release() resolves,
+        instead of blocking a thread.
+        Returns:
+        float: The time the slot was granted, to pass back to release().
+        Raises:
+        Overloaded: If the queue is full or the wait exceeds queue_timeout.
+        """
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        queued = False
+        try:
+            while True:
+                with self._cond:
+                    if self.in_flight < self.max_in_flight:
+                        return self._grant(started)
+                    if not queued:
+                        if self.queued >= self.max_queued:
+                            self.rejected += 1
+                            raise Overloaded(self.retry_after())
+                        self.queued += 1
+                        queued = True
+                    woken = loop.create_future()
+                    self._async_waiters.append((loop, woken))
+                try:
+                    await asyncio.wait_for(woken, max(0., started + self.queue_timeout - time.perf_counter()))
+                except BaseException as e:
+                    # Timed out or cancelled (the client went away): pass on a wake-up this waiter may have taken
+                    with self._cond:
+                        self._notify()
+                        if isinstance(e, asyncio.TimeoutError):
+                            self.timed_out += 1
+                            raise Overloaded(self.retry_after(), "queue timeout")
+                    raise
+        finally:
+            if queued:
+                with self._cond:
+                    self.queued -= 1
+
+    def _grant(self, started):
+        self.in_flight += 1
+        self.admitted += 1
+        granted = time.perf_counter()
+        self._waits.append(granted - started)
+        return granted
+
+    def _notify(self):
+        # Wakes one waiter of each kind; the one that does not get the slot goes back to waiting
+        self._cond.notify()
+        while self._async_waiters:
+            loop, woken = self._async_waiters.popleft()
+            if not woken.done() and not loop.is_closed():
+                loop.call_soon_threadsafe(_wake, woken)
+                break
+
+    def release(self, granted):
+        with self._cond:
+            self.in_flight -= 1
+            elapsed = time.perf_counter() - granted
+            if self._service_time is None:
+                self._service_time = elapsed
+            else:
+                self._service_time += self.alpha * (elapsed - self._service_time)
+            self._notify()
+
+    @contextlib.contextmanager
+    def slot(self):
+        granted = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(granted)
+
+    def metrics(self):
+        with self._cond:
+            waits = sorted(self._waits)
+            return {
+                "in_flight": self.in_flight,
+                "queue_depth": self.queued,
+                "max_in_flight": self.max_in_flight,
+                "max_queued": self.max_queued,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "wait_ms_mean": 1000 * sum(waits) / len(waits) if waits else 0.,
+                "wait_ms_p95": 1000 * waits[min(len(waits) - 1, int(0.95 * len(waits)))] if waits else 0.,
+                "generation_s_mean": self._service_time,
+            }
@@ -0,0 +1,219 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import argparse
+import itertools
+import json
+import os
+import time
+
+import torch
+from transformers import AutoModelForCausalLM
+
+from prepare import model_context_length, prepare_prompts
+from utils import (check_adapter_path, find_merged_model, load_merged_model, load_model, load_peft_model,
+                   load_tokenizer, get_device)
+
+def read_rows(path):
+    """Yields (line index, row) for every non-empty line of a JSONL file, without reading it all at once."""
+    with open(path, encoding="utf-8") as f:
+        for index, line in enumerate(f):
+            if line.strip():
+                yield index, json.loads(line)
+
+def read_checkpoint(path):
+    """
+    Finds the input lines an earlier, interrupted run already wrote to the output file.
+    A last line cut short by the interruption is removed, so appending continues on a clean line.
+    Args:
+    path (str): The output JSONL file.
+    Returns:
+    set: The line indices of the input rows already done.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "rb+") as f:
+        end = 0
+        for line in f:
+            try:
+                done.add(json.loads(line)["index"])
+            except (ValueError, KeyError):
+                break
+            end += len(line)
+        f.truncate(end)
+    return done
+
+def make_batches(prepared, batch_size):
+    """
+    Groups prompts of similar length, so that a batch is padded to little more than its shortest prompt.
+    Args:
+    prepared (list): PreparedPrompt objects.
+    batch_size (int): Prompts per batch.
+    Returns:
+    list: Lists of positions in prepared, longest prompts first, so a batch too large for memory fails at once.
+    """
+    order = sorted(range(len(prepared)), key=lambda i: prepared[i].prompt_tokens, reverse=True)
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+@torch.no_grad()
+def generate_batch(model, tokenizer, device, prompts, temperature=0., top_p=1.):
+    """
+    Generates the answers of several prompts with one padded generate() call.
+    Args:
+    model (AutoModelForCausalLM): The model to generate with.
+    tokenizer (AutoTokenizer): Its tokenizer.
+    device (torch.device): The device of the model.
+    prompts (list): PreparedPrompt objects.
+    temperature (float): Sampling temperature; 0 decodes greedily.
+    top_p (float): Nucleus sampling probability.
+    Returns:
+    tuple: The generated token ids of each prompt (up to and including the end of sequence token),
+    and the number of padding tokens the batch was given.
+    """
+    longest = max(p.prompt_tokens for p in prompts)
+    pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    # Padding goes on the left, so every prompt ends where generation starts
+    input_ids = torch.tensor([[pad_token_id] * (longest - p.prompt_tokens) + p.input_ids for p in prompts], device=device)
+    attention_mask = torch.tensor([[0] * (longest - p.prompt_tokens) + [1] * p.prompt_tokens for p in prompts],
+                                  device=device)
+    sampling = dict(do_sample=True, temperature=temperature, top_p=top_p) if temperature > 0 else dict(do_sample=False)
+    output = model.generate(input_ids=input_ids, attention_mask=attention_mask,
+                            max_new_tokens=min(p.max_new_tokens for p in prompts),
+                            pad_token_id=pad_token_id, eos_token_id=tokenizer.eos_token_id, **sampling)
+
+    generated = []
+    for row in output[:, longest:].tolist():
+        if tokenizer.eos_token_id in row:
+            row = row[:row.index(tokenizer.eos_token_id) + 1]
+        generated.append(row)
+    return generated, sum(longest - p.prompt_tokens for p in prompts)
+
+def run_batch_inference(model, tokenizer, device, input_path, output_path, template, field="phrase", batch_size=16,
+                        max_new_tokens=32, window=1024, temperature=0., top_p=1., sort=True, resume=True):
+    """
+    Generates an answer for every row of a JSONL file and appends one JSON line per row to the output,
+    flushed after every batch. The output doubles as the checkpoint: a rerun skips the rows already in it.
+    Args:
+    model (AutoModelForCausalLM): The model to generate with.
+    tokenizer (AutoTokenizer): Its tokenizer.
+    device (torch.device): The device of the model.
+    input_path (str): JSONL file of rows such as {"phrase": ..., "tone": ...}.
+    output_path (str): JSONL file to append results to. Each line is the input row with its line
+    "index", the generated "output" text and token counts, in the order the batches finish.
+    template (str): Prompt template with a {} field for the text.
+    field (str): The row field filled into the template.
+    batch_size (int): Prompts per generate() call.
+    max_new_tokens (int): Maximum number of new tokens per row.
+    window (int): Rows read ahead and sorted by length together; a larger window pads less.
+    temperature (float): Sampling temperature; 0 decodes greedily.
+    top_p (float): Nucleus sampling probability.
+    sort (bool): Sort the rows of each window by length before batching.
+    resume (bool): Skip the rows already in the output file instead of starting over.
+    Returns:
+    dict: Rows done, rows skipped, tokens, padding and throughput of this run.
+    """
+    done = read_checkpoint(output_path) if resume else set()
+    rows = ((index, row) for index, row in read_rows(input_path) if index not in done)
+    stats = {"rows": 0, "skipped": len(done), "too_long": 0, "prompt_tokens": 0, "completion_tokens": 0,
+             "padding_tokens": 0, "batches": 0}
+    context_length = model_context_length(tokenizer, getattr(model, "config", None))
+    started = time.perf_counter()
+
+    with open(output_path, "a" if resume else "w", encoding="utf-8") as out:
+        while True:
+            chunk = list(itertools.islice(rows, window))
+            if not chunk:
+                break
+            prepared = prepare_prompts(tokenizer, [row[field] for _, row in chunk], max_new_tokens, template,
+                                       context_length)
+            fitting = [i for i, p in enumerate(prepared) if not p.too_long]
+            for i, p in enumerate(prepared):
+                if p.too_long:
+                    stats["too_long"] += 1
+                    index, row = chunk[i]
+                    out.write(json.dumps({"index": index, **row, "output": None,
+                                          "error": f"The prompt is {p.prompt_tokens} tokens long"}) + "\n")
+
+            batches = make_batches([prepared[i] for i in fitting], batch_size) if sort else \
+                [list(range(i, min(i + batch_size, len(fitting)))) for i in range(0, len(fitting), batch_size)]
+            for batch in batches:
+                batch = [fitting[i] for i in batch]
+                generated, padding = generate_batch(model, tokenizer, device, [prepared[i] for i in batch],
+                                                    temperature, top_p)
+                for i, ids in zip(batch, generated):
+                    index, row = chunk[i]
+                    out.write(json.dumps({"index": index, **row,
+                                          "output": tokenizer.decode(ids, skip_special_tokens=True).strip(),
+                                          "prompt_tokens": prepared[i].prompt_tokens,
+                                          "completion_tokens": len(ids)}) + "\n")
+                    stats["prompt_tokens"] += prepared[i].prompt_tokens
+                    stats["completion_tokens"] += len(ids)
+                stats["rows"] += len(batch)
+                stats["padding_tokens"] += padding
+                stats["batches"] += 1
+                # A checkpoint: an interruption loses at most the batch being generated
+                out.flush()
+                os.fsync(out.fileno())
+
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = elapsed
+    stats["rows_per_sec"] = stats["rows"] / elapsed if elapsed else 0.
+    stats["tokens_per_sec"] = stats["completion_tokens"] / elapsed if elapsed else 0.
+    return stats
+
+def load_batch_model(model_name, adapters_name, merged_name, torch_dtype, quant_type):
+    """
+    Loads the model like console_chat.py: the merged model when one is given and was merged from the
+    adapter, otherwise the base model with the adapter (4-bit quantized when there is a GPU). No adapter
+    loads the base model alone.
+    Returns:
+    tuple: The model and its tokenizer.
+    """
+    merged = find_merged_model(merged_name, adapters_name) if merged_name and adapters_name else None
+    if merged:
+        print(f"Loading the merged model from {merged}, unquantized in {torch_dtype}")
+        return load_merged_model(merged, torch_dtype), load_tokenizer(merged)
+    tokenizer = load_tokenizer(model_name)
+    if torch.cuda.is_available():
+        model = load_model(model_name, torch_dtype, quant_type)
+    else:
+        # BitsAndBytes needs CUDA
+        model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch_dtype, trust_remote_code=True)
+    model.resize_token_embeddings(len(tokenizer))
+    if adapters_name:
+        check_adapter_path(adapters_name)
+        model = load_peft_model(model, adapters_name)
+    return model, tokenizer
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate answers for every row of a JSONL dataset in batches.')
+    parser.add_argument('input', help='JSONL file, e.g. ../dataset/dataset-classification.json')
+    parser.add_argument('output', help='JSONL file the answers are appended to; rerunning resumes from it')
+    parser.add_argument('--model', default="../model-cache/mistralai/Mistral-7B-Instruct-v0.2", help='Base model path')
+    parser.add_argument('--adapter', default="../models/qlora/qlora/gpu-cpu_model/adapter",
+                        help='Adapter path; an empty string runs the base model')
+    parser.add_argument('--merged', default=None,
+                        help='Merged model written by export_merged.py, e.g. ../models/merged, loaded unquantized '
+                             'instead of the base model and adapter')
+    parser.add_argument('--template', default="<prompt_template>", help='Prompt template with a {} field')
+    parser.add_argument('--field', default="phrase", help='The row field filled into the template')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--max-new-tokens', type=int, default=32)
+    parser.add_argument('--window', type=int, default=1024, help='Rows sorted by length together')
+    parser.add_argument('--temperature', type=float, default=0., help='0 decodes greedily')
+    parser.add_argument('--top-p', type=float, default=1.)
+    parser.add_argument('--no-sort', action='store_true', help='Batch the rows in file order')
+    parser.add_argument('--restart', action='store_true', help='Overwrite the output instead of resuming')
+    parser.add_argument('--dtype', default="<compute_dtype>", help='Data type of the model weights, e.g. float16')
+    parser.add_argument('--quant-type', default="<quant_type>", help='Quantization type on GPU, nf4 or fp4')
+    args = parser.parse_args()
+
+    model, tokenizer = load_batch_model(args.model, args.adapter, args.merged, getattr(torch, args.dtype),
+                                        args.quant_type)
+    device = get_device()
+    model.to(device).eval()
+    stats = run_batch_inference(model, tokenizer, device, args.input, args.output, args.template, args.field,
+                                args.batch_size, args.max_new_tokens, args.window, args.temperature, args.top_p,
+                                sort=not args.no_sort, resume=not args.restart)
+    print(json.dumps(stats, indent=2))
@@ -0,0 +1,67 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import torch
+from peft import LoraConfig, PeftModel, get_peft_model
+from transformers import AutoModelForCausalLM
+
+from adapters import AdapterRegistry, discover_adapters
+from tiny_model import build_tiny_model
+
+def make_adapters(model_path, directory, count, rank=8):
+    """Saves `count` randomly initialized LoRA adapters for the model, like fine-tuning checkpoints."""
+    for i in range(count):
+        base = AutoModelForCausalLM.from_pretrained(model_path)
+        config = LoraConfig(r=rank, lora_alpha=16, target_modules=["q_proj", "k_proj", "v_proj", "o_proj"],
+                            init_lora_weights=False, task_type="CAUSAL_LM")
+        torch.manual_seed(i)
+        get_peft_model(base, config).save_pretrained(os.path.join(directory, f"checkpoint-{(i + 1) * 100}"))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure adapter load, swap latency and memory.')
+    parser.add_argument('--model', default=None, help='Model directory (defaults to a tiny random CPU model)')
+    parser.add_argument('--adapters-dir', default=None, help='Folder of adapters (defaults to random ones)')
+    parser.add_argument('--count', type=int, default=4, help='Number of random adapters to create')
+    parser.add_argument('--max-loaded', type=int, default=3)
+    parser.add_argument('--swaps', type=int, default=200)
+    args = parser.parse_args()
+
+    model_path = args.model or build_tiny_model()
+    directory = args.adapters_dir or tempfile.mkdtemp()
+    if not args.adapters_dir:
+        make_adapters(model_path, directory, args.count)
+    adapters = discover_adapters(directory)
+    names = list(adapters)
+
+    # Current path: a process restart reloads the base model and wraps it with one adapter
+    started = time.perf_counter()
+    PeftModel.from_pretrained(AutoModelForCausalLM.from_pretrained(model_path), adapters[names[0]])
+    restart_ms = (time.perf_counter() - started) * 1000
+
+    registry = AdapterRegistry(AutoModelForCausalLM.from_pretrained(model_path).eval(), adapters,
+                               max_loaded=args.max_loaded)
+    for name in names:
+        registry.activate(name)
+    loaded = registry._loaded.copy()
+
+    # Swaps between adapters that are all resident
+    resident = list(loaded)
+    swap_ms = []
+    for i in range(args.swaps):
+        started = time.perf_counter()
+        registry.activate(resident[i % len(resident)])
+        swap_ms.append((time.perf_counter() - started) * 1000)
+
+    stats = registry.stats()
+    print(f"{len(names)} adapters, at most {args.max_loaded} loaded")
+    print(f"restart with one adapter:  {restart_ms:8.1f} ms")
+    print(f"first load of an adapter:  {statistics.median(stats['load_ms'].values()):8.1f} ms (median)")
+    print(f"swap between loaded ones:  {statistics.median(swap_ms):8.3f} ms (median)")
+    for name, mib in stats["adapter_mib"].items():
+        print(f"memory {name:<20} {mib:8.3f} MiB")
@@ -0,0 +1,59 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import argparse
+import json
+import os
+import tempfile
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from batch_infer import run_batch_inference
+from tiny_model import DATASET, build_tiny_model
+
+TEMPLATE = "### Text: {}\n### The tone is:\n"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure offline batch inference throughput against the batch size.')
+    parser.add_argument('--model', default=None, help='Model directory (defaults to a small random CPU model)')
+    parser.add_argument('--rows', type=int, default=128, help='Dataset rows to generate for')
+    parser.add_argument('--batch-sizes', default="1,4,8,16,32", help='Comma separated batch sizes')
+    parser.add_argument('--max-new-tokens', type=int, default=16)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp()
+    model_path = args.model or build_tiny_model(os.path.join(work, "model"), hidden_size=512, layers=8)
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModelForCausalLM.from_pretrained(model_path, torch_dtype=torch.float32).eval()
+    device = model.device
+
+    # Rows spread over the dataset, so their lengths vary as much as the dataset's
+    with open(DATASET, encoding="utf-8") as f:
+        lines = [line for line in f if line.strip()]
+    input_path = os.path.join(work, "input.json")
+    with open(input_path, "w", encoding="utf-8") as f:
+        f.writelines(lines[::max(1, len(lines) // args.rows)][:args.rows])
+
+    def run(batch_size, sort=True):
+        output_path = os.path.join(work, f"output-{batch_size}-{sort}.json")
+        stats = run_batch_inference(model, tokenizer, device, input_path, output_path, TEMPLATE,
+                                    batch_size=batch_size, max_new_tokens=args.max_new_tokens, sort=sort, resume=False)
+        with open(output_path, encoding="utf-8") as f:
+            outputs = {row["index"]: row["output"] for row in map(json.loads, f)}
+        return stats, outputs
+
+    run(4)  # warm up
+    print(f"{'batch size':<16} {'rows/s':>7} {'tokens/s':>9} {'speedup':>8} {'padding':>8} {'same as batch 1':>15}")
+    baseline, expected = None, None
+    for batch_size in map(int, args.batch_sizes.split(",")):
+        for sort in ([True, False] if batch_size > 1 else [True]):
+            stats, outputs = run(batch_size, sort)
+            baseline = baseline or stats["rows_per_sec"]
+            expected = expected or outputs
+            # Greedy outputs should not depend on the padding a batch adds
+            same = sum(outputs[i] == text for i, text in expected.items())
+            padding = stats["padding_tokens"] / (stats["padding_tokens"] + stats["prompt_tokens"])
+            name = f"{batch_size}" if sort else f"{batch_size}, unsorted"
+            print(f"{name:<16} {stats['rows_per_sec']:>7.1f} {stats['tokens_per_sec']:>9.1f} "
+                  f"{stats['rows_per_sec'] / baseline:>8.2f} {padding:>8.0%} {f'{same}/{len(expected)}':>15}")
@@ -0,0 +1,60 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import argparse
+import json
+import time
+
+from transformers import AutoTokenizer
+
+from chat_history import ChatPromptBuilder
+from tiny_model import DATASET, build_tiny_model
+
+def conversation(phrases, turns, system="You are a friendly assistant that comments on the tone of messages."):
+    """Yields the message list a client would send at each turn of a growing chat."""
+    messages = [{"role": "system", "content": system}]
+    for i in range(turns):
+        messages.append({"role": "user", "content": phrases[(2 * i) % len(phrases)]})
+        yield list(messages)
+        messages.append({"role": "assistant", "content": phrases[(2 * i + 1) % len(phrases)]})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark incremental tokenization of chat histories.')
+    parser.add_argument('--model', default=None, help='Model directory (defaults to a tiny random CPU model)')
+    parser.add_argument('--turns', type=int, default=100)
+    parser.add_argument('--budget', type=int, default=None, help='Prompt token budget (defaults to unlimited)')
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model or build_tiny_model())
+    with open(DATASET, encoding="utf-8") as f:
+        phrases = [json.loads(line)["phrase"] for line in f if line.strip()]
+    budget = args.budget or 10 ** 9
+
+    # Baseline: render and tokenize the whole history every turn (the same text the builder renders)
+    reference = ChatPromptBuilder(tokenizer)
+    full_ms, full_ids = 0., []
+    for messages in conversation(phrases, args.turns):
+        started = time.perf_counter()
+        ids = reference._tokenize(reference.render(messages))
+        full_ms += (time.perf_counter() - started) * 1000
+        full_ids.append(ids)
+
+    builder = ChatPromptBuilder(tokenizer)
+    incremental_ms, same, dropped_total = 0., 0, 0
+    for messages, expected in zip(conversation(phrases, args.turns), full_ids):
+        started = time.perf_counter()
+        ids, dropped = builder.truncate(messages, budget)
+        incremental_ms += (time.perf_counter() - started) * 1000
+        same += ids == expected
+        dropped_total += dropped
+
+    stats = builder.stats()
+    print(f"turns: {args.turns}, final prompt: {len(full_ids[-1])} tokens")
+    print(f"full re-tokenization: {full_ms:.1f} ms")
+    print(f"incremental:          {incremental_ms:.1f} ms ({full_ms / incremental_ms:.1f}x faster, "
+          f"{full_ms - incremental_ms:.1f} ms saved)")
+    print(f"tokens reused {stats['tokens_reused']}, tokens encoded {stats['tokens_encoded']}")
+    if args.budget:
+        print(f"messages dropped over all turns: {dropped_total}")
+    else:
+        print(f"identical to full tokenization: {same}/{args.turns} turns")
@@ -0,0 +1,84 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import argparse
+import json
+import os
+import time
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from classify import LabelScorer, load_labels
+from load_test import percentile
+from tiny_model import DATASET, DEFAULT_PATH, build_tiny_model
+
+TEMPLATE = "### Text: {}\n### The tone is:\n"
+
+@torch.no_grad()
+def generate_label(model, tokenizer, text, max_new_tokens, min_new_tokens=0):
+    # What the console and web UI do: generate until the end of sequence token, then read the first word
+    input_ids = torch.tensor([tokenizer(TEMPLATE.format(text))["input_ids"]])
+    output = model.generate(input_ids, attention_mask=torch.ones_like(input_ids), max_new_tokens=max_new_tokens,
+                            min_new_tokens=min_new_tokens, do_sample=False, eos_token_id=tokenizer.eos_token_id,
+                            pad_token_id=tokenizer.eos_token_id)
+    words = tokenizer.decode(output[0, input_ids.shape[1]:], skip_special_tokens=True).split()
+    return (words[0] if words else ""), output.shape[1] - input_ids.shape[1]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare label scoring with free generation for tone classification.')
+    parser.add_argument('--model', default=None, help='Model directory (defaults to a small CPU model trained on the dataset)')
+    parser.add_argument('--rows', type=int, default=64, help='Dataset rows to classify')
+    parser.add_argument('--batch-size', type=int, default=8, help='Texts per forward pass when scoring in batches')
+    parser.add_argument('--max-new-tokens', type=int, default=1024, help='Limit of free generation, as in generate_text')
+    parser.add_argument('--long-tokens', type=int, default=64,
+                        help='Tokens generated when the answer does not stop after the label')
+    args = parser.parse_args()
+
+    # Trained, so that it answers with a tone and its end of sequence token (a few minutes on one core, once)
+    model_path = args.model or build_tiny_model(os.path.join(os.path.dirname(DEFAULT_PATH), "tiny-classifier"),
+                                                hidden_size=256, layers=4, train_steps=300)
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModelForCausalLM.from_pretrained(model_path, torch_dtype=torch.float32).eval()
+    labels = load_labels(DATASET)
+    scorer = LabelScorer(model, tokenizer, model.device, labels, TEMPLATE)
+
+    with open(DATASET, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    rows = rows[::max(1, len(rows) // args.rows)][:args.rows]
+    texts = [row["phrase"] for row in rows]
+
+    def measure(classify, batch_size=1):
+        classify(texts[:batch_size])  # warm up
+        predictions, latencies = [], []
+        started = time.perf_counter()
+        for i in range(0, len(texts), batch_size):
+            batch_started = time.perf_counter()
+            predictions += classify(texts[i:i + batch_size])
+            latencies += [time.perf_counter() - batch_started] * len(texts[i:i + batch_size])
+        elapsed = time.perf_counter() - started
+        accuracy = sum(p == row["tone"] for p, row in zip(predictions, rows)) / len(rows)
+        return percentile(latencies, 0.5) * 1000, len(texts) / elapsed, accuracy
+
+    new_tokens = []
+    def generate(batch):
+        label, tokens = generate_label(model, tokenizer, batch[0], args.max_new_tokens)
+        new_tokens.append(tokens)
+        return [label]
+    # The cost of a model that goes on after the label, e.g. one fine-tuned on joined samples without an end of
+    # sequence token; forbidding that token changes the answer, so its accuracy is not reported
+    generate_long = lambda batch: [generate_label(model, tokenizer, batch[0], args.long_tokens, args.long_tokens)[0]]
+    score = lambda batch: [result["label"] for result in scorer.score(batch)]
+
+    results = {
+        "generate": measure(generate),
+        f"generate, {args.long_tokens} tokens": measure(generate_long),
+        "label scoring": measure(score),
+        f"label scoring, {args.batch_size} texts": measure(score, args.batch_size),
+    }
+    print(f"{len(texts)} texts, labels {', '.join(labels)}; generation produced {sum(new_tokens) / len(new_tokens):.1f} tokens per text")
+    print(f"{'mode':<26} {'p50 ms':>7} {'texts/s':>8} {'speedup':>8} {'accuracy':>9}")
+    baseline = results["generate"][1]
+    for name, (p50_ms, per_sec, accuracy) in results.items():
+        accuracy = "-" if name.endswith(" tokens") else f"{accuracy:.0%}"
+        print(f"{name:<26} {p50_ms:>7.1f} {per_sec:>8.1f} {per_sec / baseline:>8.2f} {accuracy:>9}")
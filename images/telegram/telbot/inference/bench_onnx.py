@@ -0,0 +1,137 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import argparse
+import os
+import tempfile
+
+import numpy as np
+import torch
+from peft import PeftModel
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from adapters import AdapterRegistry
+from bench_adapters import make_adapters
+from load_test import load_prompts, run_clients
+from onnx_engine import ADAPTER_WEIGHTS, MODEL_FILE, OnnxCausalLM, OnnxGenerationScheduler, find_onnx_model
+from scheduler import GenerationScheduler, cache_layers, make_cache
+from tiny_model import build_tiny_model
+
+class _Decoder(torch.nn.Module):
+    # Flattens the cache into tensors and takes the LoRA weights as arguments, so they become model inputs
+    def __init__(self, model, lora_names):
+        super().__init__()
+        self.model = model
+        self.lora_modules = [model.get_submodule(name.rsplit(".", 1)[0]) for name in lora_names]
+        for module in self.lora_modules:
+            del module._parameters["weight"]
+
+    def forward(self, input_ids, attention_mask, position_ids, *tensors):
+        lora, past = tensors[:len(self.lora_modules)], tensors[len(self.lora_modules):]
+        for module, weight in zip(self.lora_modules, lora):
+            module.weight = weight
+        layers = [(past[i], past[i + 1]) for i in range(0, len(past), 2)]
+        outputs = self.model(input_ids=input_ids, attention_mask=attention_mask, position_ids=position_ids,
+                             past_key_values=make_cache(layers), use_cache=True)
+        return (outputs.logits, *[t for layer in cache_layers(outputs.past_key_values) for t in layer])
+
+def export_onnx(model_path, adapter_path, output_dir):
+    """
+    Writes a model in the layout the Olive workflow produces, for machines where Olive cannot run:
+    model.onnx with Olive's input and output names, the LoRA weights as inputs and their values in
+    adapter_weights.npz, like ExtractAdapters with make_inputs, and the tokenizer.
+    Returns:
+    str: The output directory.
+    """
+    if os.path.exists(os.path.join(output_dir, MODEL_FILE)):
+        return output_dir
+    model = PeftModel.from_pretrained(AutoModelForCausalLM.from_pretrained(model_path), adapter_path).eval()
+    lora = {name: p.detach() for name, p in model.named_parameters() if "lora_" in name}
+    config = model.config
+    kv_heads, head_dim = config.num_key_value_heads, config.hidden_size // config.num_attention_heads
+
+    input_names, output_names = ["input_ids", "attention_mask", "position_ids"], ["logits"]
+    dynamic_axes = {"input_ids": {0: "batch", 1: "seq"}, "attention_mask": {0: "batch", 1: "total"},
+                    "position_ids": {0: "batch", 1: "seq"}, "logits": {0: "batch", 1: "seq"}}
+    # Like ExtractAdapters: the input names drop PEFT's wrapper and adapter name
+    lora_inputs = [name.replace("base_model.model.", "").replace(".default", "") for name in lora]
+    input_names += lora_inputs
+    past = []
+    for i in range(config.num_hidden_layers):
+        for kv in ("key", "value"):
+            input_names.append(f"past_key_values.{i}.{kv}")
+            output_names.append(f"present.{i}.{kv}")
+            dynamic_axes[input_names[-1]] = {0: "batch", 2: "past"}
+            dynamic_axes[output_names[-1]] = {0: "batch", 2: "total"}
+            past.append(torch.zeros(1, kv_heads, 2, head_dim))
+
+    os.makedirs(output_dir, exist_ok=True)
+    args = (torch.tensor([[1, 2]]), torch.ones(1, 4, dtype=torch.long), torch.tensor([[2, 3]]), *lora.values(), *past)
+    torch.onnx.export(_Decoder(model, list(lora)), args, os.path.join(output_dir, MODEL_FILE),
+                      input_names=input_names, output_names=output_names, dynamic_axes=dynamic_axes,
+                      opset_version=17, dynamo=False)
+    np.savez(os.path.join(output_dir, ADAPTER_WEIGHTS), **{n: p.numpy() for n, p in zip(lora_inputs, lora.values())})
+    AutoTokenizer.from_pretrained(model_path).save_pretrained(output_dir)
+    return output_dir
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare generation throughput of the PyTorch and ONNX Runtime backends on CPU.')
+    parser.add_argument('--model', default=None, help='Base model directory (defaults to a small random CPU model)')
+    parser.add_argument('--adapter', default=None, help='Adapter directory (defaults to a random one)')
+    parser.add_argument('--onnx-model', default=None,
+                        help='Olive output directory of the same model and adapter (defaults to exporting one)')
+    parser.add_argument('--clients', default="1,8", help='Comma separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=4, help='Requests per client')
+    parser.add_argument('--max-new-tokens', type=int, default=32)
+    parser.add_argument('--max-batch-size', type=int, default=8)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp()
+    model_path = args.model or build_tiny_model(os.path.join(work, "model"), hidden_size=512, layers=8)
+    adapter_path = args.adapter
+    if adapter_path is None:
+        make_adapters(model_path, os.path.join(work, "adapters"), 1)
+        adapter_path = os.path.join(work, "adapters", "checkpoint-100")
+    onnx_path = find_onnx_model(args.onnx_model) if args.onnx_model else export_onnx(model_path, adapter_path,
+                                                                                      os.path.join(work, "onnx"))
+
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModelForCausalLM.from_pretrained(model_path, torch_dtype=torch.float32).eval()
+    registry = AdapterRegistry(model, {"adapter": adapter_path}, default="adapter")
+    schedulers = {
+        "pytorch": GenerationScheduler(model, tokenizer, model.device, max_batch_size=args.max_batch_size,
+                                       adapters=registry),
+        "onnxruntime": OnnxGenerationScheduler(OnnxCausalLM(onnx_path, {"adapter": os.path.join(onnx_path, ADAPTER_WEIGHTS)},
+                                                            default_adapter="adapter"),
+                                               tokenizer, max_batch_size=args.max_batch_size),
+    }
+    encoded = [tokenizer(p)["input_ids"] for p in load_prompts()]
+
+    def sender(scheduler):
+        def send(i):
+            request = scheduler.submit(encoded[i % len(encoded)], max_new_tokens=args.max_new_tokens,
+                                       top_p=0.95, adapter="adapter")
+            for _ in request:
+                pass
+            return len(request.generated)
+        return send
+
+    # Both backends must pick the same tokens greedily, with and without the adapter
+    for adapter in ["adapter", "base"]:
+        outputs = {}
+        for name, scheduler in schedulers.items():
+            outputs[name] = [scheduler.submit(encoded[i], max_new_tokens=args.max_new_tokens, do_sample=False,
+                                              adapter=adapter) for i in range(8)]
+            for request in outputs[name]:
+                list(request)
+        same = sum(a.generated == b.generated for a, b in zip(*outputs.values()))
+        print(f"greedy outputs identical with {adapter}: {same}/{len(outputs['pytorch'])}")
+
+    print(f"{'backend':<12} {'clients':>7} {'requests':>8} {'tokens/s':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, scheduler in schedulers.items():
+        send = sender(scheduler)
+        send(0)  # warm up
+        for clients in map(int, args.clients.split(",")):
+            result = run_clients(clients, args.requests, send)
+            print(f"{name:<12} {clients:>7} {result['requests']:>8} {result['tokens_per_sec']:>9.1f} "
+                  f"{result['p50_ms']:>8.0f} {result['p95_ms']:>8.0f}")
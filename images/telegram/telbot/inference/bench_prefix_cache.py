@@ -0,0 +1,64 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import argparse
+import json
+import statistics
+import time
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from prefix_cache import PrefixCache
+from scheduler import make_cache
+from tiny_model import DATASET, build_tiny_model
+
+TEMPLATES = {
+    "default": "### Text: {}\n### The tone is:\n",
+    "instruction": ("You are a classifier for the tone of short messages. Read the text and answer with exactly "
+                    "one word from this list: joy, sadness, anger, fear, love, surprise. Do not explain the "
+                    "answer, do not repeat the text and do not add punctuation.\n### Text: {}\n### The tone is:\n"),
+}
+
+@torch.no_grad()
+def prefill_ms(model, tokenizer, device, template, phrases, prefix_cache=None):
+    """
+    Measures the time to run the prompt through the model (up to the first token's logits).
+    Returns:
+    list: Milliseconds per prompt.
+    """
+    times = []
+    for phrase in phrases:
+        input_ids = tokenizer(template.format(phrase))["input_ids"]
+        started = time.perf_counter()
+        past_key_values = None
+        if prefix_cache is not None:
+            reused, layers = prefix_cache.match(input_ids, template)
+            if reused:
+                input_ids, past_key_values = input_ids[reused:], make_cache(layers)
+        model(input_ids=torch.tensor([input_ids], device=device), past_key_values=past_key_values, use_cache=True)
+        times.append((time.perf_counter() - started) * 1000)
+    return times
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark prefill time with and without prefix KV-cache reuse.')
+    parser.add_argument('--model', default=None, help='Model directory (defaults to a tiny random CPU model)')
+    parser.add_argument('--prompts', type=int, default=200)
+    args = parser.parse_args()
+
+    model_path = args.model or build_tiny_model()
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModelForCausalLM.from_pretrained(model_path).eval()
+    device = model.device
+    with open(DATASET, encoding="utf-8") as f:
+        phrases = [json.loads(line)["phrase"] for line in f if line.strip()][:args.prompts]
+
+    print(f"{'template':<12} {'prefix tokens':>13} {'prompt tokens':>13} {'full ms':>8} {'reuse ms':>8} {'speedup':>7}")
+    for name, template in TEMPLATES.items():
+        prefix_cache = PrefixCache(model, tokenizer, device)
+        prefix_tokens = len(prefix_cache.get(template)[0])
+        prompt_tokens = statistics.mean(len(tokenizer(template.format(p))["input_ids"]) for p in phrases)
+        prefill_ms(model, tokenizer, device, template, phrases[:10])  # warm up
+        full = statistics.median(prefill_ms(model, tokenizer, device, template, phrases))
+        reuse = statistics.median(prefill_ms(model, tokenizer, device, template, phrases, prefix_cache))
+        print(f"{name:<12} {prefix_tokens:>13} {prompt_tokens:>13.0f} {full:>8.2f} {reuse:>8.2f} {full / reuse:>6.2f}x")
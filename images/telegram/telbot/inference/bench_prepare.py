@@ -0,0 +1,50 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import argparse
+import json
+import time
+
+from transformers import AutoTokenizer
+
+from prepare import prepare_prompt, prepare_prompts
+from tiny_model import DATASET, build_tiny_model
+
+TEMPLATE = "### Text: {}\n### The tone is:\n"
+
+def two_pass(tokenizer, text, max_tokens):
+    """What inference_generator used to do: count the tokens, then tokenize again for generate()."""
+    prompt = TEMPLATE.format(text)
+    input_token_count = len(tokenizer(prompt)["input_ids"])
+    max_new_tokens = min(tokenizer.model_max_length - input_token_count, max_tokens)
+    return tokenizer(prompt, return_tensors="pt"), max_new_tokens
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Micro-benchmark request tokenization.')
+    parser.add_argument('--model', default=None, help='Model directory (defaults to a tiny random CPU model)')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model or build_tiny_model())
+    with open(DATASET, encoding="utf-8") as f:
+        texts = [json.loads(line)["phrase"] for line in f if line.strip()]
+
+    def per_prompt(fn):
+        best = float("inf")
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - started)
+        return best / len(texts) * 1e6
+
+    batches = [texts[i:i + args.batch_size] for i in range(0, len(texts), args.batch_size)]
+    results = {
+        "two passes": per_prompt(lambda: [two_pass(tokenizer, t, 256) for t in texts]),
+        "single pass": per_prompt(lambda: [prepare_prompt(tokenizer, t, 256, TEMPLATE) for t in texts]),
+        f"batched ({args.batch_size})": per_prompt(lambda: [prepare_prompts(tokenizer, b, 256, TEMPLATE) for b in batches]),
+    }
+    baseline = results["two passes"]
+    print(f"{len(texts)} prompts")
+    for name, us in results.items():
+        print(f"{name:<14} {us:>7.1f} us/prompt  {baseline / us:>5.1f}x")
@@ -0,0 +1,79 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import argparse
+import json
+import os
+import time
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from scheduler import GenerationScheduler
+from tiny_model import DATASET, DEFAULT_PATH, build_tiny_model
+
+def load_openings(dataset=DATASET, words=3):
+    """Prompts made of the first words of each phrase, which a model trained on the dataset continues."""
+    with open(dataset, encoding="utf-8") as f:
+        return ["### Text: " + " ".join(json.loads(line)["phrase"].split()[:words]) for line in f if line.strip()]
+
+def run(scheduler, prompts, max_new_tokens, speculative, do_sample):
+    # One request at a time: speculative decoding is about the latency of a single stream
+    started, outputs = time.perf_counter(), []
+    for input_ids in prompts:
+        request = scheduler.submit(input_ids, max_new_tokens=max_new_tokens, do_sample=do_sample, temperature=0.8,
+                                   speculative=speculative)
+        for _ in request:
+            pass
+        outputs.append(request.generated)
+    return sum(map(len, outputs)) / (time.perf_counter() - started), outputs
+
+def run_generate(model, prompts, max_new_tokens, draft=None):
+    # utils.generate_text's path: model.generate, assisted by the draft model if given
+    started, tokens = time.perf_counter(), 0
+    for input_ids in prompts:
+        input_ids = torch.tensor([input_ids])
+        output = model.generate(input_ids, attention_mask=torch.ones_like(input_ids), max_new_tokens=max_new_tokens,
+                                do_sample=False, assistant_model=draft)
+        tokens += output.shape[1] - input_ids.shape[1]
+    return tokens / (time.perf_counter() - started)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure the acceptance rate and speedup of speculative decoding.')
+    parser.add_argument('--model', default=None, help='Model directory (defaults to a small CPU model trained on the dataset)')
+    parser.add_argument('--draft', default=None, help='Draft model directory (defaults to a tiny one trained on the dataset)')
+    parser.add_argument('--draft-tokens', default="2,4,6", help='Comma separated numbers of tokens drafted per step')
+    parser.add_argument('--prompts', type=int, default=16)
+    parser.add_argument('--max-new-tokens', type=int, default=48)
+    args = parser.parse_args()
+
+    # Random weights would never agree, so both models learn the dataset first (about 10 minutes on one core, once)
+    cache = os.path.dirname(DEFAULT_PATH)
+    model_path = args.model or build_tiny_model(os.path.join(cache, "tiny-target"), hidden_size=512, layers=8, train_steps=300)
+    draft_path = args.draft or build_tiny_model(os.path.join(cache, "tiny-draft"), hidden_size=64, layers=2, train_steps=300)
+
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModelForCausalLM.from_pretrained(model_path).eval()
+    draft = AutoModelForCausalLM.from_pretrained(draft_path).eval()
+    prompts = [tokenizer(text)["input_ids"] for text in load_openings()[:args.prompts]]
+
+    print(f"{'mode':<24} {'tokens/s':>9} {'speedup':>8} {'acceptance':>10} {'same output':>11}")
+    for do_sample in [False, True]:
+        scheduler = GenerationScheduler(model, tokenizer, model.device, draft=draft)
+        run(scheduler, prompts[:2], 8, True, do_sample)  # warm up
+        baseline, expected = run(scheduler, prompts, args.max_new_tokens, False, do_sample)
+        name = "sampled" if do_sample else "greedy"
+        print(f"{name + ', no draft':<24} {baseline:>9.1f} {1:>8.2f} {'':>10} {'':>11}")
+        for draft_tokens in map(int, args.draft_tokens.split(",")):
+            scheduler.draft_tokens = draft_tokens
+            scheduler.drafted = scheduler.draft_accepted = 0
+            speed, outputs = run(scheduler, prompts, args.max_new_tokens, True, do_sample)
+            # Greedy speculative decoding must give exactly the tokens of normal decoding
+            same = f"{sum(a == b for a, b in zip(expected, outputs))}/{len(outputs)}" if not do_sample else ""
+            print(f"{f'{name}, draft {draft_tokens}':<24} {speed:>9.1f} {speed / baseline:>8.2f} "
+                  f"{scheduler.speculative_stats()['acceptance_rate']:>10.0%} {same:>11}")
+
+    baseline = run_generate(model, prompts, args.max_new_tokens)
+    assisted = run_generate(model, prompts, args.max_new_tokens, draft)
+    print(f"{'generate()':<24} {baseline:>9.1f} {1:>8.2f}")
+    print(f"{'generate(assistant_model)':<24} {assisted:>9.1f} {assisted / baseline:>8.2f}")
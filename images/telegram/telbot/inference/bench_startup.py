@@ -0,0 +1,69 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+def load(mode, model_path, adapter_path, merged_path):
+    """Loads the model the way the servers do and returns the time it took."""
+    import torch
+    from transformers import AutoModelForCausalLM
+    from utils import load_merged_model, load_peft_model, load_tokenizer
+
+    started = time.perf_counter()
+    if mode == "merged":
+        tokenizer = load_tokenizer(merged_path)
+        model = load_merged_model(merged_path, torch.float32)
+    else:
+        # utils.load_model without BitsAndBytes, which needs CUDA
+        tokenizer = load_tokenizer(model_path)
+        model = AutoModelForCausalLM.from_pretrained(model_path, torch_dtype=torch.float32)
+        model.resize_token_embeddings(len(tokenizer))
+        model = load_peft_model(model, adapter_path)
+    with torch.no_grad():
+        model(input_ids=torch.tensor([tokenizer("Hello")["input_ids"]]))
+    return time.perf_counter() - started
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare startup time and peak RSS of base+adapter and merged loading.')
+    parser.add_argument('--model', default=None, help='Base model directory (defaults to a small random CPU model)')
+    parser.add_argument('--adapter', default=None, help='Adapter directory (defaults to a random one)')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--child', nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        seconds = load(*args.child)
+        print(json.dumps({"seconds": seconds, "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+        sys.exit(0)
+
+    import torch
+    from bench_adapters import make_adapters
+    from export_merged import export_merged
+    from tiny_model import build_tiny_model
+
+    work = tempfile.mkdtemp()
+    model_path = args.model or build_tiny_model(os.path.join(work, "model"), hidden_size=1024, layers=12)
+    adapter_path = args.adapter
+    if adapter_path is None:
+        make_adapters(model_path, os.path.join(work, "adapters"), 1)
+        adapter_path = os.path.join(work, "adapters", "checkpoint-100")
+    merged_path = export_merged(model_path, adapter_path, os.path.join(work, "merged"), torch.float32)
+
+    print(f"{'path':<16} {'startup s':>9} {'peak RSS MiB':>12}")
+    for mode in ["base + adapter", "merged"]:
+        results = []
+        for _ in range(args.runs):
+            # A fresh process each time, so peak RSS and caches are not shared between runs
+            out = subprocess.run([sys.executable, __file__, "--child", mode.split()[0], model_path, adapter_path, merged_path],
+                                 capture_output=True, text=True, check=True).stdout
+            results.append(json.loads(out.strip().splitlines()[-1]))
+        seconds = sorted(r["seconds"] for r in results)[len(results) // 2]
+        rss = max(r["peak_rss_mib"] for r in results)
+        print(f"{mode:<16} {seconds:>9.2f} {rss:>12.0f}")
@@ -0,0 +1,221 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import collections
+import hashlib
+import json
+import threading
+import time
+
+def _render_plain(messages, add_generation_prompt):
+    """Fallback for tokenizers without a chat template."""
+    text = "".join(f"### {m['role'].capitalize()}: {m['content']}\n" for m in messages)
+    return text + "### Assistant:" if add_generation_prompt else text
+
+def _render_template(messages, template, eos_token):
+    """
+    For adapters fine-tuned on single texts: every user message in the fine-tuning template, each
+    followed by the answer and the end of sequence token the model ended it with. The adapter never
+    saw a system message, so it is left out.
+    """
+    return "".join(template.format(m["content"]) if m["role"] == "user" else m["content"] + eos_token
+                   for m in messages if m["role"] != "system")
+
+class ChatPromptBuilder:
+    """
+    Turns a whole conversation into prompt token ids with the tokenizer's chat template, or with
+    a fine-tuning prompt template around each user message.
+
+    Conversations are truncated to a token budget by dropping the oldest turns while keeping the
+    system message and the latest user message. Turns are dropped drop_step messages at a time, so
+    the truncated history keeps the same start for several turns and its encoding stays reusable.
+
+    Encodings are cached by conversation prefix, so when a client resends the history with one more
+    turn, only the text after the longest already-encoded prefix is tokenized. That gives the ids of
+    a full encode only if the tokenizer splits the same way at the boundary, which sentencepiece
+    tokenizers (a Metaspace pre-tokenizer that prefixes a space to every text) do not always do. So
+    the first verify_encodings incremental encodings are compared with a full encode, and after a
+    difference every conversation is encoded in full.
+    """
+    def __init__(self, tokenizer, max_entries=1024, drop_step=8, template=None, verify_encodings=32):
+        self.tokenizer = tokenizer
+        self.drop_step = drop_step
+        self.max_entries = max_entries
+        self.template = template
+        self.verify_encodings = verify_encodings
+        self.incremental = True
+        self.verified = 0
+        self.tokens_reused = 0
+        self.tokens_encoded = 0
+        self.seconds = 0.
+        self._fold_system = False
+        self._prefixes = collections.OrderedDict()  # conversation prefix hash -> (text, ids)
+        self._lengths = collections.OrderedDict()  # message hash -> token count of its content
+        self._lock = threading.Lock()
+
+    def render(self, messages, add_generation_prompt=True):
+        if self.template is not None:
+            # The template ends with the cue the answer follows, so there is no separate generation prompt
+            return _render_template(messages, self.template, self.tokenizer.eos_token or "")
+        if not getattr(self.tokenizer, "chat_template", None):
+            return _render_plain(messages, add_generation_prompt)
+        if self._fold_system:
+            messages = self._without_system(messages)
+        try:
+            return self.tokenizer.apply_chat_template(messages, tokenize=False,
+                                                      add_generation_prompt=add_generation_prompt)
+        except Exception:
+            # Some templates (e.g. Mistral Instruct) only accept alternating user/assistant turns
+            if self._fold_system or messages[0]["role"] != "system":
+                raise
+            self._fold_system = True
+            return self.render(messages, add_generation_prompt)
+
+    @staticmethod
+    def _without_system(messages):
+        """Moves the system message into the first user message."""
+        if not messages or messages[0]["role"] != "system" or len(messages) < 2:
+            return messages
+        first = dict(messages[1], content=messages[0]["content"] + "\n\n" + messages[1]["content"])
+        return [first] + list(messages[2:])
+
+    def _tokenize(self, text, whole=False):
+        # A whole prompt in a fine-tuning template gets the tokenizer's special tokens (e.g. BOS), as the
+        # training texts did; a chat template renders them itself.
+        special = whole and self.template is not None
+        # The Rust tokenizer directly: the Python wrapper costs more than encoding a short suffix
+        backend = getattr(self.tokenizer, "backend_tokenizer", None)
+        if backend is not None:
+            return backend.encode(text, add_special_tokens=special).ids
+        return self.tokenizer(text, add_special_tokens=special)["input_ids"]
+
+    def _extend(self, prefix_text, prefix_ids, text):
+        """
+        The ids of text, which starts with prefix_text, tokenizing only the rest while that is known
+        to give the same ids as a full encode.
+        Returns:
+        tuple: The ids, and the number of them that were reused from prefix_ids.
+        """
+        if not self.incremental:
+            return self._tokenize(text, whole=True), 0
+        ids = prefix_ids + self._tokenize(text[len(prefix_text):])
+        with self._lock:
+            verify = self.verified < self.verify_encodings
+            self.verified += verify
+        if verify:
+            full = self._tokenize(text, whole=True)
+            if full != ids:
+                print("Tokenizing conversations in full: encoding only the new messages gives different ids")
+                self.incremental = False
+                return full, 0
+        return ids, len(prefix_ids)
+
+    def _encode_history(self, messages):
+        """Token ids of the rendered conversation without the generation prompt, reusing cached prefixes."""
+        hashes, h = [], hashlib.sha1()
+        for m in messages:
+            h.update(json.dumps([m["role"], m["content"]]).encode("utf-8"))
+            hashes.append(h.hexdigest())
+
+        text = self.render(messages, add_generation_prompt=False)
+        with self._lock:
+            entry = self._prefixes.get(hashes[-1])
+            if entry is not None and entry[0] == text:
+                self._prefixes.move_to_end(hashes[-1])
+                self.tokens_reused += len(entry[1])
+                return text, entry[1]
+            for k in range(len(messages) - 1, 0, -1):
+                entry = self._prefixes.get(hashes[k - 1])
+                if entry is not None and text.startswith(entry[0]):
+                    break
+            else:
+                entry = None
+
+        if entry is not None:
+            ids, reused = self._extend(entry[0], entry[1], text)
+        else:
+            ids, reused = self._tokenize(text, whole=True), 0
+        encoded = len(ids) - reused
+
+        with self._lock:
+            self.tokens_reused += reused
+            self.tokens_encoded += encoded
+            self._prefixes[hashes[-1]] = (text, ids)
+            while len(self._prefixes) > self.max_entries:
+                self._prefixes.popitem(last=False)
+        return text, ids
+
+    def encode(self, messages):
+        """
+        Renders and tokenizes a conversation, ready for generation.
+        Args:
+        messages (list): {"role", "content"} dicts, oldest first.
+        Returns:
+        list: Prompt token ids, including the assistant generation prompt.
+        """
+        started = time.perf_counter()
+        text, ids = self._encode_history(messages)
+        template = getattr(self.tokenizer, "chat_template", None)
+        if self.template is not None or (template and "add_generation_prompt" not in template):
+            self.seconds += time.perf_counter() - started
+            return ids
+        full_text = self.render(messages, add_generation_prompt=True)
+        if full_text.startswith(text):
+            ids, _ = self._extend(text, ids, full_text)
+        else:
+            ids = self._tokenize(full_text, whole=True)
+        self.seconds += time.perf_counter() - started
+        return ids
+
+    def _content_length(self, message):
+        key = hashlib.sha1(json.dumps([message["role"], message["content"]]).encode("utf-8")).hexdigest()
+        with self._lock:
+            n = self._lengths.get(key)
+            if n is not None:
+                self._lengths.move_to_end(key)
+                return n
+        n = len(self._tokenize(message["content"]))
+        with self._lock:
+            self._lengths[key] = n
+            while len(self._lengths) > self.max_entries:
+                self._lengths.popitem(last=False)
+        return n
+
+    def truncate(self, messages, budget):
+        """
+        Renders the conversation, dropping the oldest turns until it fits in budget tokens.
+        The system message and the last message are always kept; turns are dropped from the
+        start so the remaining history still begins with a user message.
+        Args:
+        messages (list): {"role", "content"} dicts, oldest first.
+        budget (int): Maximum number of prompt tokens.
+        Returns:
+        tuple: The prompt token ids and the number of messages dropped. The ids may still be
+        over budget if the system and last message alone do not fit.
+        """
+        system = [m for m in messages[:1] if m["role"] == "system"]
+        turns = list(messages[len(system):])
+        dropped = 0
+
+        # Estimate from per-message token counts how many turns to drop, then check the real length
+        excess = sum(self._content_length(m) for m in messages) - budget
+        while excess > 0 and dropped < len(turns) - 1:
+            excess -= self._content_length(turns[dropped])
+            dropped += 1
+        if dropped:
+            dropped = min(len(turns) - 1, -(-dropped // self.drop_step) * self.drop_step)
+            turns = turns[dropped:]
+        while True:
+            while len(turns) > 1 and turns[0]["role"] != "user":
+                turns.pop(0)
+                dropped += 1
+            ids = self.encode(system + turns)
+            if len(ids) <= budget or len(turns) <= 1:
+                return ids, dropped
+            turns.pop(0)
+            dropped += 1
+
+    def stats(self):
+        with self._lock:
+            return {"tokens_reused": self.tokens_reused, "tokens_encoded": self.tokens_encoded,
+                    "seconds": self.seconds, "cached_prefixes": len(self._prefixes), "incremental": self.incremental}
@@ -0,0 +1,163 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import argparse
+import itertools
+import json
+import sys
+
+import numpy as np
+import torch
+
+DATASET = "../dataset/dataset-classification.json"
+
+def load_labels(dataset=DATASET, field="tone"):
+    """
+    Reads the label set of a classification dataset.
+    Args:
+    dataset (str): JSONL file of rows such as {"phrase": ..., "tone": ...}.
+    field (str): The row field holding the label.
+    Returns:
+    list: The distinct labels, in the order they first appear.
+    """
+    labels = {}
+    with open(dataset, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                labels.setdefault(json.loads(line)[field], None)
+    return list(labels)
+
+class LabelScorer:
+    """
+    Classifies texts without generating: each candidate label is appended to the prompt, and one
+    batched forward pass gives the log-likelihood of every label's tokens, followed by the end of
+    sequence token so that a label is not rewarded for being the prefix of a longer answer. The
+    label with the highest log-likelihood wins; a softmax over the labels gives their probabilities.
+    Works with a PyTorch model or an OnnxCausalLM.
+    """
+    def __init__(self, model, tokenizer, device, labels, template, end_of_sequence=True):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.labels = list(labels)
+        self.template = template
+        self.end_of_sequence = end_of_sequence
+
+    def _encode(self, text, labels):
+        # The label is tokenized together with the prompt, as in training, and its tokens are those
+        # after the longest prefix the encoding shares with the prompt's own encoding
+        prompt = self.template.format(text)
+        prompt_ids = self.tokenizer(prompt)["input_ids"]
+        rows = []
+        for ids in self.tokenizer([prompt + label for label in labels])["input_ids"]:
+            start = next((i for i, (a, b) in enumerate(zip(prompt_ids, ids)) if a != b), len(prompt_ids))
+            if self.end_of_sequence:
+                ids = ids + [self.tokenizer.eos_token_id]
+            rows.append((ids, max(start, 1)))
+        return rows
+
+    def _logits(self, input_ids, attention_mask, adapter):
+        if hasattr(self.model, "empty_cache"):
+            # OnnxCausalLM: an empty cache with the batch dimension, and the adapter fed as inputs
+            empty = [(np.repeat(k, len(input_ids), axis=0), np.repeat(v, len(input_ids), axis=0))
+                     for k, v in self.model.empty_cache()]
+            positions = np.tile(np.arange(input_ids.shape[1]), (len(input_ids), 1))
+            logits, _ = self.model(input_ids.numpy(), attention_mask.numpy(), positions, empty, adapter)
+            return torch.from_numpy(logits)
+        return self.model(input_ids=input_ids.to(self.device), attention_mask=attention_mask.to(self.device)).logits
+
+    @torch.no_grad()
+    def score(self, texts, labels=None, adapter=None):
+        """
+        Scores every label for every text in one forward pass.
+        Args:
+        texts (list): The texts to classify.
+        labels (list): Candidate labels, defaulting to the scorer's.
+        adapter (str): The adapter of an OnnxCausalLM to run with; a PyTorch model runs with its active adapter.
+        Returns:
+        list: For each text, a dict with the most likely "label", the "probabilities" of all labels and
+        their summed token "log_likelihoods".
+        """
+        labels = list(labels or self.labels)
+        rows = [row for text in texts for row in self._encode(text, labels)]
+        longest = max(len(ids) for ids, _ in rows)
+        # The padding is masked out and never scored, so the end of sequence token, which every model has, will do
+        eos = self.tokenizer.eos_token_id
+        input_ids = torch.tensor([ids + [eos] * (longest - len(ids)) for ids, _ in rows])
+        attention_mask = torch.tensor([[1] * len(ids) + [0] * (longest - len(ids)) for ids, _ in rows])
+        logits = self._logits(input_ids, attention_mask, adapter).float()
+
+        scores = []
+        for i, (ids, start) in enumerate(rows):
+            # The logits at position t predict token t + 1
+            log_probs = torch.log_softmax(logits[i, start - 1:len(ids) - 1], dim=-1)
+            scores.append(float(log_probs.gather(1, torch.tensor(ids[start:], device=log_probs.device)[:, None]).sum()))
+
+        results = []
+        for t in range(len(texts)):
+            likelihoods = scores[t * len(labels):(t + 1) * len(labels)]
+            probabilities = torch.softmax(torch.tensor(likelihoods), dim=0).tolist()
+            results.append({
+                "label": labels[int(np.argmax(likelihoods))],
+                "probabilities": dict(zip(labels, probabilities)),
+                "log_likelihoods": dict(zip(labels, likelihoods)),
+            })
+        return results
+
+def classify_file(scorer, input_path, field="phrase", label_field="tone", batch_size=8):
+    """
+    Classifies every row of a JSONL file, batch_size rows per forward pass.
+    Yields:
+    dict: The row with its "prediction" and the "probabilities" of all labels.
+    """
+    with open(input_path, encoding="utf-8") as f:
+        rows = (json.loads(line) for line in f if line.strip())
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+            for row, result in zip(batch, scorer.score([row[field] for row in batch])):
+                yield {**row, "prediction": result["label"], "probabilities": result["probabilities"]}
+
+if __name__ == "__main__":
+    from batch_infer import load_batch_model
+    from utils import get_device
+
+    parser = argparse.ArgumentParser(description='Classify texts by scoring each candidate label instead of generating.')
+    parser.add_argument('texts', nargs='*', help='Texts to classify')
+    parser.add_argument('--input', default=None, help='JSONL file to classify instead, one JSON line out per row')
+    parser.add_argument('--field', default="phrase", help='The row field holding the text')
+    parser.add_argument('--label-field', default="tone", help='The row field holding the label, counted for accuracy')
+    parser.add_argument('--labels', default=None, help=f'Comma separated labels (defaults to those of {DATASET})')
+    parser.add_argument('--batch-size', type=int, default=8, help='Texts scored per forward pass')
+    parser.add_argument('--model', default="../model-cache/mistralai/Mistral-7B-Instruct-v0.2", help='Base model path')
+    parser.add_argument('--adapter', default="../models/qlora/qlora/gpu-cpu_model/adapter",
+                        help='Adapter path; an empty string runs the base model')
+    parser.add_argument('--merged', default=None,
+                        help='Merged model written by export_merged.py, e.g. ../models/merged, loaded unquantized '
+                             'instead of the base model and adapter')
+    parser.add_argument('--template', default="<prompt_template>", help='Prompt template with a {} field')
+    parser.add_argument('--dtype', default="<compute_dtype>", help='Data type of the model weights, e.g. float16')
+    parser.add_argument('--quant-type', default="<quant_type>", help='Quantization type on GPU, nf4 or fp4')
+    args = parser.parse_args()
+
+    model, tokenizer = load_batch_model(args.model, args.adapter, args.merged, getattr(torch, args.dtype),
+                                        args.quant_type)
+    device = get_device()
+    model.to(device).eval()
+    labels = args.labels.split(",") if args.labels else load_labels(DATASET, args.label_field)
+    scorer = LabelScorer(model, tokenizer, device, labels, args.template)
+
+    if args.input:
+        correct = total = 0
+        for row in classify_file(scorer, args.input, args.field, args.label_field, args.batch_size):
+            print(json.dumps(row))
+            if args.label_field in row:
+                correct += row["prediction"] == row[args.label_field]
+                total += 1
+        if total:
+            print(f"Accuracy: {correct / total:.1%} of {total}", file=sys.stderr)
+    for text in args.texts:
+        result = scorer.score([text])[0]
+        probabilities = ", ".join(f"{label} {p:.0%}" for label, p in result["probabilities"].items())
+        print(f"{result['label']}  ({probabilities})  {text}")
@@ -5,9 +5,11 @@ import sys
 
 import torch
 from utils import (load_tokenizer, load_model, load_peft_model, get_device, 
-                   generate_text, run_prompt, check_adapter_path)
+                   generate_text, run_prompt, check_adapter_path, find_merged_model, load_merged_model,
+                   load_draft_model)
+from prefix_cache import PrefixCache
 
-def main(model_name, adapters_name, torch_dtype, quant_type):
+def main(model_name, adapters_name, torch_dtype, quant_type, merged_name=None, draft_name=None):
     """
     The main execution function that loads the model, tokenizer, and runs the prompt.
     Args:
@@ -15,28 +17,44 @@ def main(model_name, adapters_name, torch_dtype, quant_type):
     adapters_name (str): Path to the adapters file.
     torch_dtype (torch.dtype): The data type for model weights (e.g., torch.bfloat16).
     quant_type (str): The quantization type to use.
+    merged_name (str): Path of a model exported by export_merged.py, loaded unquantized instead when it was
+    merged from adapters_name. None always loads the base model and adapter.
+    draft_name (str): Path of a small model with the same tokenizer; when it exists, generation uses
+    speculative decoding with it.
     """
     check_adapter_path(adapters_name)
-    tokenizer = load_tokenizer(model_name)
+    merged = find_merged_model(merged_name, adapters_name) if merged_name else None
+    if merged:
+        print(f"Loading the merged model from {merged}, unquantized in {torch_dtype}")
+        tokenizer = load_tokenizer(merged)
+        model = load_merged_model(merged, torch_dtype)
+    else:
+        tokenizer = load_tokenizer(model_name)
 
-    model = load_model(model_name, torch_dtype, quant_type)
-    model.resize_token_embeddings(len(tokenizer))
-    
-    model = load_peft_model(model, adapters_name)
+        model = load_model(model_name, torch_dtype, quant_type)
+        model.resize_token_embeddings(len(tokenizer))
+
+        model = load_peft_model(model, adapters_name)
     device = get_device()
     model.to(device)
     print(f"Model {model_name} loaded successfully on {device}")
+    draft_model = load_draft_model(draft_name, tokenizer, torch_dtype)
+    if draft_model is not None:
+        draft_model.to(device)
+        print(f"Speculative decoding with the draft model {draft_name}")
     template = "<prompt_template>"
-    run_prompt(model, tokenizer, device, template)
+    run_prompt(model, tokenizer, device, template, PrefixCache(model, tokenizer, device), draft_model)
 
 if __name__ == "__main__":
     model_name = "../model-cache/mistralai/Mistral-7B-Instruct-v0.2"
     adapters_name = "../models/qlora/qlora/gpu-cpu_model/adapter"  # Ensure this path is correctly set before running
+    merged_name = None  # Set to "../models/merged", written by export_merged.py, to load the merged model unquantized
+    draft_name = "../model-cache/draft"  # Optional small model with the same tokenizer, for speculative decoding
     torch_dtype = torch.<compute_dtype>  # Set the appropriate torch data type
     quant_type = '<quant_type>'  # Set the appropriate quantization type
 
     try:
-        main(model_name, adapters_name, torch_dtype, quant_type)
+        main(model_name, adapters_name, torch_dtype, quant_type, merged_name, draft_name)
     except Exception as e:
         print(f"An error occurred: {e}")
         sys.exit(1)
@@ -0,0 +1,237 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+from classify import DATASET, load_labels
+
+DEFAULT_REPORT = "../models/eval-report"
+TINY_TEMPLATE = "### Text: {}\n### The tone is:\n"
+
+def split_dataset(dataset=DATASET, eval_percent=10, field="phrase"):
+    """
+    Splits a JSONL dataset into training and held-out rows by a hash of each row's text, so that a row
+    stays on the same side whatever the order of the file and however many rows are added to it.
+    Args:
+    dataset (str): JSONL file of rows such as {"phrase": ..., "tone": ...}.
+    eval_percent (int): Share of the rows held out, in percent.
+    field (str): The row field hashed.
+    Returns:
+    tuple: The training rows and the held-out rows.
+    """
+    train, held_out = [], []
+    with open(dataset, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                (held_out if zlib.crc32(row[field].encode("utf-8")) % 100 < eval_percent else train).append(row)
+    return train, held_out
+
+def write_split(dataset, directory, eval_percent=10):
+    """Writes the two halves of split_dataset() next to each other, to fine-tune on the training half only."""
+    name = os.path.splitext(os.path.basename(dataset))[0]
+    paths = []
+    for suffix, rows in zip(["train", "eval"], split_dataset(dataset, eval_percent)):
+        paths.append(os.path.join(directory, f"{name}-{suffix}.json"))
+        with open(paths[-1], "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(row) + "\n" for row in rows)
+    return paths
+
+def classification_scores(gold, predicted, labels):
+    """
+    Args:
+    gold (list): The true labels.
+    predicted (list): The predicted labels.
+    labels (list): The label set.
+    Returns:
+    dict: Accuracy, macro-averaged F1 and the F1 of each label.
+    """
+    f1 = {}
+    for label in labels:
+        tp = sum(g == label and p == label for g, p in zip(gold, predicted))
+        fp = sum(g != label and p == label for g, p in zip(gold, predicted))
+        fn = sum(g == label and p != label for g, p in zip(gold, predicted))
+        f1[label] = 2 * tp / (2 * tp + fp + fn) if tp else 0.
+    return {
+        "accuracy": sum(g == p for g, p in zip(gold, predicted)) / len(gold),
+        "macro_f1": sum(f1.values()) / len(f1),
+        "f1": f1,
+    }
+
+def measure_speed(model, tokenizer, device, prompts, new_tokens):
+    """
+    Times the prompt forward pass and greedy decoding, one prompt at a time as the console chat runs.
+    Args:
+    prompts (list): Prompt texts, already in the template.
+    new_tokens (int): Tokens decoded after each prompt, whatever they are.
+    Returns:
+    dict: Mean prefill time in ms and decoding throughput in tokens/s.
+    """
+    import torch
+
+    def sync():
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+
+    prefill, decode = 0., 0.
+    with torch.no_grad():
+        for i, prompt in enumerate([prompts[0]] + prompts):  # the first pass only warms up
+            input_ids = torch.tensor([tokenizer(prompt)["input_ids"]], device=device)
+            sync()
+            started = time.perf_counter()
+            outputs = model(input_ids=input_ids, use_cache=True)
+            sync()
+            prefilled = time.perf_counter()
+            for _ in range(new_tokens):
+                token = outputs.logits[:, -1:].argmax(-1)
+                outputs = model(input_ids=token, past_key_values=outputs.past_key_values, use_cache=True)
+            sync()
+            if i:
+                prefill += prefilled - started
+                decode += time.perf_counter() - prefilled
+    return {
+        "prefill_ms": 1000 * prefill / len(prompts),
+        "decode_tokens_per_sec": new_tokens * len(prompts) / decode if decode else 0.,
+    }
+
+def evaluate_adapter(model_name, adapter_path, dataset, template, eval_percent=10, batch_size=8, speed_prompts=8,
+                     decode_tokens=32, dtype="float16", quant_type="nf4"):
+    """
+    Loads the base model with one adapter (or none) and measures it on the held-out rows. Runs in a
+    fresh process per adapter (see __main__), so that the peak RSS is that adapter's alone.
+    Returns:
+    dict: Accuracy and F1 of the label scoring classification, prefill ms, decode tokens/s and peak memory.
+    """
+    import torch
+    from batch_infer import load_batch_model
+    from classify import LabelScorer
+    from utils import get_device
+
+    started = time.perf_counter()
+    model, tokenizer = load_batch_model(model_name, adapter_path, None, getattr(torch, dtype), quant_type)
+    device = get_device()
+    model.to(device).eval()
+    load_seconds = time.perf_counter() - started
+
+    labels = load_labels(dataset)
+    _, rows = split_dataset(dataset, eval_percent)
+    scorer = LabelScorer(model, tokenizer, device, labels, template)
+    predicted = []
+    for i in range(0, len(rows), batch_size):
+        predicted += [result["label"] for result in scorer.score([row["phrase"] for row in rows[i:i + batch_size]])]
+
+    result = {"load_seconds": load_seconds, **classification_scores([row["tone"] for row in rows], predicted, labels),
+              **measure_speed(model, tokenizer, device, [template.format(row["phrase"]) for row in rows[:speed_prompts]],
+                              decode_tokens),
+              "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+    if torch.cuda.is_available():
+        result["peak_gpu_mib"] = torch.cuda.max_memory_allocated() / 2 ** 20
+    return result
+
+def best_adapter(results):
+    """The adapter with the best macro F1; between equally good ones, the fastest to decode."""
+    return max(results, key=lambda r: (round(r["macro_f1"], 4), r["decode_tokens_per_sec"]))["adapter"]
+
+def write_report(report, prefix):
+    """
+    Writes the report as JSON and as a markdown table of the adapters, best macro F1 first.
+    Returns:
+    tuple: The paths of the JSON and markdown files.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(prefix)), exist_ok=True)
+    with open(prefix + ".json", "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    lines = [f"Held-out rows: {report['eval_rows']} of {report['dataset']}. Best: `{report['best']}`.", "",
+             "| adapter | accuracy | macro F1 | prefill ms | decode tokens/s | peak RSS MiB |",
+             "|---|---|---|---|---|---|"]
+    for r in sorted(report["results"], key=lambda r: -r["macro_f1"]):
+        lines.append(f"| {r['adapter']} | {r['accuracy']:.1%} | {r['macro_f1']:.3f} | {r['prefill_ms']:.1f} "
+                     f"| {r['decode_tokens_per_sec']:.1f} | {r['peak_rss_mib']:.0f} |")
+    with open(prefix + ".md", "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return prefix + ".json", prefix + ".md"
+
+def build_tiny_checkpoints(directory, dataset=DATASET, eval_percent=10):
+    """
+    For CI: a tiny base model trained on the phrases of the training rows, and LoRA checkpoints
+    fine-tuned on those rows in the template after 50, 150 and 400 steps. Takes under a minute on CPU.
+    Returns:
+    tuple: The base model directory and the adapters directory.
+    """
+    from tiny_model import TEXT_TEMPLATE, build_tiny_model, train_tiny_adapters
+    train, _ = split_dataset(dataset, eval_percent)
+    model_path = build_tiny_model(os.path.join(directory, "model"), dataset, train_steps=800,
+                                  examples=[row["phrase"] for row in train])
+    adapters_dir = os.path.join(directory, "adapters")
+    train_tiny_adapters(model_path, adapters_dir, [TEXT_TEMPLATE.format(**row) for row in train])
+    return model_path, adapters_dir
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure the accuracy and speed of every adapter checkpoint on held-out data.')
+    parser.add_argument('--adapters-dir', default="../models", help='Folder searched for adapter checkpoints')
+    parser.add_argument('--model', default="../model-cache/mistralai/Mistral-7B-Instruct-v0.2", help='Base model path')
+    parser.add_argument('--dataset', default=DATASET, help='JSONL dataset of phrase/tone rows')
+    parser.add_argument('--eval-percent', type=int, default=10, help='Share of the rows held out, in percent')
+    parser.add_argument('--template', default="<prompt_template>", help='Prompt template with a {} field')
+    parser.add_argument('--no-base', action='store_true', help='Do not evaluate the base model without adapter')
+    parser.add_argument('--batch-size', type=int, default=8, help='Texts scored per forward pass')
+    parser.add_argument('--speed-prompts', type=int, default=8, help='Held-out prompts timed for prefill and decoding')
+    parser.add_argument('--decode-tokens', type=int, default=32, help='Tokens decoded after each timed prompt')
+    parser.add_argument('--output', default=DEFAULT_REPORT, help='Report path, without the .json and .md extensions')
+    parser.add_argument('--dtype', default="<compute_dtype>", help='Data type of the model weights, e.g. float16')
+    parser.add_argument('--quant-type', default="<quant_type>", help='Quantization type on GPU, nf4 or fp4')
+    parser.add_argument('--write-split', default=None, metavar='DIR',
+                        help='Write the training and held-out rows to DIR as JSONL and exit')
+    parser.add_argument('--tiny', action='store_true',
+                        help='Evaluate tiny checkpoints trained on CPU instead, e.g. in CI')
+    parser.add_argument('--child', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(evaluate_adapter(**json.loads(args.child))))
+        sys.exit(0)
+
+    if args.write_split:
+        for path in write_split(args.dataset, args.write_split, args.eval_percent):
+            print(f"Wrote {path}")
+        sys.exit(0)
+
+    from adapters import BASE, discover_adapters
+    from utils import natural_sort_key
+
+    if args.tiny:
+        args.model, args.adapters_dir = build_tiny_checkpoints(tempfile.mkdtemp(), args.dataset, args.eval_percent)
+        args.template, args.dtype = TINY_TEMPLATE, "float32"
+    adapters = discover_adapters(args.adapters_dir)
+    names = ([] if args.no_base else [BASE]) + sorted(adapters, key=natural_sort_key)
+    if not adapters:
+        print(f"No adapters found below {args.adapters_dir}")
+
+    results = []
+    for name in names:
+        config = dict(model_name=args.model, adapter_path=adapters.get(name, ""), dataset=args.dataset,
+                      template=args.template, eval_percent=args.eval_percent, batch_size=args.batch_size,
+                      speed_prompts=args.speed_prompts, decode_tokens=args.decode_tokens, dtype=args.dtype,
+                      quant_type=args.quant_type)
+        # A fresh process per adapter, so peak RSS and caches are not shared between them
+        out = subprocess.run([sys.executable, __file__, "--child", json.dumps(config)],
+                             stdout=subprocess.PIPE, text=True, check=True).stdout
+        results.append({"adapter": name, "path": adapters.get(name), **json.loads(out.strip().splitlines()[-1])})
+        r = results[-1]
+        print(f"{name}: accuracy {r['accuracy']:.1%}, macro F1 {r['macro_f1']:.3f}, prefill {r['prefill_ms']:.1f} ms, "
+              f"{r['decode_tokens_per_sec']:.1f} tokens/s, peak RSS {r['peak_rss_mib']:.0f} MiB")
+
+    _, held_out = split_dataset(args.dataset, args.eval_percent)
+    report = {"dataset": args.dataset, "eval_percent": args.eval_percent, "eval_rows": len(held_out),
+              "labels": load_labels(args.dataset), "model": args.model, "results": results,
+              "best": best_adapter(results) if results else None}
+    for path in write_report(report, args.output):
+        print(f"Wrote {path}")
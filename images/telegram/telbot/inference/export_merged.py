@@ -0,0 +1,56 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import argparse
+import json
+import os
+import time
+
+import torch
+from peft import PeftModel
+from transformers import AutoModelForCausalLM
+
+from utils import MERGE_INFO, adapter_fingerprint, load_tokenizer
+
+DEFAULT_OUTPUT = "../models/merged"
+
+def export_merged(model_name, adapters_name, output_dir=DEFAULT_OUTPUT, torch_dtype=torch.float16):
+    """
+    Merges a LoRA adapter into the base model weights once and saves the result, with the resized
+    embeddings and the padded tokenizer, as safetensors that load_merged_model() can memory-map.
+    The base weights are loaded unquantized, since LoRA deltas cannot be added to 4-bit weights
+    without losing precision. The adapter path and the hash of its weights are saved along, so that
+    find_merged_model() only uses the export in place of that same adapter.
+    Args:
+    model_name (str): The base model path.
+    adapters_name (str): The adapter path.
+    output_dir (str): Where to save the merged model and tokenizer.
+    torch_dtype (torch.dtype): The data type of the saved weights.
+    Returns:
+    str: The output directory.
+    """
+    started = time.perf_counter()
+    tokenizer = load_tokenizer(model_name)
+    model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch_dtype, low_cpu_mem_usage=True,
+                                                 trust_remote_code=True)
+    model.resize_token_embeddings(len(tokenizer))
+    model = PeftModel.from_pretrained(model, adapters_name).merge_and_unload()
+
+    os.makedirs(output_dir, exist_ok=True)
+    model.save_pretrained(output_dir, safe_serialization=True)
+    tokenizer.save_pretrained(output_dir)
+    with open(os.path.join(output_dir, MERGE_INFO), "w", encoding="utf-8") as f:
+        json.dump({**adapter_fingerprint(adapters_name), "base_model": os.path.abspath(model_name),
+                   "dtype": str(torch_dtype).replace("torch.", "")}, f, indent=2)
+    print(f"Merged {adapters_name} into {model_name} and saved it to {output_dir} "
+          f"in {time.perf_counter() - started:.1f} s")
+    return output_dir
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Merge a LoRA adapter into its base model for fast loading.')
+    parser.add_argument('--model', default="../model-cache/mistralai/Mistral-7B-Instruct-v0.2", help='Base model path')
+    parser.add_argument('--adapter', default="../models/qlora/qlora/gpu-cpu_model/adapter", help='Adapter path')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='Output directory')
+    parser.add_argument('--dtype', default="float16", choices=["float16", "bfloat16", "float32"])
+    args = parser.parse_args()
+    export_merged(args.model, args.adapter, args.output, getattr(torch, args.dtype))
@@ -1,17 +1,28 @@
 # Import necessary libraries
-from threading import Thread
+import time
+started = time.perf_counter()  # time-to-listen and time-to-ready are measured from here
 import argparse
+import asyncio
 import os
 import torch
 import gradio as gr
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, TextIteratorStreamer
-from utils import check_adapter_path, load_model, load_peft_model, load_tokenizer, get_device
+from transformers import AutoConfig, AutoTokenizer, AutoModelForSeq2SeqLM
+from scheduler import AsyncEvents, GenerationScheduler, aiter_choices
+from classify import LabelScorer, load_labels
+from prefix_cache import PrefixCache
+from chat_history import ChatPromptBuilder
+from prepare import PromptTooLong, model_context_length, prepare_ids, prepare_prompt
+from admission import AdmissionController, Overloaded
+from adapters import BASE, AdapterRegistry, discover_adapters
+from startup import BackgroundLoader, NotReady
+from onnx_engine import ADAPTER_WEIGHTS, OnnxCausalLM, OnnxGenerationScheduler, discover_onnx_adapters, find_onnx_model
+from utils import check_adapter_path, find_merged_model, load_draft_model, load_merged_model, load_model, load_tokenizer, get_device
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse
 from sse_starlette.sse import EventSourceResponse
 import json
 from pydantic import BaseModel, Field
-from typing import List
-import time
+from typing import List, Optional, Union
 import uuid
 
 # Create the parser
@@ -20,6 +31,31 @@ parser = argparse.ArgumentParser(description='Check model usage.')
 # Add the arguments
 parser.add_argument('--baseonly', action='store_true', 
                     help='A boolean switch to indicate base only mode')
+parser.add_argument('--merged', action='store_true',
+                    help='Serve the model written by export_merged.py, unquantized, instead of the base model and '
+                         'adapters; no other adapter is served')
+parser.add_argument('--max-batch-size', type=int, default=8,
+                    help='Maximum number of requests decoded together by the scheduler')
+parser.add_argument('--max-in-flight', type=int, default=None,
+                    help='Maximum number of generations running at once (defaults to --max-batch-size)')
+parser.add_argument('--max-queued', type=int, default=32,
+                    help='Maximum number of requests waiting for a generation slot; more are rejected with 429')
+parser.add_argument('--queue-timeout', type=float, default=30.,
+                    help='Seconds a request may wait for a generation slot before it is rejected')
+parser.add_argument('--adapters-dir', default="../models",
+                    help='Folder searched for LoRA adapters, selected per request with the model field')
+parser.add_argument('--max-adapters', type=int, default=4,
+                    help='Maximum number of adapters kept in memory at once')
+parser.add_argument('--backend', choices=["torch", "onnx"], default="torch",
+                    help='torch runs the PyTorch model; onnx runs the Olive ONNX model with onnxruntime on CPU')
+parser.add_argument('--draft-tokens', type=int, default=4,
+                    help='Tokens the draft model proposes per step for requests with speculative decoding')
+parser.add_argument('--labels', default=None,
+                    help='Comma separated labels for /v1/classify (defaults to the tones of the dataset)')
+parser.add_argument('--ready-timeout', type=float, default=60.,
+                    help='Seconds a request arriving while the model loads waits before it gets a 503')
+parser.add_argument('--context-length', type=int, default=None,
+                    help='Maximum prompt plus answer tokens (defaults to the limit of the model and tokenizer)')
 
 # Execute the parse_args() method
 args = parser.parse_args()
@@ -27,29 +63,133 @@ args = parser.parse_args()
 # Define model and adapter paths, data type, and quantization type
 model_name = "../model-cache/mistralai/Mistral-7B-Instruct-v0.2"
 adapters_name = "../models/qlora/qlora/gpu-cpu_model/adapter"  # Ensure this path is correctly set before running
+merged_name = "../models/merged"  # Written by export_merged.py
+draft_name = "../model-cache/draft"  # Optional small model with the same tokenizer, for speculative decoding
+onnx_name = "../models/qlora"  # Written by the Olive workflow; the most recent model.onnx below it is used
+dataset_name = "../dataset/dataset-classification.json"  # Its labels are the default candidates of /v1/classify
 torch_dtype = torch.<compute_dtype>  # Set the appropriate torch data type
 quant_type = '<quant_type>'  # Set the appropriate quantization type
 
 
-# Display device and CPU thread information
-print("Running on device:", get_device())
-print("CPU threads:", torch.get_num_threads())
-
-# Load model and tokenizer, and set up the model
 check_adapter_path(adapters_name)
-tokenizer = load_tokenizer(model_name)
 
-model = load_model(model_name, torch_dtype, quant_type)
-model.resize_token_embeddings(len(tokenizer))
+# With --backend onnx, the model is the Olive output and its adapters are the extracted LoRA weights
+onnx_model = None
+if args.backend == "onnx":
+    onnx_model = find_onnx_model(onnx_name)
+    if onnx_model is None:
+        raise ValueError(f"No model.onnx found below {onnx_name}, run the Olive workflow first")
+    adapters_name = os.path.join(onnx_model, ADAPTER_WEIGHTS)
+
+# With --merged, an export of the base model with adapters_name merged in loads much faster than the
+# base model plus adapter, but unquantized. It already is the fine-tuned model, so no other adapter is applied to it.
+merged = None
+if args.merged and not args.baseonly and not onnx_model:
+    merged = find_merged_model(merged_name, adapters_name)
+    if merged is None:
+        print("Loading the base model and adapters instead of the merged model")
+
+# Every adapter found is served on top of the same base model; requests pick one with the
+# model field, and adapters_name is used when they do not.
+adapters = {} if args.baseonly or merged else (discover_onnx_adapters if onnx_model else discover_adapters)(args.adapters_dir)
+default_adapter = BASE
+if os.path.exists(adapters_name) and not args.baseonly and not merged:
+    default_adapter = next((name for name, path in adapters.items() if os.path.samefile(path, adapters_name)), "default")
+    adapters.setdefault(default_adapter, adapters_name)
+adapter_names = [BASE] + list(adapters)
+print(f"Adapters available: {', '.join(adapter_names)} (default: {default_adapter})")
 
-usingAdapter = False
-if os.path.exists(adapters_name) and not args.baseonly:
-    usingAdapter = True
-    model = load_peft_model(model, adapters_name)
+labels = args.labels.split(",") if args.labels else load_labels(dataset_name) if os.path.exists(dataset_name) else []
 
+def uses_template(adapter):
+    # Fine-tuned models are prompted with the fine-tuning template: any adapter, or the merged model
+    return adapter != BASE or merged is not None
+
+# The REST API and the web UI share one admission limit, so overload turns into fast
+# rejections rather than a pile of generations that time out or run out of memory.
+admission = AdmissionController(max_in_flight=args.max_in_flight or args.max_batch_size,
+                                max_queued=args.max_queued, queue_timeout=args.queue_timeout)
+
+# Set by load_model_state() once the model is loaded
+tokenizer = None
+adapter_registry = None
+scheduler = None
+prompt_builder = None
+adapter_prompt_builder = None
+context_length = None
+label_scorer = None
 device = get_device()
 
-print(f"Model {model_name} loaded successfully on {device}")
+def load_model_state():
+    """Loads the tokenizer, model and adapters, and starts the scheduler. Runs in the background."""
+    global tokenizer, adapter_registry, scheduler, prompt_builder, adapter_prompt_builder, context_length, label_scorer
+
+    # Display device and CPU thread information
+    print("Running on device:", device)
+    print("CPU threads:", torch.get_num_threads())
+
+    if onnx_model:
+        # Same scheduler interface, so the API and the web UI below are unchanged
+        print(f"Loading the ONNX model from {onnx_model} with onnxruntime on CPU")
+        tokenizer = load_tokenizer(onnx_model)
+        model = OnnxCausalLM(onnx_model, adapters, max_adapters=args.max_adapters, default_adapter=default_adapter)
+        adapter_registry = model.adapters
+        adapter_registry.activate(default_adapter)
+        scheduler = OnnxGenerationScheduler(model, tokenizer, max_batch_size=args.max_batch_size)
+        prompt_builder = ChatPromptBuilder(tokenizer)
+        adapter_prompt_builder = ChatPromptBuilder(tokenizer, template="<prompt_template>")
+        config = AutoConfig.from_pretrained(onnx_model) if os.path.exists(os.path.join(onnx_model, "config.json")) else None
+        context_length = model_context_length(tokenizer, config, args.context_length)
+        label_scorer = LabelScorer(model, tokenizer, device, labels, "<prompt_template>")
+        return
+
+    # Load model and tokenizer, and set up the model
+    if merged:
+        print(f"Loading the merged model from {merged}, unquantized in {torch_dtype}")
+        tokenizer = load_tokenizer(merged)
+        model = load_merged_model(merged, torch_dtype)
+    else:
+        tokenizer = load_tokenizer(model_name)
+        model = load_model(model_name, torch_dtype, quant_type)
+        model.resize_token_embeddings(len(tokenizer))
+
+    adapter_registry = AdapterRegistry(model, adapters, max_loaded=args.max_adapters, default=default_adapter)
+    adapter_registry.activate(default_adapter)
+    print(f"Model {model_name} loaded successfully on {device}")
+
+    # Requests that ask for speculative decoding get tokens drafted by this model and verified several at a time
+    draft_model = load_draft_model(draft_name, tokenizer, torch_dtype)
+    if draft_model is None:
+        print(f"No draft model in {draft_name}, speculative requests are decoded normally")
+
+    # All requests share one model through the continuous batching scheduler, which decodes
+    # one token for every active request per forward pass instead of one thread per request.
+    # The key/values of the prompt template prefix are computed once and reused by every request.
+    scheduler = GenerationScheduler(model, tokenizer, device, max_batch_size=args.max_batch_size,
+                                    prefix_cache=PrefixCache(model, tokenizer, device), adapters=adapter_registry,
+                                    draft=draft_model, draft_tokens=args.draft_tokens)
+
+    # Renders whole conversations with the chat template, reusing the tokens of earlier turns
+    prompt_builder = ChatPromptBuilder(tokenizer)
+    # and conversations with an adapter in its fine-tuning template, one user message after the other
+    adapter_prompt_builder = ChatPromptBuilder(tokenizer, template="<prompt_template>")
+    context_length = model_context_length(tokenizer, model.config, args.context_length)
+    print(f"Context length: {context_length} tokens")
+
+    # Classifies by scoring the labels in the fine-tuning template, in one forward pass instead of a generation
+    label_scorer = LabelScorer(model, tokenizer, device, labels, "<prompt_template>")
+
+def warm_up():
+    """Runs a short generation so the first request does not pay for kernel setup and lazy allocations."""
+    template = "<prompt_template>"
+    text = "Hello"
+    prompt = template.format(text) if uses_template(default_adapter) else text
+    for _ in scheduler.submit(tokenizer(prompt)["input_ids"], max_new_tokens=4, do_sample=False, timeout=600.,
+                              template=template if uses_template(default_adapter) else None, adapter=default_adapter):
+        pass
+
+# The model loads in the background once the server is up; /readyz reports when it is done
+loader = BackgroundLoader(load_model_state, warm_up, started=started)
 
 class ChatCompletionsRequestMessage(BaseModel):
     role: str
@@ -61,101 +201,270 @@ class ChatCompletionsRequest(BaseModel):
     max_tokens: int = Field(256)
     temperature: float = Field(1)
     top_p: float = Field(1)
+    n: int = Field(1, ge=1, le=16)
+    model: Optional[str] = Field(None)
+    stream_options: Optional[dict] = Field(None)
+    speculative: bool = Field(False)
+
+class ClassifyRequest(BaseModel):
+    input: Union[str, List[str]]
+    labels: Optional[List[str]] = Field(None)
+    model: Optional[str] = Field(None)
 
-def calculate_token_count(tokenizer: AutoTokenizer, input: str):
-    result = tokenizer(input)
-    if 'input_ids' not in result:
-        return 0
-    return len(result['input_ids'])
+MAX_CLASSIFY_INPUTS = 64  # Texts scored in one forward pass, times the number of labels
 
 # Host the model as an OpenAI chat completion compatible RESTful API
-def inference_generator(request: ChatCompletionsRequest):
+def prepare_request(request: ChatCompletionsRequest):
+    """
+    Validates a request and tokenizes its prompt once, before any response is sent.
+    Raises:
+    HTTPException: 400 if there is no user message or the prompt does not fit in the context,
+    404 if the requested model is not a known adapter.
+    """
     template = "<prompt_template>"
+    try:
+        adapter = adapter_registry.resolve(request.model)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"The model '{request.model}' does not exist")
+    usingAdapter = uses_template(adapter)
     user_messages = list(filter(lambda m: m.role == "user", request.messages))
     if len(user_messages) == 0:
         raise HTTPException(status_code=400, detail="'messages' should contain at least 1 user message")
     input_message = user_messages[-1]
+    print(f"Prompt: '{input_message.content}'")
 
-    prompt = template.format(input_message.content) if usingAdapter else input_message.content
-    context_length = tokenizer.model_max_length
-    input_token_count = calculate_token_count(tokenizer, prompt)
-    
-    print(f"Prompt: '{prompt}'")
+    try:
+        # The whole conversation, with the oldest turns dropped to leave room for the answer: in the
+        # chat template for the base model, and with each user message in the fine-tuning template
+        # for an adapter, which was fine-tuned on single texts in it
+        messages = [{"role": m.role, "content": m.content} for m in request.messages]
+        builder = adapter_prompt_builder if usingAdapter else prompt_builder
+        input_ids, dropped = builder.truncate(messages, context_length - max(request.max_tokens, 0))
+        if dropped:
+            print(f"Dropped the {dropped} oldest messages to fit the context")
+        return prepare_ids(input_ids, request.max_tokens, context_length, template if usingAdapter else None,
+                           adapter=adapter)
+    except PromptTooLong as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    if request.max_tokens > 0:
-        max_new_tokens = min(context_length - input_token_count, request.max_tokens)
-    else:
-        max_new_tokens = context_length - input_token_count
+async def inference_generator(request: ChatCompletionsRequest, prepared, granted: float):
+    try:
+        async for event in generate_events(request, prepared):
+            yield event
+    finally:
+        admission.release(granted)
 
-    model_inputs = tokenizer(prompt, return_tensors="pt")
-    model_inputs = model_inputs.to(device)
-
-    # Generate text in a separate thread
-    streamer = TextIteratorStreamer(tokenizer, timeout=10., skip_prompt=True, skip_special_tokens=True)
-    generate_kwargs = dict(
-        model_inputs,
-        streamer=streamer,
-        max_new_tokens=max_new_tokens,
+def generate_choices(request: ChatCompletionsRequest, prepared):
+    # Queue the request; the scheduler prefills the prompt once for all n choices and hands
+    # their text to the event loop as it is decoded, so an open stream holds no thread
+    return scheduler.submit_choices(
+        prepared.input_ids,
+        max_new_tokens=prepared.max_new_tokens,
+        n=request.n,
+        events=AsyncEvents(),
+        speculative=request.speculative,
         do_sample=True,
         top_p=request.top_p,
         temperature=request.temperature,
-        pad_token_id=tokenizer.pad_token_id,
-        eos_token_id=tokenizer.eos_token_id,
+        timeout=10.,
+        template=prepared.template,
+        adapter=prepared.adapter,
     )
-    t = Thread(target=model.generate, kwargs=generate_kwargs)
-    t.start()
+
+def usage(choices, prompt_tokens):
+    completion_tokens = sum(len(choice.generated) for choice in choices)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+async def generate_events(request: ChatCompletionsRequest, prepared):
+    choices = generate_choices(request, prepared)
 
     event_id = str(uuid.uuid4())
-    for new_text in streamer:
+    def chunk(choice_list, **extra):
         event = {
             "id": event_id,
             "object": "chat.completion.chunk",
             "created": int(time.time()),
-            "model": os.path.basename(model_name),
-            "choices": [
-                {
-                    "index": 0,
-                    "delta": {
-                        "role": "assistant",
-                        "content": new_text,
-                    },
-                    "logprobs": None,
-                    "finish_reason":None
-                }
-            ]
+            "model": request.model or os.path.basename(model_name),
+            "choices": choice_list,
+            **extra,
         }
+        return dict(data=json.dumps(event))
+
+    # If the client disconnects, the stream is cancelled and so are the unfinished choices
+    async for index, new_text in aiter_choices(choices):
+        yield chunk([
+            {
+                "index": index,
+                "delta": {
+                    "role": "assistant",
+                    "content": new_text,
+                },
+                "logprobs": None,
+                "finish_reason":None
+            }
+        ])
+
+    # One last chunk per choice with its finish_reason, the usage if asked for, then the terminator
+    yield chunk([{"index": c.index, "delta": {}, "logprobs": None, "finish_reason": c.finish_reason} for c in choices])
+    if (request.stream_options or {}).get("include_usage"):
+        yield chunk([], usage=usage(choices, prepared.prompt_tokens))
+    yield dict(data="[DONE]")
 
-        data = json.dumps(event)
-        yield dict(data=data)
+async def generate_completion(request: ChatCompletionsRequest, prepared):
+    choices = generate_choices(request, prepared)
+    texts = [""] * len(choices)
+    async for index, new_text in aiter_choices(choices):
+        texts[index] += new_text
+    return {
+        "id": str(uuid.uuid4()),
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.model or os.path.basename(model_name),
+        "choices": [
+            {
+                "index": c.index,
+                "message": {"role": "assistant", "content": text},
+                "logprobs": None,
+                "finish_reason": c.finish_reason,
+            }
+            for c, text in zip(choices, texts)
+        ],
+        "usage": usage(choices, prepared.prompt_tokens),
+    }
 
 def configure_api(app: FastAPI):
     @app.post("/v1/chat/completions")
-    def chat_completion(request: ChatCompletionsRequest):
+    async def chat_completion(request: ChatCompletionsRequest):
+        # Requests that arrive while the model is loading wait for it, up to --ready-timeout
+        try:
+            if not loader.ready:
+                await asyncio.to_thread(loader.wait, args.ready_timeout)
+        except NotReady as e:
+            return JSONResponse(status_code=503, content={"detail": str(e)},
+                                headers={"Retry-After": str(e.retry_after)})
+        prepared = prepare_request(request)
+        # Wait for a slot before the response starts, so a rejection is still a plain 429
+        try:
+            granted = await admission.acquire_async()
+        except Overloaded as e:
+            return JSONResponse(status_code=429, content={"detail": str(e)},
+                                headers={"Retry-After": str(e.retry_after)})
+        if not request.stream:
+            try:
+                return await generate_completion(request, prepared)
+            except asyncio.TimeoutError:
+                # No text within the request timeout: the scheduler is too busy to get to this request
+                return JSONResponse(status_code=503, content={"detail": "Timed out waiting for the model"},
+                                    headers={"Retry-After": str(admission.retry_after())})
+            finally:
+                admission.release(granted)
         # "\n" is the standard way but sse_starlette defaults to \r\n
         # https://developer.mozilla.org/en-US/docs/Web/API/Server-sent_events/Using_server-sent_events#sending_events_from_the_server
-        return EventSourceResponse(inference_generator(request), sep="\n")
+        return EventSourceResponse(inference_generator(request, prepared, granted), sep="\n")
+
+    @app.post("/v1/classify")
+    async def classify(request: ClassifyRequest):
+        try:
+            if not loader.ready:
+                await asyncio.to_thread(loader.wait, args.ready_timeout)
+        except NotReady as e:
+            return JSONResponse(status_code=503, content={"detail": str(e)},
+                                headers={"Retry-After": str(e.retry_after)})
+        try:
+            adapter = adapter_registry.resolve(request.model)
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"The model '{request.model}' does not exist")
+        texts = [request.input] if isinstance(request.input, str) else request.input
+        candidates = request.labels or labels
+        if not texts or len(texts) > MAX_CLASSIFY_INPUTS:
+            raise HTTPException(status_code=400, detail=f"'input' should hold 1 to {MAX_CLASSIFY_INPUTS} texts")
+        if not candidates:
+            raise HTTPException(status_code=400, detail="'labels' should contain at least 1 label")
+        try:
+            granted = await admission.acquire_async()
+        except Overloaded as e:
+            return JSONResponse(status_code=429, content={"detail": str(e)},
+                                headers={"Retry-After": str(e.retry_after)})
+        try:
+            # The forward pass runs on the scheduler thread between decoding steps, with the adapter active
+            results = await asyncio.wrap_future(
+                scheduler.run(lambda: label_scorer.score(texts, candidates, adapter), adapter))
+        finally:
+            admission.release(granted)
+        return {
+            "object": "list",
+            "model": request.model or os.path.basename(model_name),
+            "data": [{"index": i, "label": result["label"], "probabilities": result["probabilities"]}
+                     for i, result in enumerate(results)],
+        }
+
+    @app.get("/v1/models")
+    def list_models():
+        return {"object": "list", "data": [{"id": name, "object": "model", "owned_by": "local"}
+                                           for name in adapter_names]}
+
+    @app.get("/healthz")
+    def healthz():
+        # Liveness: the process is up and serving HTTP, whether or not the model is loaded
+        return {"status": "ok"}
+
+    @app.get("/readyz")
+    def readyz():
+        # Readiness: the model is loaded and warmed up
+        return JSONResponse(status_code=200 if loader.ready else 503, content=loader.status())
+
+    @app.get("/metrics")
+    def metrics():
+        if not loader.ready:
+            return {**admission.metrics(), "startup": loader.status()}
+        return {**admission.metrics(), "scheduler_queue_depth": scheduler.queue_depth(), "decode_steps": scheduler.steps,
+                "chat_history": prompt_builder.stats(), "adapter_chat_history": adapter_prompt_builder.stats(),
+                "adapters": adapter_registry.stats(),
+                "speculative": scheduler.speculative_stats(), "startup": loader.status()}
+
+    @app.on_event("startup")
+    def start_loading():
+        print(f"Listening after {time.perf_counter() - started:.1f} s, loading the model in the background")
+        loader.start()
 
 # Host the model as a Gradio web app
-def run_generation(user_text, top_p, temperature, top_k, max_new_tokens):
+def run_generation(user_text, top_p, temperature, top_k, max_new_tokens, adapter, speculative):
+    try:
+        loader.wait(args.ready_timeout)
+    except NotReady as e:
+        raise gr.Error(str(e))
+    try:
+        with admission.slot():
+            yield from generate_output(user_text, top_p, temperature, top_k, max_new_tokens, adapter, speculative)
+    except Overloaded as e:
+        raise gr.Error(f"The server is busy, please try again in {e.retry_after} seconds.")
+
+def generate_output(user_text, top_p, temperature, top_k, max_new_tokens, adapter, speculative):
     template = "<prompt_template>"
-    model_inputs = tokenizer(template.format(user_text) if usingAdapter else user_text, return_tensors="pt")
-    model_inputs = model_inputs.to(device)
-
-    # Generate text in a separate thread
-    streamer = TextIteratorStreamer(tokenizer, timeout=10., skip_prompt=True, skip_special_tokens=True)
-    generate_kwargs = dict(
-        model_inputs,
-        streamer=streamer,
-        max_new_tokens=max_new_tokens,
+    usingAdapter = uses_template(adapter)
+    try:
+        prepared = prepare_prompt(tokenizer, user_text, max_new_tokens, template if usingAdapter else None,
+                                  context_length, adapter=adapter)
+    except PromptTooLong as e:
+        raise gr.Error(str(e))
+
+    # Queue the request; the scheduler streams the text back as it is decoded
+    streamer = scheduler.submit(
+        prepared.input_ids,
+        max_new_tokens=prepared.max_new_tokens,
         do_sample=True,
         top_p=top_p,
         temperature=float(temperature),
         top_k=top_k,
-        pad_token_id=tokenizer.pad_token_id,
-        eos_token_id=tokenizer.eos_token_id
+        timeout=10.,
+        template=prepared.template,
+        adapter=prepared.adapter,
+        speculative=speculative,
     )
-    t = Thread(target=model.generate, kwargs=generate_kwargs)
-    t.start()
 
     # Retrieve and yield the generated text
     model_output = ""
@@ -178,8 +487,10 @@ def configure_gradio(app: FastAPI):
                 top_p = gr.Slider(minimum=0.05, maximum=1.0, value=0.95, step=0.05, label="Top-p (nucleus sampling)")
                 top_k = gr.Slider(minimum=1, maximum=50, value=50, step=1, label="Top-k")
                 temperature = gr.Slider(minimum=0.1, maximum=5.0, value=0.8, step=0.1, label="Temperature")
+                adapter = gr.Dropdown(choices=adapter_names, value=default_adapter, label="Adapter")
+                speculative = gr.Checkbox(value=False, label="Speculative decoding")
 
-        params = [user_text, top_p, temperature, top_k, max_new_tokens]
+        params = [user_text, top_p, temperature, top_k, max_new_tokens, adapter, speculative]
         user_text.submit(run_generation, params, model_output)
         button_submit.click(run_generation, params, model_output)
 
@@ -0,0 +1,124 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import argparse
+import json
+import os
+import threading
+import time
+
+from tiny_model import DATASET, build_tiny_model
+
+def load_prompts(dataset=DATASET, template="### Text: {}\n### The tone is:\n"):
+    with open(dataset, encoding="utf-8") as f:
+        return [template.format(json.loads(line)["phrase"]) for line in f if line.strip()]
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def run_clients(clients, requests_per_client, send):
+    """
+    Runs `clients` threads that each send `requests_per_client` requests back to back.
+    Args:
+    clients (int): Number of concurrent clients.
+    requests_per_client (int): Requests sent by each client.
+    send (callable): send(i) performs request i and returns the number of generated tokens.
+    Returns:
+    dict: Throughput and latency figures for the run.
+    """
+    latencies, tokens = [], []
+    lock = threading.Lock()
+
+    def client(c):
+        for r in range(requests_per_client):
+            started = time.perf_counter()
+            n = send(c * requests_per_client + r)
+            with lock:
+                latencies.append(time.perf_counter() - started)
+                tokens.append(n)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    return {
+        "clients": clients,
+        "requests": len(latencies),
+        "tokens_per_sec": sum(tokens) / elapsed,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+    }
+
+def in_process_senders(model_path, prompts, max_new_tokens, max_batch_size):
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    from scheduler import GenerationScheduler
+
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModelForCausalLM.from_pretrained(model_path).eval()
+    device = model.device
+    encoded = [tokenizer(p)["input_ids"] for p in prompts]
+
+    def thread_per_request(i):
+        # What gradio_chat.py did before the scheduler: one model.generate() call per request.
+        input_ids = torch.tensor([encoded[i % len(encoded)]], device=device)
+        with torch.no_grad():
+            output = model.generate(input_ids, max_new_tokens=max_new_tokens, do_sample=True, top_p=0.95,
+                                    pad_token_id=tokenizer.eos_token_id)
+        return output.shape[1] - input_ids.shape[1]
+
+    scheduler = GenerationScheduler(model, tokenizer, device, max_batch_size=max_batch_size)
+
+    def batched(i):
+        request = scheduler.submit(encoded[i % len(encoded)], max_new_tokens=max_new_tokens, top_p=0.95)
+        for _ in request:
+            pass
+        return len(request.generated)
+
+    return {"thread per request": thread_per_request, "scheduler": batched}
+
+def http_sender(url, prompts, max_new_tokens):
+    import requests
+    session = requests.Session()
+    url = url.rstrip("/") + "/v1/chat/completions"
+
+    def send(i):
+        body = {"messages": [{"role": "user", "content": prompts[i % len(prompts)]}],
+                "max_tokens": max_new_tokens, "stream": True}
+        chunks = 0
+        with session.post(url, json=body, stream=True, timeout=300) as response:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if line and line.startswith("data:") and line[5:].strip() != "[DONE]":
+                    chunks += 1
+        return chunks
+
+    return {url: send}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load test generation at several concurrency levels.')
+    parser.add_argument('--model', default=None, help='Model directory (defaults to a tiny random CPU model)')
+    parser.add_argument('--url', default=None, help='Test a running gradio_chat.py server instead, e.g. http://127.0.0.1:7860')
+    parser.add_argument('--clients', default="1,4,16", help='Comma separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=4, help='Requests per client')
+    parser.add_argument('--max-new-tokens', type=int, default=32)
+    parser.add_argument('--max-batch-size', type=int, default=16)
+    args = parser.parse_args()
+
+    prompts = load_prompts()
+    if args.url:
+        senders = http_sender(args.url, prompts, args.max_new_tokens)
+    else:
+        senders = in_process_senders(args.model or build_tiny_model(), prompts, args.max_new_tokens, args.max_batch_size)
+
+    print(f"{'mode':<20} {'clients':>7} {'requests':>8} {'tokens/s':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, send in senders.items():
+        send(0)  # warm up
+        for clients in map(int, args.clients.split(",")):
+            result = run_clients(clients, args.requests, send)
+            print(f"{name:<20} {clients:>7} {result['requests']:>8} {result['tokens_per_sec']:>9.1f} "
+                  f"{result['p50_ms']:>8.0f} {result['p95_ms']:>8.0f}")
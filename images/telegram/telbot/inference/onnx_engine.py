@@ -0,0 +1,235 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import collections
+import os
+import threading
+import time
+
+import numpy as np
+import onnxruntime as ort
+import torch
+
+from adapters import BASE
+from scheduler import GenerationScheduler
+
+MODEL_FILE = "model.onnx"
+# Written next to the model by Olive's ExtractAdapters pass: the LoRA weights, keyed by the model inputs they feed
+ADAPTER_WEIGHTS = "adapter_weights.npz"
+
+_NUMPY_TYPES = {"tensor(float)": np.float32, "tensor(float16)": np.float16, "tensor(int64)": np.int64,
+                "tensor(int32)": np.int32}
+
+def find_onnx_model(directory):
+    """
+    Finds the most recent ONNX model written by the Olive workflow (finetuning/olive-config.json).
+    Args:
+    directory (str): The Olive output directory, e.g. "../models/qlora".
+    Returns:
+    str: The folder containing model.onnx, or None if there is none.
+    """
+    found = []
+    if not os.path.isdir(directory):
+        return None
+    for root, dirs, files in os.walk(directory):
+        if MODEL_FILE in files:
+            found.append((os.path.getmtime(os.path.join(root, MODEL_FILE)), root))
+    return max(found)[1] if found else None
+
+def discover_onnx_adapters(directory):
+    """
+    Finds every adapter weights file (.npz, as written by ExtractAdapters or `olive convert-adapters`)
+    below a directory.
+    Args:
+    directory (str): The folder to search, e.g. "../models".
+    Returns:
+    dict: Adapter name (the file path relative to directory, without .npz, with "/" separators) to file path.
+    """
+    adapters = {}
+    if not os.path.isdir(directory):
+        return adapters
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for file in sorted(files):
+            if file.endswith(".npz"):
+                path = os.path.join(root, file)
+                adapters[os.path.relpath(path, directory)[:-len(".npz")].replace(os.sep, "/")] = path
+    return adapters
+
+class OnnxAdapterRegistry:
+    """
+    The adapters of an ONNX model whose LoRA weights were extracted into model inputs. Applying an
+    adapter is only a matter of which arrays are fed to those inputs, so any number of adapters share
+    one session; at most max_loaded sets of weights stay in memory. "base" feeds zeros, which turns the
+    LoRA branches off. Has the same names(), resolve(), activate() and stats() as AdapterRegistry.
+    """
+    def __init__(self, adapters, inputs, max_loaded=4, default=None):
+        self.paths = dict(adapters)
+        self.inputs = inputs  # input name -> (shape, numpy dtype)
+        self.max_loaded = max_loaded
+        self.default = default if default is not None else (next(iter(self.paths), BASE))
+        self.active = None
+        self.load_seconds = {}
+        self.adapter_bytes = {}
+        self._loaded = collections.OrderedDict()  # name -> {input name: array}, in LRU order
+        self._zeros = None
+        self._lock = threading.Lock()
+
+    def names(self):
+        return [BASE] + list(self.paths)
+
+    def resolve(self, name):
+        """
+        Maps the model field of a request to an adapter name.
+        Raises:
+        KeyError: If no adapter has that name.
+        """
+        if not name:
+            return self.default
+        if name == BASE or name in self.paths:
+            return name
+        raise KeyError(name)
+
+    def activate(self, name):
+        """Loads the adapter's weights if needed and returns the feeds for the adapter inputs."""
+        name = name or self.default
+        self.active = name
+        if not self.inputs:
+            return {}
+        if name == BASE:
+            return self._base_weights()
+        if name not in self._loaded:
+            self._load(name)
+        self._loaded.move_to_end(name)
+        return self._loaded[name]
+
+    def _load(self, name):
+        started = time.perf_counter()
+        with np.load(self.paths[name]) as npz:
+            missing = set(self.inputs) - set(npz.files)
+            if missing:
+                raise ValueError(f"{self.paths[name]} has no weights for the model inputs {sorted(missing)[:3]}")
+            # Cast once here rather than on every forward pass
+            weights = {n: np.ascontiguousarray(npz[n], dtype=dtype) for n, (_, dtype) in self.inputs.items()}
+        with self._lock:
+            self.load_seconds[name] = time.perf_counter() - started
+            self.adapter_bytes[name] = sum(w.nbytes for w in weights.values())
+            self._loaded[name] = weights
+        while len(self._loaded) > self.max_loaded:
+            with self._lock:
+                evicted, _ = self._loaded.popitem(last=False)
+                self.adapter_bytes.pop(evicted, None)
+
+    def _base_weights(self):
+        if self._zeros is None:
+            # Take the shapes of a real adapter where the model declares them symbolically (e.g. the LoRA rank)
+            shapes = {}
+            if self.paths:
+                with np.load(self.paths[self.default if self.default != BASE else next(iter(self.paths))]) as npz:
+                    shapes = {n: npz[n].shape for n in self.inputs if n in npz.files}
+            self._zeros = {n: np.zeros(shapes.get(n) or [d if isinstance(d, int) else 1 for d in shape], dtype)
+                           for n, (shape, dtype) in self.inputs.items()}
+        return self._zeros
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": self.active,
+                "loaded": list(self._loaded),
+                "available": self.names(),
+                "load_ms": {name: 1000 * s for name, s in self.load_seconds.items()},
+                "adapter_mib": {name: b / 2 ** 20 for name, b in self.adapter_bytes.items()},
+            }
+
+class OnnxCausalLM:
+    """
+    Runs a decoder exported to ONNX by Olive (input_ids, attention_mask, position_ids and
+    past_key_values.N.key/value in; logits and present.N.key/value out) with onnxruntime on CPU.
+    Any other float input is treated as LoRA weights extracted by ExtractAdapters and fed from the
+    adapter registry.
+    """
+    def __init__(self, model_dir, adapters=None, max_adapters=4, default_adapter=None, threads=None):
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(os.path.join(model_dir, MODEL_FILE), options,
+                                            providers=["CPUExecutionProvider"])
+        inputs = {i.name: i for i in self.session.get_inputs()}
+        self.input_names = set(inputs)
+        self.num_layers = sum(1 for name in inputs if name.startswith("past_key_values.") and name.endswith(".key"))
+        past = inputs["past_key_values.0.key"]
+        self.kv_heads, self.head_dim = past.shape[1], past.shape[3]
+        self.kv_dtype = _NUMPY_TYPES[past.type]
+        self.output_names = ["logits"] + [f"present.{i}.{kv}" for i in range(self.num_layers) for kv in ("key", "value")]
+        standard = {"input_ids", "attention_mask", "position_ids"} | {
+            f"past_key_values.{i}.{kv}" for i in range(self.num_layers) for kv in ("key", "value")}
+        adapter_inputs = {name: (i.shape, _NUMPY_TYPES[i.type]) for name, i in inputs.items() if name not in standard}
+        self.adapters = OnnxAdapterRegistry(adapters or {}, adapter_inputs, max_loaded=max_adapters,
+                                            default=default_adapter)
+
+    def empty_cache(self):
+        return [(np.zeros((1, self.kv_heads, 0, self.head_dim), self.kv_dtype),) * 2] * self.num_layers
+
+    def __call__(self, input_ids, attention_mask, position_ids, layers, adapter=None):
+        """
+        Runs one forward pass.
+        Args:
+        input_ids (np.ndarray): Token ids, shape (batch, seq).
+        attention_mask (np.ndarray): 1 for real tokens, 0 for padding, shape (batch, past + seq).
+        position_ids (np.ndarray): Positions of input_ids, shape (batch, seq).
+        layers (list): One (key, value) pair of arrays per layer, shape (batch, heads, past, head_dim).
+        adapter (str): The adapter to run with.
+        Returns:
+        tuple: float32 logits of shape (batch, seq, vocab), and the (key, value) pairs including the new tokens.
+        """
+        feeds = {"input_ids": input_ids.astype(np.int64), "attention_mask": attention_mask.astype(np.int64)}
+        if "position_ids" in self.input_names:
+            feeds["position_ids"] = position_ids.astype(np.int64)
+        for i, (key, value) in enumerate(layers):
+            feeds[f"past_key_values.{i}.key"] = key
+            feeds[f"past_key_values.{i}.value"] = value
+        feeds.update(self.adapters.activate(adapter))
+        outputs = self.session.run(self.output_names, feeds)
+        return outputs[0].astype(np.float32, copy=False), list(zip(outputs[1::2], outputs[2::2]))
+
+class OnnxGenerationScheduler(GenerationScheduler):
+    """
+    The continuous batching scheduler running an OnnxCausalLM instead of a PyTorch model. It has the
+    same submit() and submit_choices() and streams GenerationRequests the same way, so the servers
+    use it unchanged. The key/value caches are numpy arrays; sequences of different adapters are
+    decoded in separate steps, since the adapter weights are inputs shared by the whole batch.
+    """
+    def __init__(self, model, tokenizer, max_batch_size=8):
+        super().__init__(model, tokenizer, "cpu", max_batch_size=max_batch_size)
+
+    def _prefill(self, group):
+        request = group[0]
+        n = len(request.input_ids)
+        logits, layers = self.model(np.array([request.input_ids]), np.ones((1, n)), np.arange(n)[None],
+                                    self.model.empty_cache(), request.adapter)
+        # The choices of one prompt share the prompt's key/values; decoding never modifies them in place.
+        for request in group:
+            request.cache = layers
+            self._accept(request, torch.from_numpy(logits[0, -1]))
+
+    def _pad_caches(self, caches, lengths):
+        longest = max(lengths)
+        pad = lambda array, n: np.pad(array, ((0, 0), (0, 0), (longest - n, 0), (0, 0)))
+        return [(np.concatenate([pad(cache[layer][0], n) for cache, n in zip(caches, lengths)]),
+                 np.concatenate([pad(cache[layer][1], n) for cache, n in zip(caches, lengths)]))
+                for layer in range(len(caches[0]))]
+
+    def _decode_step(self, batch):
+        state = self._batch(batch)
+        attention_mask = np.zeros((len(batch), state.width + 1), dtype=np.int64)
+        for i, n in enumerate(state.lengths):
+            attention_mask[i, state.width - n:] = 1
+
+        logits, layers = self.model(np.array([[r.generated[-1]] for r in batch]), attention_mask,
+                                    np.array([[n] for n in state.lengths]), state.cache, batch[0].adapter)
+        self.steps += 1
+
+        state.advance(layers)
+        for i, request in enumerate(batch):
+            self._accept(request, torch.from_numpy(logits[i, -1]))
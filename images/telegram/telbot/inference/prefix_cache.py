@@ -0,0 +1,98 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import collections
+import string
+import threading
+
+import torch
+
+from scheduler import cache_layers, make_cache
+
+def template_prefix(template):
+    """
+    Returns the constant text of a prompt template before its first {} field.
+    Args:
+    template (str): A str.format template such as "### Text: {}\\n### The tone is:\\n".
+    Returns:
+    str: The literal text before the first field, with {{ and }} unescaped.
+    """
+    parsed = next(iter(string.Formatter().parse(template)), None)
+    return parsed[0] if parsed else ""
+
+class PrefixCache:
+    """
+    Keeps the past key/values of prompt template prefixes, so every prompt built from the same
+    template only runs the model over the tokens after the prefix. Entries are keyed by template
+    and adapter, since an adapter changes the key/values, and the least recently used entry is
+    dropped once there are more than max_entries.
+    """
+    def __init__(self, model, tokenizer, device, max_entries=8):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()  # (template, adapter) -> (prefix ids, layers)
+        self._lock = threading.Lock()
+
+    def _adapter(self, adapter):
+        return adapter if adapter is not None else getattr(self.model, "active_adapter", None)
+
+    @torch.no_grad()
+    def get(self, template, adapter=None):
+        """
+        Returns the token ids of the template prefix and their per-layer (key, value) tensors,
+        running the model over the prefix the first time it is seen.
+        """
+        key = (template, self._adapter(adapter))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        prefix_ids = self.tokenizer(template_prefix(template))["input_ids"]
+        outputs = self.model(input_ids=torch.tensor([prefix_ids], device=self.device), use_cache=True)
+        entry = (prefix_ids, cache_layers(outputs.past_key_values))
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def match(self, input_ids, template, adapter=None):
+        """
+        Finds how much of a tokenized prompt the cached prefix covers.
+        The prompt is tokenized as a whole, so the last prefix token may merge with the user text;
+        only the leading tokens that are identical are reused, and at least one token is left for
+        the model to run over.
+        Args:
+        input_ids (list): Token ids of the full prompt.
+        template (str): The template the prompt was built from.
+        adapter (str): The adapter in use, defaulting to the model's active adapter.
+        Returns:
+        tuple: The number of reused tokens and their per-layer (key, value) tensors, or (0, None).
+        """
+        prefix_ids, layers = self.get(template, adapter)
+        n = 0
+        for a, b in zip(prefix_ids, input_ids[:-1]):
+            if a != b:
+                break
+            n += 1
+        if n == 0:
+            return 0, None
+        return n, [(k[:, :, :n], v[:, :, :n]) for k, v in layers]
+
+    def past_key_values(self, input_ids, template, adapter=None):
+        """
+        Returns a fresh cache object holding the reused prefix of input_ids, for model.generate(), or None.
+        """
+        n, layers = self.match(input_ids, template, adapter)
+        return make_cache(layers) if n else None
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
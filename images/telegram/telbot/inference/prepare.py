@@ -0,0 +1,81 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+class PromptTooLong(ValueError):
+    """Raised when a prompt leaves no room in the model context for any new token."""
+    def __init__(self, prompt_tokens, context_length):
+        super().__init__(f"The prompt is {prompt_tokens} tokens long, but the model context is {context_length} tokens")
+        self.prompt_tokens = prompt_tokens
+        self.context_length = context_length
+
+class PreparedPrompt:
+    """
+    A prompt tokenized once, with everything generation needs derived from that single encoding.
+    """
+    def __init__(self, input_ids, max_tokens, context_length, template=None, adapter=None):
+        self.input_ids = input_ids
+        self.prompt_tokens = len(input_ids)
+        self.context_length = context_length
+        self.template = template
+        self.adapter = adapter
+        room = context_length - self.prompt_tokens
+        self.max_new_tokens = max(0, min(room, max_tokens) if max_tokens > 0 else room)
+
+    @property
+    def too_long(self):
+        return self.max_new_tokens == 0
+
+    def check(self):
+        """Raises PromptTooLong if no token can be generated; returns the prepared prompt otherwise."""
+        if self.too_long:
+            raise PromptTooLong(self.prompt_tokens, self.context_length)
+        return self
+
+def model_context_length(tokenizer, config=None, limit=None):
+    """
+    The number of tokens the model attends to, prompt and answer together. tokenizer.model_max_length
+    alone will not do: tokenizers that do not set it, such as Mistral-7B-Instruct-v0.2's, report a
+    placeholder of about 1e30.
+    Args:
+    tokenizer (AutoTokenizer): The tokenizer of the model.
+    config (PretrainedConfig): The model config, whose max_position_embeddings bounds the context.
+    limit (int): An explicit limit, e.g. from a --context-length flag.
+    Returns:
+    int: The smallest of the limits that are set.
+    """
+    return int(min(n for n in (limit, getattr(config, "max_position_embeddings", None), tokenizer.model_max_length) if n))
+
+def prepare_ids(input_ids, max_tokens, context_length, template=None, adapter=None):
+    """
+    Prepares an already tokenized prompt, such as a rendered chat history.
+    Raises:
+    PromptTooLong: If the prompt does not fit in the context.
+    """
+    return PreparedPrompt(list(input_ids), max_tokens, context_length, template, adapter).check()
+
+def prepare_prompts(tokenizer, texts, max_tokens, template=None, context_length=None, adapter=None):
+    """
+    Formats and tokenizes several prompts in one batched tokenizer call.
+    Args:
+    tokenizer (AutoTokenizer): The tokenizer of the model.
+    texts (list): The user texts.
+    max_tokens (int): Requested maximum number of new tokens; 0 or less means as many as fit.
+    template (str): Optional prompt template with a {} field for the text.
+    context_length (int): Context size, defaulting to tokenizer.model_max_length.
+    adapter (str): The adapter to generate with, passed through to the scheduler.
+    Returns:
+    list: One PreparedPrompt per text. Prompts that do not fit have too_long set rather than raising,
+    so one long text does not fail a whole batch.
+    """
+    context_length = context_length or tokenizer.model_max_length
+    prompts = [template.format(text) for text in texts] if template else list(texts)
+    encoded = tokenizer(prompts)["input_ids"]
+    return [PreparedPrompt(ids, max_tokens, context_length, template, adapter) for ids in encoded]
+
+def prepare_prompt(tokenizer, text, max_tokens, template=None, context_length=None, adapter=None):
+    """
+    Formats and tokenizes a single prompt.
+    Raises:
+    PromptTooLong: If the prompt does not fit in the context.
+    """
+    return prepare_prompts(tokenizer, [text], max_tokens, template, context_length, adapter)[0].check()
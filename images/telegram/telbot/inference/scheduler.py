@@ -0,0 +1,543 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import asyncio
+import collections
+import concurrent.futures
+import queue
+import threading
+import time
+
+import torch
+import torch.nn.functional as F
+from transformers import DynamicCache
+
+def cache_layers(cache):
+    """
+    Returns the per-layer (key, value) tensors of a past_key_values object, whatever its format.
+    Args:
+    cache: A legacy tuple cache or a transformers Cache object.
+    Returns:
+    list: One (key, value) pair per layer, each of shape (batch, heads, seq, head_dim).
+    """
+    if isinstance(cache, (tuple, list)):
+        return [(layer[0], layer[1]) for layer in cache]
+    if hasattr(cache, "layers"):
+        return [(layer.keys, layer.values) for layer in cache.layers]
+    return list(zip(cache.key_cache, cache.value_cache))
+
+def make_cache(layers):
+    """
+    Builds a DynamicCache from per-layer (key, value) tensors.
+    Args:
+    layers (list): One (key, value) pair per layer.
+    Returns:
+    DynamicCache: A cache the model accepts as past_key_values.
+    """
+    if hasattr(DynamicCache, "from_legacy_cache"):
+        return DynamicCache.from_legacy_cache(tuple(layers))
+    return DynamicCache(layers)
+
+def token_probs(logits, temperature=1.0, top_p=1.0, top_k=0):
+    """
+    The distribution sample_token() draws from: the softmax of the logits with temperature, top-k
+    and top-p (nucleus) filtering applied.
+    Args:
+    logits (torch.Tensor): Logits for one position, shape (vocab,).
+    temperature (float): Softmax temperature, greater than 0.
+    top_p (float): Keep the smallest set of tokens whose probability adds up to top_p.
+    top_k (int): Keep only the k most likely tokens (0 disables).
+    Returns:
+    torch.Tensor: Probabilities, shape (vocab,).
+    """
+    logits = logits.float() / temperature
+    if top_k and top_k < logits.shape[-1]:
+        kth = torch.topk(logits, int(top_k)).values[-1]
+        logits = logits.masked_fill(logits < kth, float("-inf"))
+    if top_p < 1.0:
+        sorted_logits, order = torch.sort(logits, descending=True)
+        probs = torch.softmax(sorted_logits, dim=-1)
+        remove = torch.cumsum(probs, dim=-1) - probs > top_p
+        logits = logits.scatter(0, order, sorted_logits.masked_fill(remove, float("-inf")))
+    return torch.softmax(logits, dim=-1)
+
+def sample_token(logits, temperature=1.0, top_p=1.0, top_k=0, do_sample=True):
+    """
+    Picks the next token from a logits vector with temperature, top-k and top-p (nucleus) sampling.
+    Args:
+    logits (torch.Tensor): Logits for one position, shape (vocab,).
+    temperature (float): Softmax temperature; 0 or do_sample=False means greedy.
+    top_p (float): Keep the smallest set of tokens whose probability adds up to top_p.
+    top_k (int): Keep only the k most likely tokens (0 disables).
+    do_sample (bool): Whether to sample at all.
+    Returns:
+    int: The chosen token id.
+    """
+    if not do_sample or temperature <= 0:
+        return int(torch.argmax(logits))
+    return int(torch.multinomial(token_probs(logits, temperature, top_p, top_k), 1))
+
+class GenerationRequest:
+    """
+    One sequence being generated by the scheduler. Iterating over it yields the new text as it is
+    decoded, like a TextIteratorStreamer, and stops when the sequence finishes. The n choices of one
+    prompt share an events queue; read them together with iter_choices().
+    """
+    def __init__(self, input_ids, max_new_tokens, temperature=1.0, top_p=1.0, top_k=0, do_sample=True,
+                 eos_token_id=None, timeout=None, template=None, adapter=None, speculative=False, index=0, events=None):
+        self.input_ids = list(input_ids)
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.top_k = top_k
+        self.do_sample = do_sample
+        self.eos_token_id = eos_token_id
+        self.timeout = timeout
+        self.template = template
+        self.adapter = adapter
+        self.speculative = speculative
+        self.index = index
+        self.generated = []
+        self.finish_reason = None
+        self.cancelled = False
+        self.submitted_at = time.perf_counter()
+        self.first_token_at = None
+        self.finished_at = None
+        self.cache = None
+        self.draft_cache = None
+        self.drafted = 0
+        self.draft_accepted = 0
+        # The generated tokens decoded so far: text up to _read_offset has been emitted, and decoding
+        # restarts at _prefix_offset so the tokenizer sees the context that spacing depends on
+        self._prefix_offset = 0
+        self._read_offset = 0
+        self._queue = events if events is not None else queue.Queue()
+
+    def emit(self, text):
+        self._queue.put((self.index, text))
+
+    def finish(self, reason, error=None):
+        self.finish_reason = reason
+        self.finished_at = time.perf_counter()
+        self.cache = None
+        self.draft_cache = None
+        self._queue.put((self.index, error))
+
+    def cancel(self):
+        """Asks the scheduler to stop this sequence at the next step boundary."""
+        self.cancelled = True
+
+    def __iter__(self):
+        for _, text in iter_choices([self]):
+            yield text
+
+class AsyncEvents:
+    """
+    An events queue read from asyncio instead of a thread. The scheduler thread calls put(), which
+    hands the item to the event loop with call_soon_threadsafe, so a reader awaits the next token
+    without holding a thread. Create it on the event loop, and read it with aiter_choices().
+    """
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+
+    def put(self, item):
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+        except RuntimeError:
+            pass  # The loop was closed, so nobody is reading any more
+
+def _cancel_unfinished(requests):
+    # A reader that stops early (client gone, timeout) stops its sequences at the next decoding step
+    for request in requests:
+        if request.finish_reason is None:
+            request.cancel()
+
+def iter_choices(requests):
+    """
+    Streams the text of several requests that share an events queue, as it is decoded.
+    Closing the generator before the end cancels the requests that have not finished.
+    Args:
+    requests (list): The GenerationRequests returned by GenerationScheduler.submit_choices().
+    Returns:
+    generator: (index, new text) pairs, until every request has finished.
+    """
+    remaining = len(requests)
+    events, timeout = requests[0]._queue, requests[0].timeout
+    try:
+        while remaining:
+            index, item = events.get(timeout=timeout)
+            if item is None:
+                remaining -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield index, item
+    finally:
+        _cancel_unfinished(requests)
+
+async def aiter_choices(requests):
+    """
+    iter_choices() for requests submitted with events=AsyncEvents(). Cancelling the task that reads
+    it, as Starlette does when the client disconnects, cancels the requests that have not finished.
+    Raises:
+    asyncio.TimeoutError: If no text arrives for the request timeout.
+    """
+    remaining = len(requests)
+    events, timeout = requests[0]._queue.queue, requests[0].timeout
+    try:
+        while remaining:
+            index, item = await asyncio.wait_for(events.get(), timeout)
+            if item is None:
+                remaining -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield index, item
+    finally:
+        _cancel_unfinished(requests)
+
+class _DecodeBatch:
+    """
+    The sequences of one adapter that are decoded together, with their key/values left-padded into
+    one batched cache. Each step appends a column to it; it is only rebuilt when sequences join or leave.
+    """
+    def __init__(self, requests, cache, lengths):
+        self.requests = list(requests)
+        self.cache = cache
+        self.lengths = list(lengths)
+        self.width = max(lengths)
+
+    def row(self, i):
+        # A view of the i-th sequence's key/values, without its padding
+        start = self.width - self.lengths[i]
+        return [(k[i:i + 1, :, start:], v[i:i + 1, :, start:]) for k, v in cache_layers(self.cache)]
+
+    def advance(self, cache):
+        self.cache = cache
+        self.width += 1
+        self.lengths = [n + 1 for n in self.lengths]
+
+class _ModelCall:
+    # A function queued with GenerationScheduler.run(), and the future it reports to
+    def __init__(self, fn, adapter):
+        self.fn = fn
+        self.adapter = adapter
+        self.future = concurrent.futures.Future()
+
+class GenerationScheduler:
+    """
+    Continuous batching for a single model. One worker thread owns the model: new requests are
+    prefilled as they arrive and join the running batch at the next decoding step, every step
+    decodes one token for all active sequences in a single forward pass, and finished sequences
+    leave the batch immediately. With a PrefixCache, prompts submitted with their template only
+    prefill the tokens after the template's constant prefix. With an AdapterRegistry, each request
+    runs with the adapter it was submitted with; a step decodes each adapter's sequences together.
+    With a draft model, requests submitted with speculative=True are decoded one at a time by
+    speculative decoding: the draft model, which must share the tokenizer, proposes draft_tokens
+    tokens and the model verifies them all in one forward pass.
+    """
+    def __init__(self, model, tokenizer, device, max_batch_size=8, prefix_cache=None, adapters=None,
+                 draft=None, draft_tokens=4):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.prefix_cache = prefix_cache
+        self.adapters = adapters
+        self.draft = draft
+        self.draft_tokens = draft_tokens
+        self.steps = 0
+        self.drafted = 0
+        self.draft_accepted = 0
+        self._pending = queue.Queue()
+        self._active = []
+        self._batches = {}  # adapter -> _DecodeBatch
+        self._thread = threading.Thread(target=self._loop, name="generation-scheduler", daemon=True)
+        self._thread.start()
+
+    def submit(self, input_ids, max_new_tokens, **sampling):
+        """
+        Queues a prompt for generation.
+        Args:
+        input_ids (list): Prompt token ids.
+        max_new_tokens (int): Maximum number of tokens to generate.
+        sampling: temperature, top_p, top_k, do_sample and timeout for this request, the
+        template (and adapter) the prompt was built from, to reuse the template prefix cache, and
+        speculative to decode it with the draft model.
+        Returns:
+        GenerationRequest: Iterate over it to stream the generated text.
+        """
+        return self.submit_choices(input_ids, max_new_tokens, 1, **sampling)[0]
+
+    def submit_choices(self, input_ids, max_new_tokens, n, events=None, **sampling):
+        """
+        Queues n completions of the same prompt. The prompt is prefilled once and the n sequences
+        are then sampled independently in the same decoding steps.
+        Args:
+        events: The queue the text is put on; an AsyncEvents to read it with aiter_choices().
+        Returns:
+        list: n GenerationRequests sharing one events queue, for iter_choices().
+        """
+        events = events if events is not None else queue.Queue()
+        group = [GenerationRequest(input_ids, max_new_tokens, eos_token_id=self.tokenizer.eos_token_id,
+                                   index=i, events=events, **sampling) for i in range(n)]
+        self._pending.put(group)
+        return group
+
+    def run(self, fn, adapter=None):
+        """
+        Runs a function on the worker thread between two decoding steps, for other uses of the
+        model (such as label scoring) that must not run forward passes concurrently with decoding
+        or switch adapters under it.
+        Args:
+        fn (callable): Called without arguments once the adapter is active.
+        adapter (str): The adapter to activate first.
+        Returns:
+        concurrent.futures.Future: The result of fn. Cancelling it before it starts skips the call.
+        """
+        call = _ModelCall(fn, adapter)
+        self._pending.put(call)
+        return call.future
+
+    def queue_depth(self):
+        return self._pending.qsize()
+
+    def speculative_stats(self):
+        return {
+            "draft_model": self.draft is not None,
+            "drafted": self.drafted,
+            "accepted": self.draft_accepted,
+            "acceptance_rate": self.draft_accepted / self.drafted if self.drafted else 0.,
+        }
+
+    def _loop(self):
+        while True:
+            if not self._active:
+                self._admit(self._pending.get())
+            while len(self._active) < self.max_batch_size:
+                try:
+                    self._admit(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            self._active = [r for r in self._active if r.finish_reason is None]
+            groups = collections.OrderedDict()
+            speculative = []
+            for request in self._active:
+                if request.speculative and self.draft is not None:
+                    speculative.append(request)
+                else:
+                    groups.setdefault(request.adapter, []).append(request)
+            for adapter, batch in groups.items():
+                try:
+                    self._decode_step(batch)
+                except Exception as e:
+                    self._batches.pop(adapter, None)
+                    for request in batch:
+                        request.finish("error", e)
+            for request in speculative:
+                try:
+                    self._speculative_step(request)
+                except Exception as e:
+                    request.finish("error", e)
+            if groups or speculative:
+                self._active = [r for r in self._active if r.finish_reason is None]
+            # Free the batched caches no sequence is left in before waiting for new requests
+            decoding = {r.adapter for r in self._active if not (r.speculative and self.draft is not None)}
+            for adapter in [a for a in self._batches if a not in decoding]:
+                del self._batches[adapter]
+
+    def _admit(self, group):
+        if isinstance(group, _ModelCall):
+            self._call(group)
+            return
+        for request in group:
+            if request.cancelled:
+                request.finish("cancelled")
+        group = [request for request in group if request.finish_reason is None]
+        if not group:
+            return
+        try:
+            self._prefill(group)
+        except Exception as e:
+            for request in group:
+                request.finish("error", e)
+            return
+        self._active.extend(request for request in group if request.finish_reason is None)
+
+    def _call(self, call):
+        if not call.future.set_running_or_notify_cancel():
+            return
+        try:
+            if self.adapters is not None:
+                self.adapters.activate(call.adapter)
+            call.future.set_result(call.fn())
+        except Exception as e:
+            call.future.set_exception(e)
+
+    @torch.no_grad()
+    def _prefill(self, group):
+        request = group[0]
+        if self.adapters is not None:
+            self.adapters.activate(request.adapter)
+        input_ids, past_key_values = request.input_ids, None
+        if self.prefix_cache is not None and request.template is not None:
+            reused, layers = self.prefix_cache.match(input_ids, request.template, request.adapter)
+            if reused:
+                input_ids, past_key_values = input_ids[reused:], make_cache(layers)
+        outputs = self.model(input_ids=torch.tensor([input_ids], device=self.device),
+                             past_key_values=past_key_values, use_cache=True)
+        # The choices of one prompt share the prompt's key/values; decoding never modifies them in place.
+        layers = cache_layers(outputs.past_key_values)
+        for request in group:
+            request.cache = layers
+            self._accept(request, outputs.logits[0, -1])
+
+    def _batch(self, batch):
+        """
+        The batched cache of a decoding step's sequences. While the same sequences are decoded, the
+        cache of the previous step is used as it is; when sequences join or leave, the caches of those
+        staying and the prompt caches of those joining are left-padded into a new one.
+        """
+        state = self._batches.get(batch[0].adapter)
+        if state is not None and state.requests == batch:
+            return state
+        staying = {id(r): i for i, r in enumerate(state.requests)} if state is not None else {}
+        # Every cache holds the prompt and all generated tokens but the last one, which is fed next.
+        caches = [state.row(staying[id(r)]) if id(r) in staying else r.cache for r in batch]
+        lengths = [cache[0][0].shape[2] for cache in caches]
+        state = _DecodeBatch(batch, self._pad_caches(caches, lengths), lengths)
+        for request in batch:
+            request.cache = None
+        self._batches[batch[0].adapter] = state
+        return state
+
+    def _pad_caches(self, caches, lengths):
+        # Left-pad the caches to a common length; the attention mask hides the padding.
+        longest = max(lengths)
+        layers = []
+        for layer in range(len(caches[0])):
+            keys = [F.pad(cache[layer][0], (0, 0, longest - n, 0)) for cache, n in zip(caches, lengths)]
+            values = [F.pad(cache[layer][1], (0, 0, longest - n, 0)) for cache, n in zip(caches, lengths)]
+            layers.append((torch.cat(keys), torch.cat(values)))
+        return make_cache(layers)
+
+    @torch.no_grad()
+    def _decode_step(self, batch):
+        if self.adapters is not None:
+            self.adapters.activate(batch[0].adapter)
+        state = self._batch(batch)
+        attention_mask = torch.zeros(len(batch), state.width + 1, dtype=torch.long, device=self.device)
+        for i, n in enumerate(state.lengths):
+            attention_mask[i, state.width - n:] = 1
+
+        outputs = self.model(
+            input_ids=torch.tensor([[r.generated[-1]] for r in batch], device=self.device),
+            attention_mask=attention_mask,
+            position_ids=torch.tensor([[n] for n in state.lengths], device=self.device),
+            past_key_values=state.cache,
+            use_cache=True,
+        )
+        self.steps += 1
+
+        state.advance(outputs.past_key_values)
+        for i, request in enumerate(batch):
+            self._accept(request, outputs.logits[i, -1])
+
+    @torch.no_grad()
+    def _speculative_step(self, request):
+        if request.cancelled:
+            request.finish("cancelled")
+            return
+        sampling = (request.temperature, request.top_p, request.top_k)
+        sample = request.do_sample and request.temperature > 0
+        ids = request.input_ids + request.generated
+        # The model adds one token of its own, so draft no more than fit before max_new_tokens
+        drafts = min(self.draft_tokens, request.max_new_tokens - len(request.generated) - 1)
+
+        # The draft cache may lag behind, e.g. after all draft tokens were accepted: feed what it has not seen
+        draft_layers = request.draft_cache
+        feed = ids[draft_layers[0][0].shape[2]:] if draft_layers else ids
+        proposed, draft_probs = [], []
+        for _ in range(drafts):
+            outputs = self.draft(input_ids=torch.tensor([feed], device=self.device),
+                                 past_key_values=make_cache(draft_layers) if draft_layers else None, use_cache=True)
+            draft_layers = cache_layers(outputs.past_key_values)
+            if sample:
+                probs = token_probs(outputs.logits[0, -1], *sampling)
+                token = int(torch.multinomial(probs, 1))
+                draft_probs.append(probs)
+            else:
+                token = int(torch.argmax(outputs.logits[0, -1]))
+            proposed.append(token)
+            feed = [token]
+
+        # One forward pass of the model over the last token and the draft gives its own choice at every position
+        if self.adapters is not None:
+            self.adapters.activate(request.adapter)
+        outputs = self.model(input_ids=torch.tensor([[ids[-1]] + proposed], device=self.device),
+                             past_key_values=make_cache(request.cache), use_cache=True)
+        logits = outputs.logits[0]
+        self.steps += 1
+
+        accepted = 0
+        for i, token in enumerate(proposed):
+            if not sample:
+                if int(torch.argmax(logits[i])) != token:
+                    break
+            else:
+                # Speculative sampling: accept with probability min(1, p/q), otherwise sample from
+                # max(0, p - q), so that the tokens follow the model's distribution exactly.
+                p = token_probs(logits[i], *sampling)
+                q = draft_probs[i][:p.shape[0]]
+                q = F.pad(q, (0, p.shape[0] - q.shape[0]))
+                if torch.rand(()) * q[token] >= p[token]:
+                    residual = torch.clamp(p - q, min=0)
+                    next_token = int(torch.multinomial(residual if residual.sum() > 0 else p, 1))
+                    break
+            accepted += 1
+        if accepted == len(proposed) or not sample:
+            next_token = sample_token(logits[accepted], *sampling, request.do_sample)
+
+        # Keep the key/values of the accepted tokens only; neither cache holds the new last token
+        keep = len(ids) + accepted
+        request.cache = [(k[:, :, :keep], v[:, :, :keep]) for k, v in cache_layers(outputs.past_key_values)]
+        if draft_layers:
+            request.draft_cache = [(k[:, :, :keep], v[:, :, :keep]) for k, v in draft_layers]
+        request.drafted += len(proposed)
+        request.draft_accepted += accepted
+        self.drafted += len(proposed)
+        self.draft_accepted += accepted
+        self._append(request, proposed[:accepted] + [next_token])
+
+    def _accept(self, request, logits):
+        if request.cancelled:
+            request.finish("cancelled")
+            return
+        token = sample_token(logits, request.temperature, request.top_p, request.top_k, request.do_sample)
+        self._append(request, [token])
+
+    def _append(self, request, tokens):
+        if request.first_token_at is None:
+            request.first_token_at = time.perf_counter()
+        finish_reason = None
+        for token in tokens:
+            request.generated.append(token)
+            if token == request.eos_token_id:
+                finish_reason = "stop"
+            elif len(request.generated) >= request.max_new_tokens:
+                finish_reason = "length"
+            if finish_reason:
+                break
+        # Decode only the tokens since the last emitted text, from a few tokens before it so that the
+        # tokenizer sees the context spacing depends on, and hold back an incomplete multi-token
+        # character until the sequence ends.
+        previous = self.tokenizer.decode(request.generated[request._prefix_offset:request._read_offset],
+                                         skip_special_tokens=True)
+        text = self.tokenizer.decode(request.generated[request._prefix_offset:], skip_special_tokens=True)
+        if len(text) > len(previous) and (finish_reason or not text.endswith("\ufffd")):
+            request.emit(text[len(previous):])
+            request._prefix_offset = request._read_offset
+            request._read_offset = len(request.generated)
+        if finish_reason:
+            request.finish(finish_reason)
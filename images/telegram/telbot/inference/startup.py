@@ -0,0 +1,72 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import threading
+import time
+import traceback
+
+class NotReady(Exception):
+    """Raised when the model is still loading after the caller's timeout, or failed to load."""
+    def __init__(self, message, retry_after=5):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class BackgroundLoader:
+    """
+    Loads the model in a background thread so the server can start listening at once.
+    The load callable does the loading, warmup then runs a first generation, and only after both
+    does the loader report ready. Requests call wait() to block until then, up to a timeout.
+    """
+    def __init__(self, load, warmup=None, started=None):
+        self.load = load
+        self.warmup = warmup
+        self.started = started if started is not None else time.perf_counter()
+        self.timings = {}
+        self.error = None
+        self._ready = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="model-loader", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            load_started = time.perf_counter()
+            self.load()
+            self.timings["load_s"] = time.perf_counter() - load_started
+            if self.warmup is not None:
+                warmup_started = time.perf_counter()
+                self.warmup()
+                self.timings["warmup_s"] = time.perf_counter() - warmup_started
+            self.timings["ready_s"] = time.perf_counter() - self.started
+            print(f"Ready after {self.timings['ready_s']:.1f} s (load {self.timings['load_s']:.1f} s, "
+                  f"warm-up {self.timings.get('warmup_s', 0.):.1f} s)")
+        except Exception as e:
+            traceback.print_exc()
+            self.error = e
+        finally:
+            self._ready.set()
+
+    @property
+    def ready(self):
+        return self._ready.is_set() and self.error is None
+
+    def wait(self, timeout):
+        """
+        Blocks until the model is ready.
+        Raises:
+        NotReady: If it is still loading after timeout seconds, or loading failed.
+        """
+        if not self._ready.wait(timeout):
+            raise NotReady("The model is still loading, retry later")
+        if self.error is not None:
+            raise NotReady(f"The model failed to load: {self.error}", retry_after=60)
+
+    def status(self):
+        if self.error is not None:
+            return {"status": "failed", "error": str(self.error)}
+        return {"status": "ready" if self._ready.is_set() else "loading",
+                "uptime_s": time.perf_counter() - self.started, **self.timings}
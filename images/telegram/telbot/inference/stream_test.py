@@ -0,0 +1,207 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import argparse
+import json
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+from load_test import load_prompts, percentile
+from tiny_model import build_tiny_model
+
+def open_streams(url, prompts, streams, max_new_tokens, disconnect=False):
+    """
+    Opens `streams` streaming chat completions at once and reads them to the end.
+    Args:
+    url (str): The server, e.g. http://127.0.0.1:7860.
+    prompts (list): Prompts to send.
+    streams (int): Number of concurrent streams.
+    max_new_tokens (int): max_tokens of each request.
+    disconnect (bool): Close each stream after its first chunk, like a client that goes away.
+    Returns:
+    dict: Streams that got a first chunk, their time to first chunk, and the most streams receiving at once.
+    """
+    results = []
+    lock = threading.Lock()
+
+    def client(i):
+        body = {"messages": [{"role": "user", "content": prompts[i % len(prompts)]}],
+                "max_tokens": max_new_tokens, "stream": True}
+        started, first, last = time.perf_counter(), None, None
+        try:
+            with requests.post(url.rstrip("/") + "/v1/chat/completions", json=body, stream=True, timeout=120) as response:
+                for line in response.iter_lines(decode_unicode=True):
+                    if line and line.startswith("data:"):
+                        last = time.perf_counter()
+                        first = first or last
+                        if disconnect:
+                            break
+        except requests.RequestException:
+            pass
+        with lock:
+            results.append((started, first, last))
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(streams)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    served = [(s, f, l) for s, f, l in results if f is not None]
+    # Sweep over the intervals between first and last chunk to find how many streams were live together
+    edges = sorted([(f, 1) for _, f, _ in served] + [(l, -1) for _, _, l in served])
+    live = most = 0
+    for _, step in edges:
+        live += step
+        most = max(most, live)
+    first_ms = [(f - s) * 1000 for s, f, _ in served]
+    return {
+        "streams": streams,
+        "served": len(served),
+        "most_live": most,
+        "first_p50_ms": percentile(first_ms, 0.5) if first_ms else float("nan"),
+        "first_p95_ms": percentile(first_ms, 0.95) if first_ms else float("nan"),
+    }
+
+def healthz_ms(url):
+    started = time.perf_counter()
+    requests.get(url.rstrip("/") + "/healthz", timeout=120)
+    return (time.perf_counter() - started) * 1000
+
+def metrics(url):
+    return requests.get(url.rstrip("/") + "/metrics", timeout=120).json()
+
+def decode_steps(url):
+    return metrics(url)["decode_steps"]
+
+def build_app(mode, model_path, max_batch_size, max_in_flight):
+    """
+    Serves the model through the endpoint gradio_chat.py had before ("sync": a def endpoint whose sync
+    generator Starlette iterates in its threadpool) or the one it has now ("async").
+    """
+    from fastapi import FastAPI
+    from sse_starlette.sse import EventSourceResponse
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    from admission import AdmissionController
+    from scheduler import AsyncEvents, GenerationScheduler, aiter_choices, iter_choices
+
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModelForCausalLM.from_pretrained(model_path).eval()
+    scheduler = GenerationScheduler(model, tokenizer, model.device, max_batch_size=max_batch_size)
+
+    def submit(body, events=None):
+        text = body["messages"][-1]["content"]
+        return scheduler.submit_choices(tokenizer(text)["input_ids"], max_new_tokens=body["max_tokens"], n=1,
+                                        top_p=0.95, timeout=60., events=events)
+
+    app, admission = FastAPI(), AdmissionController(max_in_flight=max_in_flight, max_queued=max_in_flight)
+
+    @app.get("/healthz")
+    def healthz():
+        return {"status": "ok"}
+
+    @app.get("/metrics")
+    def metrics():
+        return {**admission.metrics(), "decode_steps": scheduler.steps, "threads": threading.active_count()}
+
+    if mode == "sync":
+        @app.post("/v1/chat/completions")
+        def sync_completion(body: dict):
+            granted = admission.acquire()
+            def events():
+                try:
+                    for _, text in iter_choices(submit(body)):
+                        yield dict(data=json.dumps({"choices": [{"delta": {"content": text}}]}))
+                    yield dict(data="[DONE]")
+                finally:
+                    admission.release(granted)
+            return EventSourceResponse(events(), sep="\n")
+    else:
+        @app.post("/v1/chat/completions")
+        async def async_completion(body: dict):
+            granted = await admission.acquire_async()
+            async def events():
+                try:
+                    async for _, text in aiter_choices(submit(body, AsyncEvents())):
+                        yield dict(data=json.dumps({"choices": [{"delta": {"content": text}}]}))
+                    yield dict(data="[DONE]")
+                finally:
+                    admission.release(granted)
+            return EventSourceResponse(events(), sep="\n")
+    return app
+
+def serve(mode, model_path, max_batch_size, max_in_flight):
+    # In its own process, so the client threads do not compete with the server for the GIL
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = subprocess.Popen([sys.executable, __file__, "--serve", mode, model_path, str(max_batch_size),
+                               str(max_in_flight), str(port)])
+    url = f"http://127.0.0.1:{port}"
+    while True:
+        try:
+            requests.get(url + "/healthz", timeout=1)
+            return server, url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure how many concurrent SSE streams the server keeps going.')
+    parser.add_argument('--model', default=None, help='Model directory (defaults to a tiny random CPU model)')
+    parser.add_argument('--url', default=None, help='Test a running gradio_chat.py server instead, e.g. http://127.0.0.1:7860')
+    parser.add_argument('--streams', default="16,64,128", help='Comma separated numbers of concurrent streams')
+    parser.add_argument('--max-new-tokens', type=int, default=128)
+    parser.add_argument('--serve', nargs=5, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        import uvicorn
+        mode, model_path, max_batch_size, max_in_flight, port = args.serve
+        uvicorn.run(build_app(mode, model_path, int(max_batch_size), int(max_in_flight)),
+                    host="127.0.0.1", port=int(port), log_level="warning")
+        sys.exit(0)
+
+    prompts = load_prompts()
+    if args.url:
+        targets = {args.url: (None, args.url)}
+    else:
+        # The batch and admission limits are raised to the largest test so that only the serving path differs
+        most = max(map(int, args.streams.split(",")))
+        model_path = args.model or build_tiny_model()
+        targets = {f"{mode} endpoint": serve(mode, model_path, most, most) for mode in ["sync", "async"]}
+
+    print(f"{'server':<16} {'streams':>7} {'served':>6} {'most live':>9} {'first p50 ms':>12} {'first p95 ms':>12} "
+          f"{'healthz ms':>10} {'threads':>7} {'steps/s after disconnect':>24}")
+    for name, (server, url) in targets.items():
+        open_streams(url, prompts, 1, 4)  # warm up
+        for streams in map(int, args.streams.split(",")):
+            # Half a second in, while the streams are open: /healthz latency and the server's thread count
+            probe = {}
+            def check():
+                probe["healthz_ms"] = healthz_ms(url)
+                probe["threads"] = metrics(url).get("threads", "-")
+            timer = threading.Timer(0.5, check)
+            timer.start()
+            result = open_streams(url, prompts, streams, args.max_new_tokens)
+            timer.join()
+
+            # Clients that leave after the first chunk: generation should stop rather than run to max_tokens
+            open_streams(url, prompts, streams, args.max_new_tokens, disconnect=True)
+            time.sleep(0.5)
+            steps = decode_steps(url)
+            time.sleep(1.)
+            steps_per_sec = decode_steps(url) - steps
+            print(f"{name:<16} {streams:>7} {result['served']:>6} {result['most_live']:>9} {result['first_p50_ms']:>12.0f} "
+                  f"{result['first_p95_ms']:>12.0f} {probe['healthz_ms']:>10.0f} {probe['threads']:>7} {steps_per_sec:>24}")
+            # Let abandoned generations drain before the next level
+            while steps_per_sec:
+                steps = decode_steps(url)
+                time.sleep(0.5)
+                steps_per_sec = decode_steps(url) - steps
+        if server is not None:
+            server.terminate()
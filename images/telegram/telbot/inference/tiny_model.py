@@ -0,0 +1,149 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import argparse
+import json
+import os
+
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+
+DEFAULT_PATH = "../model-cache/tiny-llama"
+# The chat template of Mistral-7B-Instruct-v0.2
+CHAT_TEMPLATE = (
+    "{{ bos_token }}{% for message in messages %}"
+    "{% if (message['role'] == 'user') != (loop.index0 % 2 == 0) %}"
+    "{{ raise_exception('Conversation roles must alternate user/assistant/user/assistant/...') }}{% endif %}"
+    "{% if message['role'] == 'user' %}{{ '[INST] ' + message['content'] + ' [/INST]' }}"
+    "{% elif message['role'] == 'assistant' %}{{ message['content'] + eos_token }}"
+    "{% else %}{{ raise_exception('Only user and assistant roles are supported!') }}{% endif %}{% endfor %}"
+)
+# The default fine-tuning template (setup/project-settings.json)
+TEXT_TEMPLATE = "### Text: {phrase}\n### The tone is:\n{tone}"
+DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dataset", "dataset-classification.json")
+
+def train_tiny_model(model, tokenizer, examples, steps, batch_size=16, lr=1e-3, seed=0):
+    """
+    Trains a model on texts for a few steps, so that its outputs follow the dataset instead of being random.
+    Args:
+    model (LlamaForCausalLM): The model, trained in place.
+    tokenizer (PreTrainedTokenizerFast): Its tokenizer.
+    examples (list): Training texts; each gets an end of sequence token.
+    steps (int): Number of optimizer steps.
+    batch_size (int): Texts per step, drawn at random.
+    lr (float): AdamW learning rate.
+    seed (int): Seed for drawing the batches.
+    Returns:
+    float: The loss of the last step.
+    """
+    import torch
+    generator = torch.Generator().manual_seed(seed)
+    encoded = [tokenizer(text)["input_ids"] + [tokenizer.eos_token_id] for text in examples]
+    optimizer = torch.optim.AdamW(model.parameters(), lr=lr)
+    model.train()
+    for _ in range(steps):
+        batch = [encoded[i] for i in torch.randint(len(encoded), (batch_size,), generator=generator)]
+        longest = max(map(len, batch))
+        input_ids = torch.tensor([ids + [tokenizer.eos_token_id] * (longest - len(ids)) for ids in batch])
+        labels = torch.tensor([ids + [-100] * (longest - len(ids)) for ids in batch])
+        loss = model(input_ids=input_ids, labels=labels).loss
+        loss.backward()
+        optimizer.step()
+        optimizer.zero_grad()
+    model.eval()
+    return loss.item()
+
+def train_tiny_adapters(model_path, directory, examples, checkpoints=(50, 150, 400), rank=8, lr=1e-2, seed=0):
+    """
+    Fine-tunes one LoRA adapter of a model on texts and saves it at several step counts, like the
+    checkpoints of a fine-tuning run, so that the checkpoints differ in what they have learned.
+    Args:
+    model_path (str): The base model directory.
+    directory (str): Where the checkpoint-<steps> folders are saved.
+    examples (list): Training texts.
+    checkpoints (tuple): The step counts to save a checkpoint at.
+    rank (int): LoRA rank.
+    lr (float): AdamW learning rate.
+    seed (int): Seed for the LoRA weights and the batches.
+    Returns:
+    list: The checkpoint folders.
+    """
+    import torch
+    from peft import LoraConfig, get_peft_model
+    from transformers import AutoTokenizer
+    torch.manual_seed(seed)
+    config = LoraConfig(r=rank, lora_alpha=16, task_type="CAUSAL_LM",
+                        target_modules=["q_proj", "k_proj", "v_proj", "o_proj", "gate_proj", "up_proj", "down_proj"])
+    model = get_peft_model(LlamaForCausalLM.from_pretrained(model_path), config)
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    folders, done = [], 0
+    for i, steps in enumerate(sorted(checkpoints)):
+        train_tiny_model(model, tokenizer, examples, steps - done, lr=lr, seed=seed + i)
+        done = steps
+        folders.append(os.path.join(directory, f"checkpoint-{steps}"))
+        model.save_pretrained(folders[-1])
+    return folders
+
+def build_tiny_model(path=DEFAULT_PATH, dataset=DATASET, vocab_size=1024, hidden_size=64, layers=2, seed=0,
+                     train_steps=0, examples=None):
+    """
+    Builds a randomly initialized Llama-architecture model (the same family as Mistral) with a
+    byte-level BPE tokenizer trained on the dataset, and saves both to a directory.
+    The outputs are meaningless, but the model runs on CPU in milliseconds, which is what the
+    benchmarks and load tests need when no GPU or model download is available. With train_steps,
+    the model is then trained on the dataset in the fine-tuning template, so that its outputs look
+    like the dataset, e.g. for a draft model to predict.
+    Args:
+    path (str): Directory to save the model and tokenizer to.
+    dataset (str): JSONL dataset whose phrases are used to train the tokenizer.
+    vocab_size (int): Tokenizer vocabulary size.
+    hidden_size (int): Model hidden size.
+    layers (int): Number of decoder layers.
+    seed (int): Seed for the random weights.
+    train_steps (int): Number of training steps on the dataset (0 keeps the random weights).
+    examples (list): Texts to train on instead of the dataset rows in the fine-tuning template.
+    Returns:
+    str: The directory containing the saved model.
+    """
+    if os.path.exists(os.path.join(path, "config.json")):
+        return path
+
+    with open(dataset, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    texts = [row["phrase"] for row in rows]
+
+    tok = Tokenizer(models.BPE(unk_token="<unk>"))
+    tok.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tok.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(vocab_size=vocab_size, special_tokens=["<unk>", "<s>", "</s>"],
+                                  initial_alphabet=pre_tokenizers.ByteLevel.alphabet())
+    tok.train_from_iterator(texts, trainer)
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=tok, unk_token="<unk>", bos_token="<s>",
+                                        eos_token="</s>", model_max_length=512)
+    tokenizer.chat_template = CHAT_TEMPLATE
+
+    import torch
+    torch.manual_seed(seed)
+    config = LlamaConfig(vocab_size=len(tokenizer), hidden_size=hidden_size, intermediate_size=hidden_size * 2,
+                         num_hidden_layers=layers, num_attention_heads=4, num_key_value_heads=2,
+                         max_position_embeddings=512, bos_token_id=1, eos_token_id=2)
+    model = LlamaForCausalLM(config)
+    if train_steps:
+        examples = examples or [TEXT_TEMPLATE.format(**row) for row in rows]
+        loss = train_tiny_model(model, tokenizer, examples, train_steps, seed=seed)
+        print(f"Trained for {train_steps} steps, loss {loss:.2f}")
+
+    os.makedirs(path, exist_ok=True)
+    tokenizer.save_pretrained(path)
+    model.save_pretrained(path)
+    return path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Create a tiny random model for CPU benchmarks.')
+    parser.add_argument('--path', default=DEFAULT_PATH, help='Output directory')
+    parser.add_argument('--hidden-size', type=int, default=64)
+    parser.add_argument('--layers', type=int, default=2)
+    parser.add_argument('--train-steps', type=int, default=0, help='Train on the dataset for this many steps')
+    args = parser.parse_args()
+    path = build_tiny_model(args.path, hidden_size=args.hidden_size, layers=args.layers, train_steps=args.train_steps)
+    print(f"Tiny model saved to {path}")
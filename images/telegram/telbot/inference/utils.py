@@ -1,11 +1,14 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT license.
 
+import hashlib
+import json
 import os
 import re
 import torch
 from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig, TextStreamer
 from peft import PeftModel
+from prepare import model_context_length, prepare_prompt
 
 def get_device_map():
     num_gpus = torch.cuda.device_count()
@@ -69,6 +72,95 @@ def load_model(model_name, torch_dtype, quant_type):
     except Exception as e:
         raise RuntimeError(f"Error loading model: {e}")
 
+MERGE_INFO = "merged_from.json"  # Written by export_merged.py next to the merged weights
+
+def adapter_fingerprint(adapters_name):
+    """
+    Identifies an adapter by its weights, so that a merged model can be matched with the adapter it was merged from.
+    Args:
+    adapters_name (str): The adapter path.
+    Returns:
+    dict: The absolute adapter path and the SHA-256 of its weights file, or None if it has none.
+    """
+    for name in ["adapter_model.safetensors", "adapter_model.bin"]:
+        path = os.path.join(adapters_name, name)
+        if os.path.exists(path):
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+            return {"adapter": os.path.abspath(adapters_name), "sha256": digest.hexdigest()}
+    return None
+
+def find_merged_model(merged_name, adapters_name):
+    """
+    Checks for a model exported by export_merged.py from the same adapter weights as adapters_name.
+    Args:
+    merged_name (str): The folder the merged model is exported to.
+    adapters_name (str): The adapter it should have been merged from.
+    Returns:
+    str: merged_name if it can be used instead of loading the base model and adapter, otherwise None.
+    """
+    info_path = os.path.join(merged_name, MERGE_INFO)
+    if not os.path.exists(os.path.join(merged_name, "config.json")):
+        print(f"No merged model in {merged_name}, run export_merged.py first")
+        return None
+    if not os.path.exists(info_path):
+        print(f"Ignoring {merged_name}: it does not record its adapter, run export_merged.py again")
+        return None
+    with open(info_path, encoding="utf-8") as f:
+        info = json.load(f)
+    expected = adapter_fingerprint(adapters_name)
+    if expected is None or info.get("sha256") != expected["sha256"]:
+        print(f"Ignoring {merged_name}: it was merged from {info.get('adapter')}, whose weights differ from {adapters_name}")
+        return None
+    return merged_name
+
+def load_merged_model(model_name, torch_dtype):
+    """
+    Loads a model saved by export_merged.py. The weights already include the adapter and the resized
+    embeddings, and the safetensors files are memory-mapped, so there is no quantization, resizing or
+    adapter loading to do. Being unquantized, it takes about four times the GPU memory of the 4-bit base model.
+    Args:
+    model_name (str): The folder of the merged model.
+    torch_dtype (torch.dtype): The data type for model weights.
+    Returns:
+    AutoModelForCausalLM: The loaded model.
+    """
+    return AutoModelForCausalLM.from_pretrained(
+        pretrained_model_name_or_path=model_name,
+        trust_remote_code=True,
+        device_map=get_device_map(),
+        torch_dtype=torch_dtype,
+        low_cpu_mem_usage=True,
+    )
+
+def load_draft_model(draft_name, tokenizer, torch_dtype):
+    """
+    Loads the small model that drafts tokens for speculative decoding, if one is configured.
+    Args:
+    draft_name (str): The folder of the draft model.
+    tokenizer (AutoTokenizer): The tokenizer of the main model, which the draft model must share.
+    torch_dtype (torch.dtype): The data type for model weights.
+    Returns:
+    AutoModelForCausalLM: The draft model, or None if draft_name does not exist.
+    Raises:
+    ValueError: If the draft model uses a different tokenizer.
+    """
+    if not draft_name or not os.path.isdir(draft_name):
+        return None
+    vocab = tokenizer.get_vocab()
+    draft_vocab = AutoTokenizer.from_pretrained(draft_name, trust_remote_code=True).get_vocab()
+    if any(vocab.get(token) != i for token, i in draft_vocab.items()):
+        raise ValueError(f"The draft model {draft_name} does not use the same tokenizer as the model")
+    return AutoModelForCausalLM.from_pretrained(
+        pretrained_model_name_or_path=draft_name,
+        trust_remote_code=True,
+        device_map=get_device_map(),
+        torch_dtype=torch_dtype,
+        low_cpu_mem_usage=True,
+    ).eval()
+
 def resize_embeddings(model, tokenizer):
     """
     Resizes the token embeddings in the model to account for new tokens.
@@ -104,7 +196,7 @@ def get_device():
         device = torch.device("cpu")
     return device
 
-def run_prompt(model, tokenizer, device, template):
+def run_prompt(model, tokenizer, device, template, prefix_cache=None, draft_model=None):
     """
     Runs an interactive prompt where the user can enter text to get generated responses.
     Continues to prompt the user for input until '#end' is entered.
@@ -113,6 +205,8 @@ def run_prompt(model, tokenizer, device, template):
     tokenizer (AutoTokenizer): The tokenizer to use for encoding the input text.
     device (torch.device): The device on which to perform the computation.
     template (str): The template string to format the input text.
+    prefix_cache (PrefixCache): Optional cache of the template prefix key/values.
+    draft_model (AutoModelForCausalLM): Optional draft model for speculative decoding.
     """
     while True:
         new_input = input("Enter your text (type #end to stop): ")
@@ -120,11 +214,11 @@ def run_prompt(model, tokenizer, device, template):
             break
 
         try:
-            _ = generate_text(model, tokenizer, device, new_input, template)
+            _ = generate_text(model, tokenizer, device, new_input, template, prefix_cache, draft_model)
         except Exception as e:
             print(f"An error occurred during text generation: {e}")
             
-def generate_text(model, tokenizer, device, input_text, template):
+def generate_text(model, tokenizer, device, input_text, template, prefix_cache=None, draft_model=None):
     """
     Generates and returns text using the provided model and tokenizer for the input text.
     Args:
@@ -133,14 +227,25 @@ def generate_text(model, tokenizer, device, input_text, template):
     device (torch.device): The device on which to perform the computation.
     input_text (str): The input text to generate responses for.
     template (str): The template string to format the input text.
+    prefix_cache (PrefixCache): Optional cache of the template prefix key/values; when given, only the
+    tokens after the template prefix are run through the model before generating.
+    draft_model (AutoModelForCausalLM): Optional draft model sharing the tokenizer. Its proposed tokens
+    are verified several at a time by the model (assisted generation), which gives the same greedy output faster.
     Returns:
     torch.Tensor: The generated text tensor.
     """
-    inputs = tokenizer(template.format(input_text), return_tensors="pt")
-    inputs = inputs.to(device)  # Move input tensors to the device
+    prepared = prepare_prompt(tokenizer, input_text, 1024, template,
+                              model_context_length(tokenizer, getattr(model, "config", None)))
+    input_ids = torch.tensor([prepared.input_ids], device=device)
+    past_key_values = None
+    # Assisted generation keeps the caches of both models in step itself, so it starts without the prefix
+    if prefix_cache is not None and draft_model is None:
+        past_key_values = prefix_cache.past_key_values(prepared.input_ids, template)
     streamer = TextStreamer(tokenizer)
-    return model.generate(**inputs, streamer=streamer,
-                          max_new_tokens=1024,
+    return model.generate(input_ids=input_ids, attention_mask=torch.ones_like(input_ids),
+                          past_key_values=past_key_values, streamer=streamer,
+                          assistant_model=draft_model,
+                          max_new_tokens=prepared.max_new_tokens,
                           pad_token_id=tokenizer.pad_token_id,
                           eos_token_id=tokenizer.eos_token_id)
 
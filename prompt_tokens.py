@@ -0,0 +1,41 @@
+"""Token cost of each section of a system prompt
+
+> pip install tiktoken
+> python prompt_tokens.py final_prompt.aitk.txt
+
+Splits the prompt at its markdown headings (`# Guidelines`, `### Example 1:`, ...)
+and counts the tokens of every section with the tokenizer of the target model, so
+it is clear which guideline or example costs the most on every request.
+"""
+import argparse
+import re
+
+import tiktoken
+
+def sections(text):
+    """Yield (heading, body) pairs; text before the first heading is the preamble."""
+    parts = re.split(r"(?m)^(#+ .*)$", text)
+    yield "(preamble)", parts[0]
+    for heading, body in zip(parts[1::2], parts[2::2]):
+        yield heading.strip(), heading + body
+
+def main():
+    parser = argparse.ArgumentParser(description = "Count the tokens of each prompt section.")
+    parser.add_argument("prompt", nargs = "?", default = "final_prompt.aitk.txt")
+    parser.add_argument("--model", default = "gpt-4o")
+    args = parser.parse_args()
+
+    encoding = tiktoken.encoding_for_model(args.model)
+    with open(args.prompt, encoding = "utf-8") as f:
+        text = f.read()
+
+    total = len(encoding.encode(text))
+    print(f"{'section':<40} {'tokens':>7} {'share':>6}")
+    for heading, body in sections(text):
+        tokens = len(encoding.encode(body))
+        if tokens:
+            print(f"{heading[:40]:<40} {tokens:>7} {tokens / total:>6.1%}")
+    print(f"{'total':<40} {total:>7}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Prompt files loaded once and reused for every request
+
+`*.aitk.txt` files (system prompts exported from Agent Builder) are compiled to a
+single `SystemMessage`; `*.json` files hold a few-shot conversation as a list of
+input items. Both are read once, kept as tuples and shared by every request, so
+per-request work is only appending the new user message. A file is re-read when
+its mtime changes, checked at most once per `check_interval` seconds.
+"""
+import json
+import os
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def _compile(path):
+    with open(path, encoding = "utf-8") as f:
+        text = f.read()
+    if path.endswith(".aitk.txt"):
+        from azure.ai.inference.models import SystemMessage
+        return text, (SystemMessage(content = text),)
+    return text, tuple(json.loads(text))
+
+class PromptRegistry:
+    def __init__(self, directory = HERE, check_interval = 1.0):
+        self.directory = directory
+        self.check_interval = check_interval
+        self._entries = {}  # filename -> [mtime_ns, checked_at, text, messages]
+        self._lock = threading.Lock()
+
+    def _entry(self, filename):
+        entry = self._entries.get(filename)
+        now = time.monotonic()
+        if entry is not None and now - entry[1] < self.check_interval:
+            return entry
+        with self._lock:
+            path = os.path.join(self.directory, filename)
+            mtime = os.stat(path).st_mtime_ns
+            entry = self._entries.get(filename)
+            if entry is None or entry[0] != mtime:
+                entry = self._entries[filename] = [mtime, now, *_compile(path)]
+            else:
+                entry[1] = now
+            return entry
+
+    def text(self, filename):
+        """The raw file contents, e.g. for cache keys or token counting."""
+        return self._entry(filename)[2]
+
+    def get(self, filename):
+        """The compiled messages. Shared between requests, so never mutate them."""
+        return self._entry(filename)[3]
+
+    def messages(self, filename, *turns):
+        """A new list with the compiled messages followed by `turns`."""
+        return [*self._entry(filename)[3], *turns]
+
+registry = PromptRegistry()
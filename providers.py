@@ -0,0 +1,198 @@
+"""One chat() interface over several model backends
+
+Backends:
+- `AzureInferenceProvider`: GitHub Models (or any Azure AI Inference endpoint), as in `app.py`/`final_app.py`.
+- `OpenAIResponsesProvider`: the OpenAI Responses API, as in `3.py`.
+- `LocalChatProvider`: an OpenAI-compatible `/v1/chat/completions` server such as the telbot `gradio_chat.py`.
+
+Each provider takes the same list of `{"role", "content"}` messages and returns
+the answer text. `Router` keeps an exponentially weighted moving average (EWMA)
+of latency and error rate per backend and sends each request to the fastest
+healthy one, falling back to the next on failure. With `hedge_after` set, a
+request that has not finished after that many seconds is also sent to the
+runner-up and the first answer wins. The requests that lose are cancelled: they
+stream their answer and close the connection at the next chunk once `cancel` is
+set, so the servers stop generating (and billing) tokens nobody reads.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+class Cancelled(Exception):
+    """Raised by a provider whose `cancel` event was set before the answer was complete."""
+
+class AzureInferenceProvider:
+    def __init__(self, endpoint = None, token = None, model = "gpt-4o", name = None):
+        from clients import ENDPOINT, get_client
+        self.client = get_client(endpoint or ENDPOINT, token)
+        self.model = model
+        self.name = name or f"azure:{model}"
+
+    def complete(self, messages, cancel = None, **params):
+        if cancel is None:
+            response = self.client.complete(messages = messages, model = self.model, **params)
+            return response.choices[0].message.content
+        parts = []
+        with self.client.complete(messages = messages, model = self.model, stream = True, **params) as response:
+            for update in response:
+                if cancel.is_set():
+                    raise Cancelled(self.name)
+                if update.choices and update.choices[0].delta.content:
+                    parts.append(update.choices[0].delta.content)
+        return "".join(parts)
+
+class OpenAIResponsesProvider:
+    def __init__(self, model = "gpt-5", base_url = None, api_key = None, name = None):
+        from openai import OpenAI
+        self.client = OpenAI(base_url = base_url, api_key = api_key)
+        self.model = model
+        self.name = name or f"openai:{model}"
+
+    def complete(self, messages, max_tokens = None, cancel = None, **params):
+        if cancel is None:
+            response = self.client.responses.create(model = self.model, input = messages, max_output_tokens = max_tokens, **params)
+            return response.output_text
+        parts = []
+        with self.client.responses.create(model = self.model, input = messages, max_output_tokens = max_tokens, stream = True, **params) as events:
+            for event in events:
+                if cancel.is_set():
+                    raise Cancelled(self.name)
+                if event.type == "response.output_text.delta":
+                    parts.append(event.delta)
+        return "".join(parts)
+
+class LocalChatProvider:
+    def __init__(self, url, name = None, timeout = 120):
+        self.url = url.rstrip("/") + "/v1/chat/completions"
+        self.name = name or f"local:{url}"
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def complete(self, messages, cancel = None, **params):
+        # A cancellable request streams, so that it can stop between chunks.
+        body = {"messages": messages, **params, **({"stream": True} if cancel is not None else {})}
+        response = self.session.post(self.url, json = body, timeout = self.timeout, stream = True)
+        if not response.ok:
+            response.content  # drain, so the connection goes back to the pool
+            response.raise_for_status()
+        if not response.headers.get("Content-Type", "").startswith("text/event-stream"):
+            return response.json()["choices"][0]["message"]["content"]
+        # Older gradio_chat.py versions answer with server-sent chunks even when stream is false.
+        parts = []
+        with response:
+            for line in response.iter_lines(decode_unicode = True):
+                if cancel is not None and cancel.is_set():
+                    # Closing the connection is what tells the server to stop generating.
+                    raise Cancelled(self.name)
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                for choice in json.loads(data).get("choices", []):
+                    parts.append(choice.get("delta", {}).get("content") or "")
+        return "".join(parts)
+
+class Backend:
+    def __init__(self, provider):
+        self.provider = provider
+        self.latency = None  # EWMA seconds, None until the first success
+        self.error_rate = 0.0  # EWMA of failures, 0-1
+        self.failed_at = 0.0
+
+class Router:
+    def __init__(self, providers, alpha = 0.2, max_error_rate = 0.5, cooldown = 30.0, hedge_after = None):
+        self.backends = [Backend(p) for p in providers]
+        self.alpha = alpha
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+        self.hedge_after = hedge_after
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers = 4 * len(self.backends)) if hedge_after is not None else None
+
+    def ranked(self):
+        """Healthy backends by EWMA latency (untried first), then unhealthy ones by error rate."""
+        now = time.monotonic()
+        with self._lock:
+            healthy = [b for b in self.backends if b.error_rate < self.max_error_rate or now - b.failed_at > self.cooldown]
+            unhealthy = [b for b in self.backends if b not in healthy]
+            healthy.sort(key = lambda b: b.latency or 0.0)
+            unhealthy.sort(key = lambda b: b.error_rate)
+        return healthy + unhealthy
+
+    def _call(self, backend, messages, params, cancel = None):
+        started = time.perf_counter()
+        try:
+            content = backend.provider.complete(messages, **params) if cancel is None else \
+                backend.provider.complete(messages, cancel = cancel, **params)
+        except Cancelled:
+            raise  # lost a hedge race, which says nothing about the backend's health
+        except Exception:
+            with self._lock:
+                backend.error_rate += self.alpha * (1 - backend.error_rate)
+                backend.failed_at = time.monotonic()
+            raise
+        latency = time.perf_counter() - started
+        with self._lock:
+            backend.error_rate -= self.alpha * backend.error_rate
+            backend.latency = latency if backend.latency is None else backend.latency + self.alpha * (latency - backend.latency)
+        return content
+
+    def complete(self, messages, **params):
+        """Return (answer, provider name) from the first backend that succeeds."""
+        order = self.ranked()
+        if self._executor is not None:
+            return self._hedged(order, messages, params)
+        error = None
+        for backend in order:
+            try:
+                return self._call(backend, messages, params), backend.provider.name
+            except Exception as e:
+                error = e
+        raise error
+
+    def _hedged(self, order, messages, params):
+        remaining = list(order)
+        pending = {}
+        cancel = threading.Event()
+        error = None
+        try:
+            while remaining or pending:
+                if remaining:
+                    backend = remaining.pop(0)
+                    pending[self._executor.submit(self._call, backend, messages, params, cancel)] = backend
+                # Wait hedge_after seconds before also asking the next backend; a failure moves on at once.
+                done, _ = wait(pending, timeout = self.hedge_after if remaining else None, return_when = FIRST_COMPLETED)
+                for future in done:
+                    backend = pending.pop(future)
+                    if future.exception() is None:
+                        return future.result(), backend.provider.name
+                    error = future.exception()
+            raise error
+        finally:
+            # The first answer won: the requests still running stop at their next chunk.
+            cancel.set()
+            for future in pending:
+                future.cancel()
+
+    def stats(self):
+        with self._lock:
+            return {b.provider.name: {"latency": b.latency, "error_rate": round(b.error_rate, 3)} for b in self.backends}
+
+def default_router(hedge_after = None):
+    """A router over every backend configured in the environment:
+    GITHUB_TOKEN (GitHub Models), OPENAI_API_KEY (OpenAI) and LOCAL_CHAT_URL (e.g. http://127.0.0.1:7860)."""
+    providers = []
+    if os.environ.get("GITHUB_TOKEN"):
+        providers.append(AzureInferenceProvider())
+    if os.environ.get("OPENAI_API_KEY"):
+        providers.append(OpenAIResponsesProvider())
+    if os.environ.get("LOCAL_CHAT_URL"):
+        providers.append(LocalChatProvider(os.environ["LOCAL_CHAT_URL"]))
+    if not providers:
+        raise RuntimeError("No backend configured: set GITHUB_TOKEN, OPENAI_API_KEY or LOCAL_CHAT_URL")
+    return Router(providers, hedge_after = hedge_after)
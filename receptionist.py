@@ -0,0 +1,155 @@
+"""Receptionist for the Telegram group, served to many users at once
+
+> pip install openai
+
+`3.py` replays the whole few-shot conversation, encrypted reasoning items
+included, on every request. `Receptionist` sends it only on a user's first turn.
+Later turns send just the new message and chain onto the stored response with
+`previous_response_id` (the requests use `store=True`). If a stored response is
+no longer available, it falls back to replaying the few-shot plus a trimmed
+local history.
+
+It runs on `AsyncOpenAI` and keeps one lock per user, so turns of different
+users run concurrently while each user's turns stay in order. Function calls in
+a response are executed concurrently by `tool_calls.ToolExecutor` and answered in
+one follow-up request.
+"""
+import asyncio
+import json
+
+import openai
+
+from prompts import registry
+from tool_calls import ToolExecutor
+
+MODEL = "gpt-5"
+FEW_SHOT = "receptionist.fewshot.json"
+MAX_TOOL_ROUNDS = 3
+
+TOOLS = [
+    {
+        "type": "function",
+        "name": "get_stock_price",
+        "description": "Get the current stock price",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "symbol": {
+                    "type": "string",
+                    "description": "The stock symbol"
+                }
+            },
+            "additionalProperties": False,
+            "required": [
+                "symbol"
+            ]
+        },
+        "strict": True
+    },
+    {
+        "type": "function",
+        "name": "get_weather",
+        "description": "Determine weather in my location",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "location": {
+                    "type": "string",
+                    "description": "The city and state e.g. San Francisco, CA"
+                },
+                "unit": {
+                    "type": "string",
+                    "enum": [
+                        "c",
+                        "f"
+                    ]
+                }
+            },
+            "additionalProperties": False,
+            "required": [
+                "location",
+                "unit"
+            ]
+        },
+        "strict": True
+    },
+    {
+        "type": "web_search_preview",
+        "user_location": {
+            "type": "approximate",
+            "country": "BR",
+            "region": "DF",
+            "city": "Brasilia"
+        },
+        "search_context_size": "medium"
+    }
+]
+
+OPTIONS = {
+    "text": {"format": {"type": "text"}, "verbosity": "medium"},
+    "reasoning": {"effort": "medium"},
+    "tools": TOOLS,
+    "store": True,
+}
+
+def user_turn(text):
+    return {"role": "user", "content": [{"type": "input_text", "text": text}]}
+
+class Conversation:
+    def __init__(self):
+        self.previous_response_id = None
+        self.history = []  # recent user/assistant messages for the replay fallback
+        self.lock = asyncio.Lock()
+
+class Receptionist:
+    def __init__(self, client = None, chain = True, max_turns = 10, tools = None):
+        self.client = client or openai.AsyncOpenAI()
+        self.tools = tools or ToolExecutor()
+        self.chain = chain
+        self.max_turns = max_turns
+        self.conversations = {}
+        # One entry per request: how it was sent, how much input it carried and what was billed.
+        self.turns = []
+
+    async def reply(self, user_id, text):
+        """Answer `text` from `user_id` and return the response."""
+        conversation = self.conversations.setdefault(user_id, Conversation())
+        async with conversation.lock:
+            turn = user_turn(text)
+            response = None
+            if self.chain and conversation.previous_response_id:
+                try:
+                    response = await self._create(user_id, "chained", [turn], previous_response_id = conversation.previous_response_id)
+                except (openai.NotFoundError, openai.BadRequestError):
+                    # The stored response expired or was deleted; rebuild the context locally.
+                    conversation.previous_response_id = None
+            if response is None:
+                response = await self._create(user_id, "replay", registry.messages(FEW_SHOT, *conversation.history, turn))
+            response = await self._run_tools(user_id, response)
+
+            conversation.previous_response_id = response.id
+            conversation.history += [turn, {"role": "assistant", "content": response.output_text}]
+            del conversation.history[:-2 * self.max_turns]
+            return response
+
+    async def _run_tools(self, user_id, response):
+        for _ in range(MAX_TOOL_ROUNDS):
+            calls = [item for item in response.output if item.type == "function_call"]
+            if not calls:
+                break
+            outputs = await self.tools.run(calls)
+            response = await self._create(user_id, "tools", outputs, previous_response_id = response.id)
+        return response
+
+    async def _create(self, user_id, mode, items, **kwargs):
+        response = await self.client.responses.create(model = MODEL, input = items, **OPTIONS, **kwargs)
+        usage = response.usage
+        self.turns.append({
+            "user": user_id,
+            "mode": mode,
+            "items": len(items),
+            "bytes": len(json.dumps(items, ensure_ascii = False).encode("utf-8")),
+            "input_tokens": usage.input_tokens if usage else None,
+            "cached_tokens": usage.input_tokens_details.cached_tokens if usage and usage.input_tokens_details else None,
+        })
+        return response
@@ -0,0 +1,165 @@
+"""Near-duplicate cache for chat() inputs
+
+> pip install numpy
+
+Topics that differ only in wording ("french revolution" vs "the French
+Revolution") miss the exact-match cache in cache.py. `SemanticCache` embeds every
+input, keeps the vectors in one NumPy matrix and serves a cached answer when the
+cosine similarity of the nearest past input reaches `threshold` and both inputs
+contain the same numbers. Each entry keeps a small pool of answers so repeated
+topics still get some variety. At most `capacity` entries are kept; the least
+recently used one is overwritten when a new one is added to a full cache.
+
+Character n-grams score topics that differ in one short word highly: "World War
+1" vs "World War 2" is 0.80 and "the roman empire" vs "the ottoman empire" 0.73,
+hence the number check and the 0.85 default threshold. bench_semantic_cache.py
+measures the hit rate on reworded topics and the false hit rate on unrelated
+ones at a given threshold.
+
+The default embedding is a hashed character n-gram vectorizer, which needs no
+model download. Any callable mapping a list of texts to an (n, dim) array, such
+as a sentence-transformers model's `encode`, can be passed as `embed` instead.
+"""
+import random
+import re
+import threading
+import zlib
+
+import numpy as np
+
+class HashedNgramVectorizer:
+    """Bag of character n-grams and words, hashed into `dim` buckets and L2-normalized."""
+
+    def __init__(self, dim = 512, ngrams = (3, 4)):
+        self.dim = dim
+        self.ngrams = ngrams
+
+    @staticmethod
+    def normalize(text):
+        text = re.sub(r"['’]", "", text.lower())
+        return " ".join(re.findall(r"\w+", text))
+
+    def features(self, text):
+        text = self.normalize(text)
+        padded = f" {text} "
+        for n in self.ngrams:
+            for i in range(len(padded) - n + 1):
+                yield padded[i:i + n]
+        for word in text.split():
+            yield "w:" + word
+
+    def __call__(self, texts):
+        matrix = np.zeros((len(texts), self.dim), dtype = np.float32)
+        for row, text in enumerate(texts):
+            for feature in self.features(text):
+                h = zlib.crc32(feature.encode("utf-8"))
+                # The top bit picks the sign, so collisions tend to cancel out.
+                matrix[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norms = np.linalg.norm(matrix, axis = 1, keepdims = True)
+        return matrix / np.maximum(norms, 1e-12)
+
+def numbers(text):
+    """The numbers in a text, which two inputs must share to match ("World War 1" is not "World War 2")."""
+    return tuple(sorted(re.findall(r"\d+", text)))
+
+class SemanticCache:
+    # Nearest rows checked for one with the same numbers, before giving up
+    CANDIDATES = 8
+
+    def __init__(self, threshold = 0.85, embed = None, max_variants = 5, capacity = 1024):
+        self.threshold = threshold
+        self.embed = embed or HashedNgramVectorizer()
+        self.max_variants = max_variants
+        self.capacity = capacity
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+        self._matrix = None
+        self._size = 0
+        # Per matrix row: the input, its numbers, its answers and when it was last added or served
+        self._texts = []
+        self._numbers = []
+        self._answers = []
+        self._used = np.zeros(capacity, dtype = np.int64)
+        self._clock = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def _vector(self, text):
+        vector = np.asarray(self.embed([text]), dtype = np.float32)[0]
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _nearest(self, vector, key):
+        """The closest row with the same numbers as the input, and its similarity; -1 if there is none."""
+        if self._size == 0:
+            return -1, 0.0
+        scores = self._matrix[:self._size] @ vector
+        k = min(self.CANDIDATES, self._size)
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        for index in candidates[np.argsort(-scores[candidates])]:
+            if self._numbers[index] == key:
+                return int(index), float(scores[index])
+        return -1, float(scores[candidates].max())
+
+    def _touch(self, index):
+        self._clock += 1
+        self._used[index] = self._clock
+
+    def lookup(self, text):
+        """Return (answer, similarity) for the closest past input, or (None, similarity) below the threshold."""
+        vector = self._vector(text)
+        with self._lock:
+            index, score = self._nearest(vector, numbers(text))
+            if index >= 0 and score >= self.threshold:
+                self.counters["hits"] += 1
+                self._touch(index)
+                return random.choice(self._answers[index]), score
+            self.counters["misses"] += 1
+            return None, score
+
+    def add(self, text, answer):
+        """Store an answer, as a new variant of a near-duplicate entry if there is one."""
+        vector = self._vector(text)
+        with self._lock:
+            index, score = self._nearest(vector, numbers(text))
+            if index >= 0 and score >= self.threshold:
+                self._touch(index)
+                if len(self._answers[index]) < self.max_variants:
+                    self._answers[index].append(answer)
+                return
+            self._append(vector, text, answer)
+
+    def add_many(self, texts, answers):
+        """Bulk-load entries, e.g. a previous run's output, in one embedding call and without merging near-duplicates."""
+        vectors = np.asarray(self.embed(list(texts)), dtype = np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis = 1, keepdims = True), 1e-12)
+        with self._lock:
+            for text, answer, vector in zip(texts, answers, vectors):
+                self._append(vector, text, answer)
+
+    def _append(self, vector, text, answer):
+        if self._matrix is None:
+            self._matrix = np.zeros((self.capacity, vector.shape[0]), dtype = np.float32)
+        if self._size < self.capacity:
+            index = self._size
+            self._size += 1
+            self._texts.append(None)
+            self._numbers.append(None)
+            self._answers.append(None)
+        else:
+            # Full: the least recently used row is overwritten, so it can no longer be matched
+            index = int(np.argmin(self._used))
+            self.counters["evictions"] += 1
+        self._matrix[index] = vector
+        self._texts[index] = text
+        self._numbers[index] = numbers(text)
+        self._answers[index] = [answer]
+        self._touch(index)
+
+    def nbytes(self):
+        """Bytes held by the vector matrix."""
+        return 0 if self._matrix is None else self._matrix.nbytes
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, entries = self._size)
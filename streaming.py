@@ -0,0 +1,77 @@
+"""Print streamed chat completions as they arrive
+
+`print_stream()` writes each delta to stdout as soon as it is received and
+returns the per-turn timings, so streaming and non-streaming runs can be
+compared with `print_complete()`, the non-streaming path used by the
+`--no-stream` flag of `final_app.py`. Token counts and latency of every turn are
+also reported to `usage.tracker`.
+"""
+import sys
+import time
+
+from usage import tracker
+
+# Timings of every turn in this process, oldest first.
+turn_stats = []
+
+def print_stream(response, started):
+    """Print the deltas of a `complete(stream = True)` response.
+
+    `started` is the `time.perf_counter()` value taken just before the request
+    was sent. Returns a dict with the answer text, the time to first token
+    (seconds), the number of completion tokens and the decode rate in tokens/sec.
+    """
+    first_token = None
+    parts = []
+    tokens = 0
+    usage = None
+    for update in response:
+        if getattr(update, "usage", None):
+            usage = update.usage
+        if not update.choices:
+            continue
+        content = update.choices[0].delta.content
+        if not content:
+            continue
+        if first_token is None:
+            first_token = time.perf_counter()
+        tokens += 1
+        parts.append(content)
+        print(content, end = "", flush = True)
+    finished = time.perf_counter()
+    print()
+
+    # Without usage in the stream each content delta is counted as one token.
+    if usage is not None and usage.completion_tokens:
+        tokens = usage.completion_tokens
+    stats = {
+        "content": "".join(parts),
+        "prompt_tokens": usage.prompt_tokens if usage is not None else None,
+        "latency": finished - started,
+        "ttft": (first_token or finished) - started,
+        "tokens": tokens,
+        "tokens_per_sec": tokens / (finished - first_token) if first_token and finished > first_token else 0.0,
+    }
+    return _record(stats)
+
+def print_complete(response, started):
+    """Print a non-streamed response. The first token only shows up with the last one."""
+    finished = time.perf_counter()
+    content = response.choices[0].message.content
+    print(content)
+    usage = response.usage
+    tokens = usage.completion_tokens if usage else 0
+    return _record({
+        "content": content,
+        "prompt_tokens": usage.prompt_tokens if usage else None,
+        "latency": finished - started,
+        "ttft": finished - started,
+        "tokens": tokens,
+        "tokens_per_sec": tokens / (finished - started),
+    })
+
+def _record(stats):
+    turn_stats.append({k: v for k, v in stats.items() if k != "content"})
+    tracker.record(stats["prompt_tokens"], stats["tokens"], stats["latency"])
+    print(f"[time to first token {stats['ttft']:.2f} s, {stats['tokens']} tokens, {stats['tokens_per_sec']:.1f} tokens/s]", file = sys.stderr)
+    return stats
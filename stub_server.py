@@ -0,0 +1,139 @@
+"""Local stand-in for the GitHub Models chat completions endpoint
+
+Used by the benchmarks so they can run without a GITHUB_TOKEN or network access.
+It answers every POST with the same canned completion after an optional delay,
+either as one JSON body or, for `"stream": true` requests, as server-sent events
+with one word per chunk. Paths ending in `/responses` get an OpenAI Responses API
+body instead, and `error_rate` makes a share of requests fail with 503.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = "- **Topic**: Astronomy\n- **Question**: What is the largest planet in the Solar System?\n- **Answer**: Jupiter"
+
+def completion(content = ANSWER, model = "gpt-4o"):
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {"prompt_tokens": 1, "completion_tokens": len(content.split()), "total_tokens": 1 + len(content.split())},
+    }
+
+def response(content = ANSWER, model = "gpt-5", previous_response_id = None, input_tokens = 1):
+    words = len(content.split())
+    return {
+        "id": f"resp_stub_{random.getrandbits(32):08x}",
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": model,
+        "status": "completed",
+        "previous_response_id": previous_response_id,
+        "output": [
+            {
+                "type": "message",
+                "id": "msg_stub",
+                "role": "assistant",
+                "status": "completed",
+                "content": [{"type": "output_text", "text": content, "annotations": []}],
+            }
+        ],
+        "usage": {"input_tokens": input_tokens, "output_tokens": words, "total_tokens": input_tokens + words},
+    }
+
+def chunk(content, model = "gpt-4o", finish_reason = None):
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "delta": {"role": "assistant", "content": content},
+                "finish_reason": finish_reason,
+            }
+        ],
+    }
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so pooled clients can reuse sockets
+    disable_nagle_algorithm = True
+    delay = 0.0
+    token_delay = 0.0
+    error_rate = 0.0
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        self.server.requests.append(body)
+        time.sleep(self.delay)
+        if random.random() < self.error_rate:
+            self.send_json(503, {"error": {"code": "unavailable", "message": "stub error"}})
+        elif self.path.split("?")[0].endswith("/responses"):
+            # Roughly four bytes per token of the input actually sent; a stub keeps no stored context.
+            input_tokens = len(json.dumps(body.get("input"), ensure_ascii = False)) // 4
+            self.send_json(200, response(previous_response_id = body.get("previous_response_id"), input_tokens = input_tokens))
+        elif body.get("stream"):
+            self.send_stream(ANSWER.split(" "), (body.get("stream_options") or {}).get("include_usage"))
+        else:
+            time.sleep(self.token_delay * len(ANSWER.split(" ")))
+            self.send_json(200, completion())
+
+    def send_stream(self, words, include_usage = False):
+        # Chunked transfer encoding, like real servers, so clients see every event as it is sent.
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, word in enumerate(words):
+            time.sleep(self.token_delay)
+            self.send_event(chunk(word if i == 0 else " " + word))
+        self.send_event(chunk("", finish_reason = "stop"))
+        if include_usage:
+            self.send_event(dict(chunk(""), choices = [], usage = completion()["usage"]))
+        self.send_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def send_event(self, data):
+        event = f"data: {data if isinstance(data, str) else json.dumps(data)}\n\n".encode()
+        self.wfile.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+        self.wfile.flush()
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # clients dropping keep-alive connections are expected here
+
+def serve(handler = StubHandler, delay = 0.0, token_delay = 0.0, error_rate = 0.0, port = 0):
+    """Start the stub on a background thread and return (server, endpoint).
+
+    `delay` is added before the first byte, `token_delay` per generated word.
+    """
+    handler = type(handler.__name__, (handler,), {"delay": delay, "token_delay": token_delay, "error_rate": error_rate})
+    server = StubServer(("127.0.0.1", port), handler)
+    server.requests = []
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
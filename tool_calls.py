@@ -0,0 +1,78 @@
+"""Run the receptionist's function tools concurrently
+
+When a response asks for several function calls in one turn, `ToolExecutor`
+runs them together on the event loop, each with its own timeout. Results are
+cached for a short TTL, since weather and stock quotes do not change from one
+second to the next. All outputs go back to the model in a single follow-up
+request (see `Receptionist.reply`).
+
+`web_search_preview` is a hosted tool: OpenAI runs it, so it never shows up here.
+The two function tools below are stand-ins with fixed data and simulated latency;
+swap in real API calls by registering other coroutines under the same names.
+"""
+import asyncio
+import json
+import time
+
+async def get_stock_price(symbol, latency = 0.3):
+    await asyncio.sleep(latency)
+    return {"symbol": symbol.upper(), "price": 100.0 + sum(map(ord, symbol.upper())) % 50, "currency": "USD"}
+
+async def get_weather(location, unit, latency = 0.5):
+    await asyncio.sleep(latency)
+    celsius = 20 + sum(map(ord, location)) % 15
+    return {"location": location, "temperature": celsius if unit == "c" else round(celsius * 9 / 5 + 32), "unit": unit}
+
+class Tool:
+    def __init__(self, fn, timeout = 10.0, ttl = 60.0):
+        self.fn = fn
+        self.timeout = timeout
+        self.ttl = ttl
+
+DEFAULT_TOOLS = {
+    "get_stock_price": Tool(get_stock_price, timeout = 5.0, ttl = 30.0),
+    "get_weather": Tool(get_weather, timeout = 5.0, ttl = 300.0),
+}
+
+class ToolExecutor:
+    def __init__(self, tools = None):
+        self.tools = DEFAULT_TOOLS if tools is None else tools
+        self._cache = {}  # (name, canonical arguments) -> (expires_at, output)
+        self.counters = {"calls": 0, "cache_hits": 0, "timeouts": 0, "errors": 0}
+
+    async def call(self, name, arguments):
+        """Run one tool call and return its output as a JSON string; failures become an error object."""
+        self.counters["calls"] += 1
+        tool = self.tools.get(name)
+        if tool is None:
+            self.counters["errors"] += 1
+            return json.dumps({"error": f"unknown tool {name}"})
+        try:
+            # Malformed or truncated arguments from the model fail this call only, not the whole reply.
+            args = json.loads(arguments) if isinstance(arguments, str) else arguments
+            key = (name, json.dumps(args, sort_keys = True))
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] > time.monotonic():
+                self.counters["cache_hits"] += 1
+                return cached[1]
+            result = await asyncio.wait_for(tool.fn(**args), tool.timeout)
+        except asyncio.TimeoutError:
+            self.counters["timeouts"] += 1
+            return json.dumps({"error": f"{name} timed out after {tool.timeout} s"})
+        except json.JSONDecodeError as e:
+            self.counters["errors"] += 1
+            return json.dumps({"error": f"invalid JSON arguments for {name}: {e}"})
+        except Exception as e:
+            self.counters["errors"] += 1
+            return json.dumps({"error": str(e)})
+        output = json.dumps(result, ensure_ascii = False)
+        self._cache[key] = (time.monotonic() + tool.ttl, output)
+        return output
+
+    async def run(self, calls, parallel = True):
+        """Execute `function_call` output items and return the matching `function_call_output` items."""
+        if parallel:
+            outputs = await asyncio.gather(*(self.call(c.name, c.arguments) for c in calls))
+        else:
+            outputs = [await self.call(c.name, c.arguments) for c in calls]
+        return [{"type": "function_call_output", "call_id": c.call_id, "output": o} for c, o in zip(calls, outputs)]
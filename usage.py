@@ -0,0 +1,82 @@
+"""Token and latency accounting for chat()
+
+Every completed turn reports the `usage` block of the response (prompt and
+completion tokens) and its latency to `tracker`. The tracker keeps fixed-bucket
+histograms and, when `USAGE_SUMMARY=1` is set in the environment or
+`tracker.report` is turned on (final_app.py --usage-summary), prints a summary
+when the process exits, so it is easy to see how much of the bill is the prompt
+that is resent with every request.
+"""
+import atexit
+import bisect
+import os
+import sys
+import threading
+
+TOKEN_BUCKETS = [64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384]
+LATENCY_BUCKETS = [0.25, 0.5, 1, 2, 4, 8, 16, 32, 64]
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile."""
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= q * self.total:
+                return self.bounds[i] if i < len(self.bounds) else float("inf")
+        return float("inf")
+
+    def format(self, name, unit):
+        lines = [f"{name}: n={self.total} mean={self.sum / self.total:.1f}{unit} p50<={self.quantile(0.5)}{unit} p95<={self.quantile(0.95)}{unit}"]
+        peak = max(self.counts)
+        for i, count in enumerate(self.counts):
+            if count:
+                label = f"<= {self.bounds[i]}" if i < len(self.bounds) else f"> {self.bounds[-1]}"
+                lines.append(f"  {label:>8}{unit} {'#' * max(1, count * 40 // peak)} {count}")
+        return "\n".join(lines)
+
+class UsageTracker:
+    def __init__(self):
+        self.prompt_tokens = Histogram(TOKEN_BUCKETS)
+        self.completion_tokens = Histogram(TOKEN_BUCKETS)
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.report = os.environ.get("USAGE_SUMMARY", "") not in ("", "0")
+        self._lock = threading.Lock()
+
+    def record(self, prompt_tokens, completion_tokens, latency):
+        with self._lock:
+            if prompt_tokens is not None:
+                self.prompt_tokens.observe(prompt_tokens)
+            if completion_tokens is not None:
+                self.completion_tokens.observe(completion_tokens)
+            self.latency.observe(latency)
+
+    def summary(self):
+        with self._lock:
+            parts = [self.latency.format("latency", "s")]
+            if self.prompt_tokens.total:
+                parts.append(self.prompt_tokens.format("prompt tokens", ""))
+            if self.completion_tokens.total:
+                parts.append(self.completion_tokens.format("completion tokens", ""))
+            prompt, completion = self.prompt_tokens.sum, self.completion_tokens.sum
+            if prompt + completion:
+                parts.append(f"prompt share of all tokens: {prompt / (prompt + completion):.0%}")
+            return "\n".join(parts)
+
+tracker = UsageTracker()
+
+@atexit.register
+def _dump():
+    if tracker.report and tracker.latency.total:
+        print("\nUsage summary\n" + tracker.summary(), file = sys.stderr)